@@ -0,0 +1,53 @@
+"""
+書き込みAPIの認証（APIキー）
+
+- ローカル: WRITE_API_KEY に指定したキー
+- Lambda: WRITE_API_KEY_SECRET_ARN のシークレット（{"api_key": "..."}）を初回の書き込み時に遅延取得する
+  （DB認証情報と同じく SecretProvider でTTL付きキャッシュ、Extensionがあればローカルエンドポイント経由）
+
+キーが設定されていない場合、書き込みAPIは常に503を返す（読み取りAPIには影響しない）。
+"""
+from typing import Optional
+import hmac
+import os
+
+from fastapi import HTTPException, Security
+from fastapi.security import APIKeyHeader
+
+from .credentials import SecretProvider
+
+WRITE_API_KEY = os.getenv("WRITE_API_KEY") or None
+WRITE_API_KEY_SECRET_ARN = os.getenv("WRITE_API_KEY_SECRET_ARN") or None
+
+_secret_provider: Optional[SecretProvider] = None
+if not WRITE_API_KEY and WRITE_API_KEY_SECRET_ARN:
+    _secret_provider = SecretProvider(
+        WRITE_API_KEY_SECRET_ARN,
+        ttl=float(os.getenv("WRITE_API_KEY_TTL_SECONDS", "300")),
+        extension_endpoint=os.getenv("SECRETS_EXTENSION_ENDPOINT") or None,
+    )
+
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+
+
+def _expected_api_key() -> Optional[str]:
+    if WRITE_API_KEY:
+        return WRITE_API_KEY
+    if _secret_provider is not None:
+        return _secret_provider.get().get("api_key") or None
+    return None
+
+
+def require_write_api_key(api_key: Optional[str] = Security(api_key_header)) -> None:
+    """
+    書き込みAPIの依存関係（X-API-Key ヘッダを検証する）
+
+    Args:
+        api_key: X-API-Key ヘッダの値
+    """
+    expected = _expected_api_key()
+    if expected is None:
+        raise HTTPException(status_code=503, detail="Write API is not configured")
+    # 比較にかかる時間からキーを推測されないよう定数時間で比較する
+    if api_key is None or not hmac.compare_digest(api_key.encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing API key")
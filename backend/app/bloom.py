@@ -0,0 +1,721 @@
+"""
+登録済みJANコードのブルームフィルタ
+
+jan_url_mapping の全 gtin からコンパクトなビット配列を作ってファイルに書き出し、読み込み側は mmap して
+「登録されていない」ことが確実なJANコードをキャッシュミスの後、共有キャッシュ・DBへ問い合わせる前に404にする
+（スキャナの誤読・未登録商品の問い合わせでDBへ行かない）。
+偽陽性（未登録なのに「あるかもしれない」）はDBへフォールバックするだけだが、偽陰性（登録済みなのに「無い」）は
+誤った404になるため、ファイルの作成後に追加された行を取りこぼさないよう次のように追従する。
+
+- created_at は行を追加した時刻（clock_timestamp()、db/migrations/0007_created_at_clock_timestamp.sql）で、
+  スナップショットの取得時に実行中でなかったトランザクションがその後に追加する行の created_at はその時刻以降になる
+- ファイルには作成時のウォーターマーク（作成のスナップショットの時刻から余裕を引いた時刻）を記録する。
+  作成中に実行中だったトランザクションがあれば、それらが終わるのを待ってから全件をもう一度読んで追加する
+- 読み込んだプロセスは created_at がウォーターマーク以降の行をDBから読んで追加する（キャッチアップ、
+  created_at の BRIN インデックスを使う、db/migrations/0005_created_at_brin.sql）。
+  次のウォーターマークは、各キャッチアップのスナップショットの時刻とその時点の次のトランザクションID（horizon）を候補として残し、
+  スナップショットの xmin（実行中の最も古いトランザクションID）が horizon に達した、
+  つまり候補の時点で実行中だったトランザクションがすべて終わった最新の候補の時刻に進める
+  （pg_stat_activity は pg_read_all_stats が無いと他のロールのトランザクションが見えないため使わない）
+- キャッチアップから BLOOM_FILTER_CATCHUP_SECONDS を過ぎたフィルタは参照せず（DBで確認する）、バックグラウンドでキャッチアップし直す。
+  他のプロセスで追加された行が404になりうるのは最長でこの秒数の間（ネガティブキャッシュのTTLと同じ考え方）
+- このプロセスで書き込んだ・変更の通知を受けたJANコードはすぐに追加する。一括の変更の通知（'*'）を受けた場合は
+  キャッチアップが終わるまで参照しない
+- キャッチアップの件数が BLOOM_FILTER_MAX_CATCHUP_ROWS を超える場合（作り直していない大量の一括インポートの後など）は、
+  ファイルが作り直されるまで参照しない（ファイルが置き換えられていれば読み込み直す）
+
+削除された行はビットから消せないため偽陽性として残る（次の作り直しで消える）。
+プロセス内での追加は mmap の copy-on-write（ACCESS_COPY）で行い、ファイルは書き換えない。
+
+ファイル形式（リトルエンディアン）:
+    header : magic(8) / format_version(u32) / num_hashes(u32) / num_bits(u64) / count(u64) /
+             built_at(i64, UNIX秒) / watermark(i64, 1970-01-01からのマイクロ秒) / target_fpr(f64) /
+             0埋め（計 HEADER_SIZE バイト）
+    bits   : num_bits / 8 バイト（ビット i は bits[i >> 3] の (i & 7) ビット目）
+
+ハッシュは gtin（BIGINT）を splitmix64 で攪拌した64bitを上位・下位32bitに分け、
+double hashing（h1 + i * h2）で num_hashes 個の位置を求める。
+
+使い方:
+    python -m app.bloom build jan_codes.bloom
+    python -m app.bloom info jan_codes.bloom
+    python -m app.bloom check jan_codes.bloom 4571657070839
+"""
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import argparse
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"BZBLOOM\x00"
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct("<8sIIQQqqd")
+HEADER_SIZE = 64
+
+EPOCH = datetime(1970, 1, 1)
+MASK64 = (1 << 64) - 1
+# double hashing の位置は32bitのため、ビット数の上限は 2^32（512MiB）
+MAX_BITS = 1 << 32
+
+# Lambdaレイヤーは /opt に展開される（スナップショットと同じレイヤーに含める）
+BLOOM_FILTER_PATH = os.getenv("BLOOM_FILTER_PATH", "/opt/snapshot/jan_codes.bloom")
+# 作成時の目標の偽陽性率と、作成後の追加に備えて行数に上乗せする容量の割合
+BLOOM_FILTER_FPR = float(os.getenv("BLOOM_FILTER_FPR", "0.01"))
+BLOOM_FILTER_HEADROOM = float(os.getenv("BLOOM_FILTER_HEADROOM", "0.2"))
+# キャッチアップの間隔（この秒数を過ぎたフィルタは参照しない、半分を過ぎたらバックグラウンドでキャッチアップする）
+BLOOM_FILTER_CATCHUP_SECONDS = float(os.getenv("BLOOM_FILTER_CATCHUP_SECONDS", "30"))
+# ウォーターマークから引く余裕（created_at の評価とトランザクションIDの割り当ての間の競合・時計のずれに備える）
+BLOOM_FILTER_CATCHUP_MARGIN_SECONDS = float(os.getenv("BLOOM_FILTER_CATCHUP_MARGIN_SECONDS", "300"))
+# 1回のキャッチアップで読む行数の上限（超えた場合はファイルが作り直されるまでフィルタを参照しない）
+BLOOM_FILTER_MAX_CATCHUP_ROWS = int(os.getenv("BLOOM_FILTER_MAX_CATCHUP_ROWS", "1000000"))
+# 実行中のトランザクションの終了を待っているウォーターマークの候補の上限
+MAX_WATERMARK_CANDIDATES = 64
+
+# ウォーターマークの候補: スナップショットの時刻（トランザクションの開始時刻、スナップショットの取得より前）から余裕を引いた時刻、
+# スナップショットの xmin（実行中の最も古いトランザクションID、ロールに関係なく見える）と
+# 次に割り当てられるトランザクションID（horizon、IDを持たないトランザクションの age() は次のIDとの差）
+WATERMARK_QUERY = text(
+    """
+    SELECT localtimestamp - make_interval(secs => :margin),
+           snapshot.xmin::text::bigint,
+           snapshot.xmin::text::bigint + age(snapshot.xmin::xid)
+    FROM (SELECT pg_snapshot_xmin(pg_current_snapshot()) AS xmin) AS snapshot
+    """
+)
+XMIN_QUERY = text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+COUNT_QUERY = text("SELECT count(*) FROM jan_url_mapping")
+GTIN_QUERY = text("SELECT gtin FROM jan_url_mapping")
+CREATED_SINCE_QUERY = text(
+    """
+    SELECT gtin FROM jan_url_mapping
+    WHERE created_at >= :since
+    LIMIT :limit
+    """
+)
+
+
+def _hash(key: int) -> int:
+    """gtin を64bitに攪拌する（splitmix64）"""
+    z = (key + 0x9E3779B97F4A7C15) & MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+def _to_key(jan_code: str) -> Optional[int]:
+    """正規化済みのJANコードを gtin の値に変換する（数字以外を含む場合はNone）"""
+    if not jan_code or not jan_code.isascii() or not jan_code.isdigit():
+        return None
+    return int(jan_code)
+
+
+def _to_micros(value: datetime) -> int:
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def optimal_parameters(capacity: int, fpr: float) -> Tuple[int, int]:
+    """
+    要素数と目標の偽陽性率からビット数・ハッシュ数を求める
+
+    Returns:
+        Tuple[int, int]: (ビット数（64の倍数）, ハッシュ数)
+    """
+    if not 0 < fpr < 1:
+        raise ValueError(f"fpr must be between 0 and 1: {fpr}")
+    capacity = max(1, capacity)
+    num_bits = math.ceil(-capacity * math.log(fpr) / (math.log(2) ** 2))
+    num_bits = max(64, (num_bits + 63) // 64 * 64)
+    if num_bits > MAX_BITS:
+        raise ValueError(f"Bloom filter would need {num_bits} bits (max {MAX_BITS}); raise the fpr")
+    num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+    return num_bits, num_hashes
+
+
+class BloomFilter:
+    """
+    gtin のブルームフィルタ（ビット配列は bytearray または copy-on-write の mmap）
+
+    Args:
+        bits: 書き込み可能なビット配列
+        num_bits: ビット数
+        num_hashes: ハッシュ数
+        count: 追加した要素数
+        built_at: 作成日時
+        watermark: created_at がこの時刻以降の行はキャッチアップで追加する
+        target_fpr: 作成時の目標の偽陽性率
+    """
+
+    def __init__(
+        self,
+        bits,
+        num_bits: int,
+        num_hashes: int,
+        count: int = 0,
+        built_at: Optional[datetime] = None,
+        watermark: Optional[datetime] = None,
+        target_fpr: float = BLOOM_FILTER_FPR,
+    ) -> None:
+        self._bits = bits
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.count = count
+        self.built_at = built_at or datetime.now().replace(microsecond=0)
+        self.watermark = watermark or EPOCH
+        self.target_fpr = target_fpr
+        self.path: Optional[str] = None
+        self._file = None
+        self._mmap = None
+        # バイト単位の読み書き（|=）が他のスレッドの追加を上書きしないよう、追加は直列化する
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, capacity: int, fpr: float = BLOOM_FILTER_FPR, watermark: Optional[datetime] = None) -> "BloomFilter":
+        """空のフィルタを作る"""
+        num_bits, num_hashes = optimal_parameters(capacity, fpr)
+        return cls(bytearray(num_bits // 8), num_bits, num_hashes, watermark=watermark, target_fpr=fpr)
+
+    @classmethod
+    def open(cls, path: str) -> "BloomFilter":
+        """ファイルを copy-on-write で mmap して開く（追加はこのプロセスだけに反映され、ファイルは変わらない）"""
+        file = open(path, "rb")
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        except ValueError:
+            file.close()
+            raise ValueError(f"Bloom filter file is empty: {path}")
+
+        try:
+            if len(mapped) < HEADER_SIZE:
+                raise ValueError(f"Truncated bloom filter file: {path}")
+            magic, version, num_hashes, num_bits, count, built_at, watermark, target_fpr = HEADER.unpack_from(mapped, 0)
+            if magic != MAGIC:
+                raise ValueError(f"Not a bloom filter file: {path}")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"Unsupported bloom filter format version {version} (expected {FORMAT_VERSION})")
+            if len(mapped) != HEADER_SIZE + num_bits // 8:
+                raise ValueError(f"Truncated bloom filter file: {path}")
+        except ValueError:
+            mapped.close()
+            file.close()
+            raise
+
+        bloom = cls(
+            memoryview(mapped)[HEADER_SIZE:],
+            num_bits,
+            num_hashes,
+            count=count,
+            built_at=datetime.fromtimestamp(built_at),
+            watermark=EPOCH + timedelta(microseconds=watermark),
+            target_fpr=target_fpr,
+        )
+        bloom.path = path
+        bloom._file = file
+        bloom._mmap = mapped
+        return bloom
+
+    def _positions(self, key: int):
+        h = _hash(key)
+        h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        num_bits = self.num_bits
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % num_bits
+
+    def add(self, key: int) -> None:
+        """gtin を追加する"""
+        bits = self._bits
+        with self._lock:
+            for position in self._positions(key):
+                bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def add_all(self, keys: Iterable[int]) -> int:
+        """複数の gtin を追加する（追加した件数を返す）"""
+        bits = self._bits
+        added = 0
+        with self._lock:
+            for key in keys:
+                for position in self._positions(key):
+                    bits[position >> 3] |= 1 << (position & 7)
+                added += 1
+            self.count += added
+        return added
+
+    def might_contain(self, key: int) -> bool:
+        """gtin が追加されている可能性があるか（Falseなら確実に追加されていない）"""
+        bits = self._bits
+        for position in self._positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __contains__(self, jan_code: str) -> bool:
+        key = _to_key(jan_code)
+        return key is not None and self.might_contain(key)
+
+    @property
+    def size_bytes(self) -> int:
+        return self.num_bits // 8
+
+    def estimated_fpr(self) -> float:
+        """現在の要素数での偽陽性率の推定値"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def write(self, path: str) -> None:
+        """ファイルに書き出す（一時ファイルから置き換えるため、読み込み中のプロセスが壊れたファイルを見ることはない）"""
+        header = HEADER.pack(
+            MAGIC,
+            FORMAT_VERSION,
+            self.num_hashes,
+            self.num_bits,
+            self.count,
+            int(self.built_at.timestamp()),
+            _to_micros(self.watermark),
+            self.target_fpr,
+        )
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".bloom-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(header.ljust(HEADER_SIZE, b"\x00"))
+                out.write(self._bits)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "path": self.path,
+            "format_version": FORMAT_VERSION,
+            "built_at": self.built_at.isoformat(),
+            "watermark": self.watermark.isoformat(),
+            "keys": self.count,
+            "bits": self.num_bits,
+            "bytes": self.size_bytes,
+            "hashes": self.num_hashes,
+            "target_fpr": self.target_fpr,
+            "estimated_fpr": round(self.estimated_fpr(), 6),
+        }
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            # mmap を参照する memoryview が残っていると閉じられないため先に解放する
+            self._bits.release()
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+
+
+def build_filter(
+    keys: Iterable[int],
+    path: str,
+    capacity: int,
+    fpr: float = BLOOM_FILTER_FPR,
+    watermark: Optional[datetime] = None,
+) -> Dict[str, object]:
+    """
+    gtin のイテラブルからフィルタのファイルを作成する
+
+    Args:
+        keys: gtin のイテラブル
+        path: 出力先のファイルパス
+        capacity: 想定する要素数（作成後の追加を含める）
+        fpr: capacity 件のときの目標の偽陽性率
+        watermark: created_at がこの時刻以降の行を読み込み側がキャッチアップする
+
+    Returns:
+        Dict[str, object]: 件数・サイズ・ハッシュ数・推定偽陽性率・所要時間
+    """
+    started = time.perf_counter()
+    bloom = BloomFilter.create(capacity, fpr, watermark=watermark)
+    bloom.add_all(keys)
+    bloom.write(path)
+    return {
+        "keys": bloom.count,
+        "capacity": capacity,
+        "bytes": os.path.getsize(path),
+        "hashes": bloom.num_hashes,
+        "estimated_fpr": round(bloom.estimated_fpr(), 6),
+        "watermark": bloom.watermark.isoformat(),
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def _writer_snapshot():
+    """
+    ライターの REPEATABLE READ のトランザクションを開始したCore接続を返す
+
+    ウォーターマークと行の読み出しを同じスナップショットで行い、その間にコミットされた行を取りこぼさない
+    （リーダーはレプリケーション遅延で直前にコミットされた行が見えないことがあるため使わない）。
+    """
+    from .database import get_engine
+
+    conn = get_engine().connect().execution_options(isolation_level="REPEATABLE READ")
+    conn.begin()
+    return conn
+
+
+def _wait_for_transactions(horizon: int, timeout: float, interval: float = 1.0) -> None:
+    """horizon より前のトランザクションID（スナップショットの時点で実行中だったもの）がすべて終わるまで待つ"""
+    from .database import get_engine
+
+    deadline = time.monotonic() + timeout
+    while True:
+        with get_engine().connect() as conn:
+            xmin = conn.execute(XMIN_QUERY).scalar_one()
+        if xmin >= horizon:
+            return
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"transaction {xmin} running since the build started did not finish within {timeout:.0f}s")
+        time.sleep(interval)
+
+
+def build_from_database(
+    path: str,
+    fpr: float = BLOOM_FILTER_FPR,
+    headroom: float = BLOOM_FILTER_HEADROOM,
+    margin_seconds: float = BLOOM_FILTER_CATCHUP_MARGIN_SECONDS,
+    batch_size: int = 50000,
+    wait_seconds: float = 600.0,
+) -> Dict[str, object]:
+    """
+    jan_url_mapping の全 gtin からフィルタのファイルを作成する（行数に headroom を上乗せした容量で作る）
+
+    読み出しのスナップショットの時点で実行中のトランザクションがあった場合は、それらが終わるのを
+    （最長 wait_seconds 秒）待って全件をもう一度読む（それらが追加した行の created_at はウォーターマークより前のことがあるため）。
+    """
+    conn = _writer_snapshot()
+    try:
+        watermark, xmin, horizon = conn.execute(WATERMARK_QUERY, {"margin": margin_seconds}).one()
+        rows = conn.execute(COUNT_QUERY).scalar_one()
+        capacity = max(1000, math.ceil(rows * (1 + headroom)))
+        bloom = BloomFilter.create(capacity, fpr, watermark=watermark)
+        started = time.perf_counter()
+        bloom.add_all(conn.execution_options(yield_per=batch_size).execute(GTIN_QUERY).scalars())
+        conn.commit()
+    finally:
+        conn.close()
+    rescan = xmin < horizon
+    if rescan:
+        _wait_for_transactions(horizon, wait_seconds)
+        conn = _writer_snapshot()
+        try:
+            rows = bloom.add_all(conn.execution_options(yield_per=batch_size).execute(GTIN_QUERY).scalars())
+            # 2回目に読んだ行は1回目の行も含むため、件数は2回目の行数にする（足すと二重に数える）
+            bloom.count = rows
+            conn.commit()
+        finally:
+            conn.close()
+    bloom.write(path)
+    return {
+        "keys": bloom.count,
+        "capacity": capacity,
+        "bytes": os.path.getsize(path),
+        "hashes": bloom.num_hashes,
+        "estimated_fpr": round(bloom.estimated_fpr(), 6),
+        "watermark": bloom.watermark.isoformat(),
+        "rescanned": rescan,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def query_created_since(since: datetime, limit: int, margin_seconds: float) -> Tuple[datetime, int, int, List[int]]:
+    """
+    created_at が since 以降の gtin と、次のキャッチアップのウォーターマークの候補を読む
+
+    Returns:
+        Tuple[datetime, int, int, List[int]]:
+            (ウォーターマークの候補, スナップショットの xmin, 候補の horizon, gtin のリスト（最大 limit 件）)
+    """
+    from .circuit_breaker import db_breaker
+
+    with db_breaker.guard():
+        conn = _writer_snapshot()
+        try:
+            watermark, xmin, horizon = conn.execute(WATERMARK_QUERY, {"margin": margin_seconds}).one()
+            keys = conn.execute(CREATED_SINCE_QUERY, {"since": since, "limit": limit}).scalars().all()
+            conn.commit()
+        finally:
+            conn.close()
+    return watermark, xmin, horizon, keys
+
+
+class JanCodeFilter:
+    """
+    ルックアップで参照するフィルタ（ファイルの読み込み・キャッチアップ・このプロセスでの追加を管理する）
+
+    Args:
+        path: フィルタのファイルパス（空またはファイルが無い場合は無効）
+        catchup_seconds: キャッチアップの間隔（過ぎたフィルタは参照しない）
+        margin_seconds: ウォーターマークから引く余裕
+        max_catchup_rows: 1回のキャッチアップで読む行数の上限
+        query: (since, limit) を受け取り (ウォーターマークの候補, xmin, horizon, gtin のリスト) を返す関数
+        clock: 単調増加の時刻（テスト用）
+    """
+
+    def __init__(
+        self,
+        path: str = BLOOM_FILTER_PATH,
+        catchup_seconds: float = BLOOM_FILTER_CATCHUP_SECONDS,
+        margin_seconds: float = BLOOM_FILTER_CATCHUP_MARGIN_SECONDS,
+        max_catchup_rows: int = BLOOM_FILTER_MAX_CATCHUP_ROWS,
+        query: Optional[Callable[[datetime, int], Tuple[datetime, int, int, List[int]]]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.path = path
+        self.catchup_seconds = catchup_seconds
+        self.margin_seconds = margin_seconds
+        self.max_catchup_rows = max_catchup_rows
+        self._query = query or (lambda since, limit: query_created_since(since, limit, margin_seconds))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._bloom: Optional[BloomFilter] = None
+        self._loaded = False
+        self._mtime_ns: Optional[int] = None
+        self._since: Optional[datetime] = None
+        # ウォーターマークの候補（時刻, horizon）。古い順
+        self._candidates: List[Tuple[datetime, int]] = []
+        # 最後に成功したキャッチアップを開始した時刻（Noneの間は参照しない）
+        self._caught_up_at: Optional[float] = None
+        # 最後にバックグラウンドのキャッチアップを開始した時刻（失敗・無効の間の再試行の間隔を空ける）
+        self._attempted_at: Optional[float] = None
+        self._catching_up = False
+        self.disabled_reason: Optional[str] = None
+        self.checks = 0
+        self.rejected = 0
+        self.bypassed = 0
+        self.added = 0
+        self.catchups = 0
+        self.catchup_rows = 0
+        self.catchup_failures = 0
+        self.reloads = 0
+
+    @classmethod
+    def from_filter(cls, bloom: BloomFilter, **kwargs) -> "JanCodeFilter":
+        """読み込み済みのフィルタから作る（テスト・ベンチマーク用）"""
+        jan_filter = cls(path="", **kwargs)
+        jan_filter._bloom = bloom
+        jan_filter._since = bloom.watermark
+        jan_filter._loaded = True
+        return jan_filter
+
+    def _load(self) -> Optional[BloomFilter]:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    if self.path and os.path.exists(self.path):
+                        self._open_file()
+                    self._loaded = True
+        return self._bloom
+
+    def _open_file(self) -> None:
+        bloom = BloomFilter.open(self.path)
+        previous = self._bloom
+        self._bloom = bloom
+        self._since = bloom.watermark
+        self._candidates = []
+        self._mtime_ns = os.stat(self.path).st_mtime_ns
+        self._caught_up_at = None
+        self.disabled_reason = None
+        if previous is not None:
+            # 参照中のスレッドがあるため、古いフィルタの mmap は閉じずにGCに任せる
+            self.reloads += 1
+
+    @property
+    def enabled(self) -> bool:
+        return self._load() is not None
+
+    def is_current(self) -> bool:
+        """キャッチアップから catchup_seconds 以内か"""
+        caught_up_at = self._caught_up_at
+        return caught_up_at is not None and self._clock() - caught_up_at < self.catchup_seconds
+
+    def definitely_absent(self, jan_code: str) -> bool:
+        """
+        JANコードが登録されていないことが確実か
+
+        フィルタが無効・キャッチアップが古い場合はFalse（DBで確認する）を返し、必要ならバックグラウンドでキャッチアップする。
+
+        Args:
+            jan_code: 正規化済みのJANコード
+
+        Returns:
+            bool: 確実に登録されていない場合はTrue
+        """
+        bloom = self._load()
+        if bloom is None:
+            return False
+        caught_up_at = self._caught_up_at
+        age = None if caught_up_at is None else self._clock() - caught_up_at
+        if age is None or age >= self.catchup_seconds / 2:
+            self._catch_up_in_background()
+        if self.disabled_reason is not None or age is None or age >= self.catchup_seconds:
+            self.bypassed += 1
+            return False
+        self.checks += 1
+        if jan_code in bloom:
+            return False
+        self.rejected += 1
+        return True
+
+    def add(self, jan_codes: Iterable[str]) -> None:
+        """このプロセスで書き込んだ・変更の通知を受けたJANコードを追加する（削除された行の場合も偽陽性が増えるだけ）"""
+        bloom = self._load()
+        if bloom is None:
+            return
+        keys = [key for key in map(_to_key, jan_codes) if key is not None]
+        self.added += bloom.add_all(keys)
+
+    def mark_stale(self) -> None:
+        """一括の変更の後、キャッチアップが終わるまで参照しない"""
+        if self._load() is None:
+            return
+        self._caught_up_at = None
+        self._attempted_at = None
+        self._catch_up_in_background()
+
+    def catch_up(self) -> int:
+        """
+        作成・前回のキャッチアップ以降に追加された行をフィルタに追加する
+
+        ファイルが置き換えられている（作り直された）場合は読み込み直してから、そのウォーターマーク以降を読む。
+
+        Returns:
+            int: 追加した件数
+        """
+        if self._load() is None:
+            return 0
+        started = self._clock()
+        if self.path and os.path.exists(self.path) and os.stat(self.path).st_mtime_ns != self._mtime_ns:
+            with self._lock:
+                self._open_file()
+        if self.disabled_reason is not None:
+            return 0
+        bloom = self._bloom
+        watermark, xmin, horizon, keys = self._query(self._since, self.max_catchup_rows + 1)
+        if len(keys) > self.max_catchup_rows:
+            self.disabled_reason = f"more than {self.max_catchup_rows} rows added since {self._since.isoformat()}; rebuild the filter"
+            self._caught_up_at = None
+            logger.warning("Bloom filter disabled: %s", self.disabled_reason)
+            return 0
+        bloom.add_all(keys)
+        # 他のスレッドが古いウォーターマークで後から上書きしないよう、進める方向にだけ更新する
+        with self._lock:
+            if bloom is self._bloom:
+                self._advance(watermark, xmin, horizon)
+                self._caught_up_at = started
+            self.catchups += 1
+            self.catchup_rows += len(keys)
+        return len(keys)
+
+    def _advance(self, watermark: datetime, xmin: int, horizon: int) -> None:
+        """
+        候補を追加し、その時点で実行中だったトランザクションがすべて終わった（xmin が horizon に達した）最新の候補の時刻まで
+        ウォーターマークを進める
+
+        候補の時点で実行中でなかったトランザクションが後から追加する行の created_at は候補の時刻以降になり、
+        実行中だったトランザクションの行は、それらが終わった後のこのキャッチアップのスナップショットで見えている。
+        """
+        self._candidates.append((watermark, horizon))
+        resolved = None
+        for index, (_, candidate_horizon) in enumerate(self._candidates):
+            if candidate_horizon <= xmin:
+                resolved = index
+        if resolved is not None:
+            self._since = max(self._since, self._candidates[resolved][0])
+            del self._candidates[: resolved + 1]
+        # 長いトランザクションで進められない間は、古い候補から捨てる（ウォーターマークが進みにくくなるだけ）
+        del self._candidates[:-MAX_WATERMARK_CANDIDATES]
+
+    def _catch_up_in_background(self) -> None:
+        with self._lock:
+            now = self._clock()
+            if self._catching_up or (self._attempted_at is not None and now - self._attempted_at < self.catchup_seconds / 2):
+                return
+            self._catching_up = True
+            self._attempted_at = now
+        threading.Thread(target=self._run_catch_up, name="bloom-catchup", daemon=True).start()
+
+    def _run_catch_up(self) -> None:
+        try:
+            self.catch_up()
+        except Exception:
+            # DBに接続できない間はフィルタを参照しない（次のルックアップで再試行する）
+            self.catchup_failures += 1
+            logger.exception("Bloom filter catch-up failed")
+        finally:
+            with self._lock:
+                self._catching_up = False
+
+    def stats(self) -> Optional[Dict[str, object]]:
+        bloom = self._load()
+        if bloom is None:
+            return None
+        return {
+            **bloom.stats(),
+            "current": self.is_current(),
+            "disabled_reason": self.disabled_reason,
+            "since": self._since.isoformat() if self._since else None,
+            "pending_watermarks": len(self._candidates),
+            "checks": self.checks,
+            "rejected": self.rejected,
+            "bypassed": self.bypassed,
+            "added": self.added,
+            "catchups": self.catchups,
+            "catchup_rows": self.catchup_rows,
+            "catchup_failures": self.catchup_failures,
+            "reloads": self.reloads,
+        }
+
+
+jan_code_filter = JanCodeFilter()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build and inspect bloom filters of registered JAN codes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="build a bloom filter from jan_url_mapping")
+    build_parser.add_argument("path")
+    build_parser.add_argument("--fpr", type=float, default=BLOOM_FILTER_FPR)
+    build_parser.add_argument("--headroom", type=float, default=BLOOM_FILTER_HEADROOM)
+    info_parser = subparsers.add_parser("info", help="show bloom filter header")
+    info_parser.add_argument("path")
+    check_parser = subparsers.add_parser("check", help="check whether a JAN code may be registered")
+    check_parser.add_argument("path")
+    check_parser.add_argument("jan")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        print(json.dumps(build_from_database(args.path, fpr=args.fpr, headroom=args.headroom)))
+        return 0
+
+    bloom = BloomFilter.open(args.path)
+    try:
+        if args.command == "info":
+            print(json.dumps(bloom.stats()))
+            return 0
+        if args.jan in bloom:
+            print(f"JAN code '{args.jan}' may be registered")
+            return 0
+        print(f"JAN code '{args.jan}' is not registered", file=sys.stderr)
+        return 1
+    finally:
+        bloom.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
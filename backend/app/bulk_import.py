@@ -0,0 +1,328 @@
+"""
+JAN-URLマッピングの一括インポート
+
+CSV / JSONL を定数メモリでストリーミング読み込みし、チャンク単位で検証した上で
+UNLOGGEDのステージングテーブルへ COPY し、最後に1回の
+INSERT ... ON CONFLICT (gtin) DO UPDATE で本テーブルへマージする。
+url / brand / product_name が変化した行だけを更新する。
+
+使い方:
+    python -m app.bulk_import catalog.csv
+    python -m app.bulk_import catalog.jsonl.gz --chunk-size 100000
+    cat catalog.csv | python -m app.bulk_import - --format csv
+    python -m app.bulk_import catalog.csv --rebuild-bloom /opt/snapshot/jan_codes.bloom
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+
+from .bloom import build_from_database
+from .database import get_engine
+from .gtin import InvalidGtinError, normalize_batch, normalize_gtin
+from .shared_cache import shared_cache
+
+COLUMNS = ("jan_code", "url", "brand", "product_name")
+
+# 各カラムの最大長（jan_url_mapping のカラム定義に合わせる）
+MAX_LENGTHS = {"jan_code": 13, "brand": 100, "product_name": 255}
+
+DEFAULT_CHUNK_SIZE = 50000
+
+# エラー内容は先頭の数件だけ保持する（大量の不正行でメモリを消費しないため）
+MAX_REPORTED_ERRORS = 20
+
+
+@dataclass
+class ImportResult:
+    rows_read: int = 0
+    rows_rejected: int = 0
+    rows_staged: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    elapsed_seconds: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_read / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            "rows_read": self.rows_read,
+            "rows_rejected": self.rows_rejected,
+            "rows_staged": self.rows_staged,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "changed": self.inserted + self.updated,
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+def _open_text(path: str) -> TextIO:
+    """ファイルパス（.gz対応）または標準入力（"-"）をテキストとして開く"""
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def _detect_format(path: str) -> str:
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return "csv"
+
+
+def iter_records(stream: TextIO, fmt: str) -> Iterator[Dict[str, Optional[str]]]:
+    """
+    入力ストリームから1行ずつレコードを読み出す
+
+    Args:
+        stream: テキストストリーム
+        fmt: "csv"（ヘッダ行必須）または "jsonl"
+
+    Yields:
+        Dict[str, Optional[str]]: jan_code / url / brand / product_name を持つレコード
+    """
+    if fmt == "csv":
+        for row in csv.DictReader(stream):
+            yield {column: row.get(column) for column in COLUMNS}
+    elif fmt == "jsonl":
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                # 検証段階で不正行として数えられるよう空レコードを返す
+                yield {column: None for column in COLUMNS}
+                continue
+            yield {column: row.get(column) if isinstance(row, dict) else None for column in COLUMNS}
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def validate_record(
+    record: Dict[str, Optional[str]],
+    normalized_jan: Optional[str] = None,
+) -> Tuple[Optional[Tuple[str, str, Optional[str], Optional[str]]], Optional[str]]:
+    """
+    1レコードを検証・正規化する
+
+    Args:
+        record: jan_code / url / brand / product_name を持つレコード
+        normalized_jan: normalize_batch で正規化済みのJANコード（指定時はJANコードを再検証しない）
+
+    Returns:
+        (正規化済みの行, None) または (None, エラーメッセージ)
+    """
+    values = {}
+    for column in COLUMNS:
+        value = record.get(column)
+        value = str(value).strip() if value is not None else ""
+        values[column] = value or None
+
+    # EAN-8 / UPC-A / GTIN-14 は13桁のJANコードに正規化して格納する
+    jan_code = normalized_jan
+    if jan_code is None:
+        try:
+            jan_code = normalize_gtin(values["jan_code"] or "")
+        except InvalidGtinError as e:
+            return None, f"invalid jan_code {record.get('jan_code')!r}: {e}"
+    values["jan_code"] = jan_code
+    if not values["url"]:
+        return None, f"missing url for jan_code {jan_code}"
+    for column, max_length in MAX_LENGTHS.items():
+        if values[column] is not None and len(values[column]) > max_length:
+            return None, f"{column} too long for jan_code {jan_code}"
+
+    return (jan_code, values["url"], values["brand"], values["product_name"]), None
+
+
+def _validate_chunk(records: List[Dict[str, Optional[str]]], result: ImportResult) -> List[tuple]:
+    """チャンク内のJANコードを normalize_batch でまとめて正規化し、各レコードを検証する"""
+    normalized = normalize_batch(
+        str(record.get("jan_code")) if record.get("jan_code") is not None else ""
+        for record in records
+    )
+    rows: List[tuple] = []
+    for record, jan_code in zip(records, normalized):
+        result.rows_read += 1
+        # 不正なJANコードは validate_record で再検証してエラー理由を得る
+        row, error = validate_record(record, normalized_jan=jan_code)
+        if error:
+            result.rows_rejected += 1
+            if len(result.errors) < MAX_REPORTED_ERRORS:
+                result.errors.append(f"line {result.rows_read}: {error}")
+            continue
+        rows.append(row)
+    return rows
+
+
+def iter_chunks(records: Iterable[Dict[str, Optional[str]]], chunk_size: int, result: ImportResult) -> Iterator[List[tuple]]:
+    """レコードをチャンク単位で検証し、有効な行のリストを返す"""
+    pending: List[Dict[str, Optional[str]]] = []
+    for record in records:
+        pending.append(record)
+        if len(pending) >= chunk_size:
+            chunk = _validate_chunk(pending, result)
+            if chunk:
+                yield chunk
+            pending = []
+    if pending:
+        chunk = _validate_chunk(pending, result)
+        if chunk:
+            yield chunk
+
+
+def _copy_chunk(cursor, staging_table: str, chunk: List[tuple]) -> None:
+    """チャンクをCSVとしてメモリ上に書き出し、COPYでステージングテーブルへ投入する"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for jan_code, url, brand, product_name in chunk:
+        # CSV形式のCOPYでは引用符なしの空値がNULLになる
+        writer.writerow((jan_code, url, brand or "", product_name or ""))
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {staging_table} (jan_code, url, brand, product_name) FROM STDIN WITH (FORMAT csv)",
+        buffer,
+    )
+
+
+def import_records(records: Iterable[Dict[str, Optional[str]]], chunk_size: int = DEFAULT_CHUNK_SIZE) -> ImportResult:
+    """
+    レコード列を jan_url_mapping へ一括インポートする
+
+    Args:
+        records: jan_code / url / brand / product_name を持つレコードのイテラブル
+        chunk_size: 検証・COPYを行うチャンクの行数
+
+    Returns:
+        ImportResult: 読み込み件数・追加/更新/未変更件数・スループット
+    """
+    result = ImportResult()
+    started = time.perf_counter()
+    staging_table = f"jan_url_mapping_staging_{os.getpid()}"
+
+    connection = get_engine().raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {staging_table}")
+        cursor.execute(
+            f"""
+            CREATE UNLOGGED TABLE {staging_table} (
+                seq BIGSERIAL,
+                jan_code VARCHAR(13) NOT NULL,
+                url TEXT NOT NULL,
+                brand VARCHAR(100),
+                product_name VARCHAR(255)
+            )
+            """
+        )
+
+        for chunk in iter_chunks(records, chunk_size, result):
+            _copy_chunk(cursor, staging_table, chunk)
+            result.rows_staged += len(chunk)
+
+        # 同一JANが複数回現れた場合は最後の行を採用し、値が変化した行だけを更新する
+        cursor.execute(
+            f"""
+            WITH merged AS (
+                INSERT INTO jan_url_mapping (gtin, url, brand, product_name)
+                SELECT DISTINCT ON (jan_code) jan_code::bigint, url, brand, product_name
+                FROM {staging_table}
+                ORDER BY jan_code, seq DESC
+                ON CONFLICT (gtin) DO UPDATE
+                SET url = EXCLUDED.url,
+                    brand = EXCLUDED.brand,
+                    product_name = EXCLUDED.product_name
+                WHERE (jan_url_mapping.url, jan_url_mapping.brand, jan_url_mapping.product_name)
+                    IS DISTINCT FROM (EXCLUDED.url, EXCLUDED.brand, EXCLUDED.product_name)
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT
+                count(*) FILTER (WHERE inserted),
+                count(*) FILTER (WHERE NOT inserted),
+                (SELECT count(DISTINCT jan_code) FROM {staging_table})
+            FROM merged
+            """
+        )
+        inserted, updated, distinct_rows = cursor.fetchone()
+        result.inserted = inserted
+        result.updated = updated
+        result.unchanged = distinct_rows - inserted - updated
+
+        cursor.execute(f"DROP TABLE IF EXISTS {staging_table}")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    # 共有キャッシュ（L2_CACHE_URL）の世代を進め、追加・更新前の値（未登録のネガティブキャッシュを含む）を使わないようにする
+    if result.inserted or result.updated:
+        shared_cache.flush()
+
+    result.elapsed_seconds = time.perf_counter() - started
+    return result
+
+
+def import_file(path: str, fmt: Optional[str] = None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> ImportResult:
+    """
+    CSV / JSONL ファイル（.gz対応、"-" は標準入力）を jan_url_mapping へ一括インポートする
+
+    Args:
+        path: 入力ファイルパス
+        fmt: "csv" または "jsonl"（省略時は拡張子から判定）
+        chunk_size: 検証・COPYを行うチャンクの行数
+
+    Returns:
+        ImportResult: 読み込み件数・追加/更新/未変更件数・スループット
+    """
+    fmt = fmt or _detect_format(path)
+    stream = _open_text(path)
+    try:
+        return import_records(iter_records(stream, fmt), chunk_size=chunk_size)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk import JAN-URL mappings via COPY")
+    parser.add_argument("path", help="CSV/JSONL file (.gz supported), '-' for stdin")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--rebuild-bloom", metavar="PATH", help="rebuild the registered JAN code bloom filter after the import")
+    args = parser.parse_args(argv)
+
+    if args.path == "-" and not args.format:
+        parser.error("--format is required when reading from stdin")
+
+    result = import_file(args.path, fmt=args.format, chunk_size=args.chunk_size)
+
+    for error in result.errors:
+        print(error, file=sys.stderr)
+    summary = result.summary()
+    # 追加した行は稼働中のプロセスがキャッチアップで拾うが、大量の場合は作り直しておく（BLOOM_FILTER_MAX_CATCHUP_ROWS）
+    if args.rebuild_bloom:
+        summary["bloom_filter"] = build_from_database(args.rebuild_bloom)
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+import threading
+import time
+
+# キャッシュに存在しないことを表す番兵（Noneは「DBに存在しない」のネガティブキャッシュとして使う）
+MISSING = object()
+
+
+class LookupCache:
+    """
+    LRU + TTL のスレッドセーフなインメモリキャッシュ
+
+    値が None のエントリは「DBに存在しない」ことを表すネガティブキャッシュとして扱い、
+    通常より短いTTL（negative_ttl）で失効させる。
+    stale_ttl を指定すると、失効したエントリをさらに stale_ttl の間保持し、get_stale で取得できる
+    （バックグラウンドで再取得する間・DBに接続できない間に古い値を返す stale-while-revalidate 用）。
+
+    DBから読む前に epoch を取得して set に渡すと、読んでいる間にそのキーが破棄された場合は格納しない。
+    破棄はキーごとに記録する（他のキーの破棄では格納をやめない）。記録は max_tombstones 件までで、
+    あふれた古い記録より前に取得した epoch の格納はキーによらず捨てる。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl: float = 300.0,
+        negative_ttl: float = 30.0,
+        stale_ttl: float = 0.0,
+        enabled: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+        max_tombstones: int = 10000,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = max(0.0, stale_ttl)
+        self.enabled = enabled and max_entries > 0
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (失効時刻, 値)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+        # invalidate / clear のたびに進める（DBから読んでいる間に破棄されたエントリを、読んだ古い値で上書きしないため）
+        self.epoch = 0
+        # key -> 最後に破棄したときの epoch（古い順）
+        self.max_tombstones = max(1, max_tombstones)
+        self._tombstones: "OrderedDict[Hashable, int]" = OrderedDict()
+        # この epoch より前に取得した epoch の格納はすべて捨てる（clear・あふれた破棄の記録）
+        self._floor = 0
+
+    def get(self, key: Hashable) -> Any:
+        """キャッシュから値を取得する（存在しない・失効済みの場合は MISSING）"""
+        if not self.enabled:
+            return MISSING
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+
+            expires_at, value = entry
+            now = self._clock()
+            if expires_at <= now:
+                if expires_at + self.stale_ttl <= now:
+                    del self._entries[key]
+                    self.expirations += 1
+                self.misses += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_stale(self, key: Hashable) -> Any:
+        """失効後 stale_ttl 以内のエントリの値を取得する（無い・期限切れ・まだ失効していない場合は MISSING）"""
+        if not self.enabled or self.stale_ttl <= 0:
+            return MISSING
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+
+            expires_at, value = entry
+            now = self._clock()
+            if expires_at > now:
+                return MISSING
+            if expires_at + self.stale_ttl <= now:
+                del self._entries[key]
+                self.expirations += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self.stale_hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, epoch: Optional[int] = None) -> None:
+        """
+        値をキャッシュに格納する（None はネガティブキャッシュ）
+
+        epoch を指定した場合、その後にこのキーの invalidate または clear があれば格納しない（DBから読む前の epoch を渡す）。
+        """
+        if not self.enabled:
+            return
+
+        ttl = self.negative_ttl if value is None else self.ttl
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            if epoch is not None and self._invalidated_since(key, epoch):
+                return
+            self._entries[key] = (self._clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _invalidated_since(self, key: Hashable, epoch: int) -> bool:
+        return self._floor > epoch or self._tombstones.get(key, 0) > epoch
+
+    def invalidated_since(self, key: Hashable, epoch: int) -> bool:
+        """epoch を取得した後にこのキーが破棄されたか（共有キャッシュへ書き込む前の確認用）"""
+        with self._lock:
+            return self._invalidated_since(key, epoch)
+
+    def invalidate(self, key: Hashable) -> None:
+        """指定キーのエントリを削除する"""
+        with self._lock:
+            self._entries.pop(key, None)
+            self.epoch += 1
+            self._tombstones[key] = self.epoch
+            self._tombstones.move_to_end(key)
+            while len(self._tombstones) > self.max_tombstones:
+                _, oldest = self._tombstones.popitem(last=False)
+                self._floor = max(self._floor, oldest)
+
+    def clear(self) -> None:
+        """全エントリを削除する"""
+        with self._lock:
+            self._entries.clear()
+            self.epoch += 1
+            self._floor = self.epoch
+            self._tombstones.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        """エントリがあるか（失効済み・失効後に保持しているものを含む、ヒット/ミスには数えない）"""
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット/ミス/追い出し件数などの統計情報を返す"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stale_hits": self.stale_hits,
+                "stale_ttl_seconds": self.stale_ttl,
+                "tombstones": len(self._tombstones),
+            }
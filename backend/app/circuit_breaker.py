@@ -0,0 +1,187 @@
+"""
+DBのサーキットブレーカー
+
+Aurora Serverless v2 のスケーリング・フェイルオーバー中は、接続やクエリが接続タイムアウトまで待たされてから失敗する。
+連続して DB_CIRCUIT_BREAKER_FAILURE_THRESHOLD 回接続できない・タイムアウトした場合はブレーカーを開き、
+DB_CIRCUIT_BREAKER_RESET_SECONDS の間はDBへ接続せずに CircuitOpenError で即座に失敗させる
+（ルックアップはその間、失効後も保持しているキャッシュのエントリを返す）。
+期間が過ぎると1件だけ試行（half_open）し、成功すれば閉じ、失敗すれば再び開く。
+
+判定はプロセス内のみ（Lambdaではコンテナごと）。
+"""
+from contextlib import contextmanager
+from typing import Callable, Dict
+import asyncio
+import os
+import threading
+import time
+
+from sqlalchemy import exc as sa_exc
+
+DB_CIRCUIT_BREAKER_ENABLED = os.getenv("DB_CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+DB_CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("DB_CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+DB_CIRCUIT_BREAKER_RESET_SECONDS = float(os.getenv("DB_CIRCUIT_BREAKER_RESET_SECONDS", "10"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """ブレーカーが開いているためDBへ接続しなかった"""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__("Database circuit breaker is open")
+        self.retry_after = retry_after
+
+
+def is_unavailable_error(error: BaseException) -> bool:
+    """
+    DBに到達できないことを表す例外か判定する（ブレーカーの失敗として数える）
+
+    接続の失敗・切断・statement_timeout によるキャンセル（OperationalError）、プールの待ち時間切れ、
+    非同期ドライバのタイムアウトが該当する。一意制約違反などクエリ自体の誤りは数えない。
+    """
+    return isinstance(error, (
+        sa_exc.OperationalError,
+        sa_exc.InterfaceError,
+        sa_exc.TimeoutError,
+        asyncio.TimeoutError,
+        ConnectionError,
+    )) or (isinstance(error, sa_exc.DBAPIError) and error.connection_invalidated)
+
+
+class CircuitBreaker:
+    """
+    連続失敗回数で開閉するサーキットブレーカー（スレッドセーフ）
+
+    Args:
+        failure_threshold: ブレーカーを開く連続失敗回数
+        reset_timeout: 開いてから試行を再開するまでの秒数
+        enabled: False の場合は常に閉じたまま（失敗も数えない）
+        clock: 時刻関数（テスト用）
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 10.0,
+        enabled: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.enabled = enabled
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self.consecutive_failures = 0
+        self.failures = 0
+        self.opens = 0
+        self.rejected = 0
+
+    def _retry_after(self, now: float) -> float:
+        return max(0.0, self._opened_at + self.reset_timeout - now)
+
+    def before_call(self) -> None:
+        """DBへ接続する前に呼ぶ（開いている場合は CircuitOpenError を送出する）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            now = self._clock()
+            if self._state == OPEN:
+                if now < self._opened_at + self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(self._retry_after(now))
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN:
+                # 試行は1件ずつ（結果が出るまで他の呼び出しは開いているときと同じく拒否する）
+                if self._probing:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.reset_timeout)
+                self._probing = True
+
+    def record_success(self) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._state = CLOSED
+            self._probing = False
+            self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opens += 1
+                self._state = OPEN
+                self._opened_at = self._clock()
+
+    def _release_probe(self) -> None:
+        with self._lock:
+            self._probing = False
+
+    @contextmanager
+    def guard(self):
+        """
+        DBへの接続・クエリを囲むコンテキストマネージャ
+
+        DBに到達できない例外は失敗、正常終了は成功として記録する（それ以外の例外は記録しない）。
+        """
+        self.before_call()
+        try:
+            yield
+        except CircuitOpenError:
+            raise
+        except BaseException as e:
+            if is_unavailable_error(e):
+                self.record_failure()
+            elif self.enabled:
+                self._release_probe()
+            raise
+        else:
+            self.record_success()
+
+    @property
+    def state(self) -> str:
+        """現在の状態（開いてから reset_timeout が過ぎていれば half_open）"""
+        with self._lock:
+            if self._state == OPEN and self._clock() >= self._opened_at + self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def is_open(self) -> bool:
+        """DBへ接続せずに失敗させる状態か（half_open は含まない）"""
+        return self.enabled and self.state == OPEN
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return self._retry_after(self._clock()) if self._state == OPEN else 0.0
+
+    def stats(self) -> Dict[str, object]:
+        state = self.state
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "state": state,
+                "consecutive_failures": self.consecutive_failures,
+                "failures": self.failures,
+                "opens": self.opens,
+                "rejected": self.rejected,
+                "failure_threshold": self.failure_threshold,
+                "reset_seconds": self.reset_timeout,
+            }
+
+
+db_breaker = CircuitBreaker(
+    failure_threshold=DB_CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=DB_CIRCUIT_BREAKER_RESET_SECONDS,
+    enabled=DB_CIRCUIT_BREAKER_ENABLED,
+)
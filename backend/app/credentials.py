@@ -0,0 +1,93 @@
+from typing import Callable, Dict, Optional
+import json
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+
+class SecretProvider:
+    """
+    Secrets Manager のDB認証情報を遅延取得し、TTL付きでキャッシュするプロバイダ
+
+    初回の get() 呼び出しまでネットワークアクセスも boto3 クライアントの生成も行わない。
+    extension_endpoint が指定された場合は AWS Parameters and Secrets Lambda Extension の
+    ローカルHTTPエンドポイントから取得する（ローカルではスタブサーバーを指定してテストできる）。
+
+    Args:
+        secret_arn: シークレットのARN
+        ttl: キャッシュの有効期間（秒）
+        extension_endpoint: Lambda Extension のエンドポイント（例: http://localhost:2773）
+        timeout: 取得時のタイムアウト（秒）
+    """
+
+    def __init__(
+        self,
+        secret_arn: str,
+        ttl: float = 300.0,
+        extension_endpoint: Optional[str] = None,
+        timeout: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.secret_arn = secret_arn
+        self.ttl = ttl
+        self.extension_endpoint = extension_endpoint.rstrip("/") if extension_endpoint else None
+        self.timeout = timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._secret: Optional[Dict[str, str]] = None
+        self._expires_at = 0.0
+        self._client = None
+        self.fetch_count = 0
+
+    def get(self, force_refresh: bool = False) -> Dict[str, str]:
+        """
+        認証情報を取得する（キャッシュが有効な間は再取得しない）
+
+        Args:
+            force_refresh: キャッシュを無視して再取得する（認証失敗時など）
+
+        Returns:
+            Dict[str, str]: username / password などを含むシークレット
+        """
+        with self._lock:
+            if force_refresh or self._secret is None or self._expires_at <= self._clock():
+                self._secret = self._fetch()
+                self._expires_at = self._clock() + self.ttl
+                self.fetch_count += 1
+            return self._secret
+
+    def invalidate(self) -> None:
+        """キャッシュを破棄し、次回の get() で再取得させる"""
+        with self._lock:
+            self._expires_at = 0.0
+
+    def _fetch(self) -> Dict[str, str]:
+        if self.extension_endpoint:
+            return self._fetch_from_extension()
+        return self._fetch_from_secrets_manager()
+
+    def _fetch_from_extension(self) -> Dict[str, str]:
+        query = urllib.parse.urlencode({"secretId": self.secret_arn})
+        request = urllib.request.Request(
+            f"{self.extension_endpoint}/secretsmanager/get?{query}",
+            headers={"X-Aws-Parameters-Secrets-Token": os.getenv("AWS_SESSION_TOKEN", "")},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            payload = json.loads(response.read())
+        return json.loads(payload["SecretString"])
+
+    def _fetch_from_secrets_manager(self) -> Dict[str, str]:
+        if self._client is None:
+            # boto3 のインポートとクライアント生成は重いため、実際に必要になるまで遅延させる
+            import boto3
+
+            self._client = boto3.client("secretsmanager")
+        secret_value = self._client.get_secret_value(SecretId=self.secret_arn)
+        return json.loads(secret_value["SecretString"])
+
+
+def is_authentication_error(error: Exception) -> bool:
+    """パスワード認証失敗（シークレットのローテーション後など）かどうかを判定する"""
+    return "password authentication failed" in str(error) or type(error).__name__ == "InvalidPasswordError"
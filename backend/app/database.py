@@ -1,68 +1,287 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, func
+from sqlalchemy import create_engine, event, BigInteger, Column, Computed, DateTime, String, Text, func
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import NullPool
+from contextlib import contextmanager, asynccontextmanager
 import os
 import sys
-import json
-import boto3
+import threading
+
+from .credentials import SecretProvider, is_authentication_error
 
 # 環境変数からDATABASE_URLを取得（ローカルDocker用）
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-# DATABASE_URLが設定されていない場合、Secrets Managerから取得（Lambda用）
+# 読み取り用の接続先（未設定の場合は読み取りもライターへ接続する）
+# ローカルでは同じPostgreSQLを指す別のURLを指定して振り分けを確認できる
+DATABASE_READER_URL = os.getenv("DATABASE_READER_URL") or None
+
+# DATABASE_URLが設定されていない場合、Secrets Managerから認証情報を取得（Lambda用）
+# 認証情報は最初の接続確立時に遅延取得し、TTL付きでキャッシュする（インポート時にはネットワークアクセスしない）
+secret_provider = None
 if not DATABASE_URL:
     db_secret_arn = os.getenv("DB_SECRET_ARN")
     db_endpoint = os.getenv("DB_CLUSTER_ENDPOINT")
     db_name = os.getenv("DB_NAME", "bronzedraw")
 
     if db_secret_arn and db_endpoint:
-        # Secrets Managerから認証情報を取得
-        secrets_client = boto3.client('secretsmanager')
-        secret_value = secrets_client.get_secret_value(SecretId=db_secret_arn)
-        secret = json.loads(secret_value['SecretString'])
+        secret_provider = SecretProvider(
+            db_secret_arn,
+            ttl=float(os.getenv("DB_SECRET_TTL_SECONDS", "300")),
+            # Parameters and Secrets Lambda Extension のローカルエンドポイント（未設定ならboto3を使用）
+            extension_endpoint=os.getenv("SECRETS_EXTENSION_ENDPOINT") or None,
+        )
 
-        # DATABASE_URLを構築
-        DATABASE_URL = f"postgresql://{secret['username']}:{secret['password']}@{db_endpoint}:5432/{db_name}"
+        # DATABASE_URLを構築（ユーザー名・パスワードは接続時に注入する）
+        DATABASE_URL = f"postgresql://{db_endpoint}:5432/{db_name}"
+
+        # Auroraのリーダーエンドポイント（任意、認証情報はライターと共通）
+        db_reader_endpoint = os.getenv("DB_READER_ENDPOINT")
+        if db_reader_endpoint:
+            DATABASE_READER_URL = f"postgresql://{db_reader_endpoint}:5432/{db_name}"
     else:
         sys.exit("Error: Neither DATABASE_URL nor DB_SECRET_ARN/DB_CLUSTER_ENDPOINT is set.")
 
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 
-# エンジン作成
-engine = create_engine(
-    DATABASE_URL,
-    echo=DEBUG,
-    pool_pre_ping=True,
-    pool_recycle=3600
-)
+# 非同期モード（asyncpg + AsyncSession）を使うかどうか
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() == "true"
+
+
+# コネクション管理の方式
+# - null  : 接続をプールしない（リクエストごとに接続・切断。RDS Proxy経由の大量同時実行向け）
+# - single: 1本の接続を保持し続ける（pre-pingなし。1コンテナ1リクエストのLambda向け）
+# - queue : 通常のコネクションプール（uvicornなどコンテナ常駐実行向け）
+DB_POOL_STRATEGY = os.getenv("DB_POOL_STRATEGY", "queue").lower()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "3600"))
+
+if DB_POOL_STRATEGY not in ("null", "single", "queue"):
+    sys.exit(f"Error: Unknown DB_POOL_STRATEGY '{DB_POOL_STRATEGY}' (expected null/single/queue).")
+
+# 接続・クエリのタイムアウト（Auroraのスケーリング・フェイルオーバー中に、OSのTCPタイムアウトまで待たされないようにする）
+# statement_timeout は接続時のパラメータで設定する（0・空文字で無制限。一括インポートなどのCLIでは設定しない）
+DB_CONNECT_TIMEOUT_SECONDS = int(os.getenv("DB_CONNECT_TIMEOUT_SECONDS") or "5")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS") or "0")
+
+
+def _engine_options():
+    """DB_POOL_STRATEGY に応じたエンジンのプール設定を返す（同期・非同期共通）"""
+    if DB_POOL_STRATEGY == "null":
+        return {"poolclass": NullPool}
+    if DB_POOL_STRATEGY == "single":
+        # チェックアウトごとの疎通確認（pre-ping）の往復を省き、切断はエラー時の自動無効化に任せる
+        return {
+            "pool_size": 1,
+            "max_overflow": 0,
+            "pool_pre_ping": False,
+            "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+        }
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_pre_ping": True,
+        "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+    }
+
+
+def _connect_args():
+    """psycopg2 の接続パラメータ（接続タイムアウト・statement_timeout）"""
+    args = {}
+    if DB_CONNECT_TIMEOUT_SECONDS > 0:
+        args["connect_timeout"] = DB_CONNECT_TIMEOUT_SECONDS
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    return args
+
+
+def _async_connect_args():
+    """asyncpg の接続パラメータ（_connect_args と同じ設定）"""
+    args = {}
+    if DB_CONNECT_TIMEOUT_SECONDS > 0:
+        args["timeout"] = DB_CONNECT_TIMEOUT_SECONDS
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    return args
+
+
+def _inject_credentials(dialect, conn_rec, cargs, cparams):
+    """
+    新しい物理接続を張る直前にシークレットから認証情報を注入する
+
+    認証に失敗した場合（パスワードのローテーション後など）はシークレットを再取得して1回だけ再試行する。
+    プール済みの接続はそのまま使い続けるため、エンジンを作り直す必要はない。
+    """
+    secret = secret_provider.get()
+    cparams["user"] = secret["username"]
+    cparams["password"] = secret["password"]
+    try:
+        return dialect.connect(*cargs, **cparams)
+    except Exception as e:
+        if not is_authentication_error(e):
+            raise
+        secret = secret_provider.get(force_refresh=True)
+        cparams["user"] = secret["username"]
+        cparams["password"] = secret["password"]
+        return dialect.connect(*cargs, **cparams)
+
+
+def _create_engine(url, **options):
+    engine = create_engine(url, echo=DEBUG, connect_args=_connect_args(), **(options or _engine_options()))
+    if secret_provider:
+        event.listen(engine, "do_connect", _inject_credentials)
+    return engine
+
+
+def _create_async_engine(url):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    async_engine = create_async_engine(
+        url.replace("postgresql://", "postgresql+asyncpg://", 1),
+        echo=DEBUG,
+        connect_args=_async_connect_args(),
+        **_engine_options()
+    )
+    if secret_provider:
+        event.listen(async_engine.sync_engine, "do_connect", _inject_credentials)
+    return async_engine
+
+
+# 接続先ごとのエンジン（"writer" / "reader"、初回呼び出し時に作成）
+_engines = {}
+_async_engines = {}
+_engine_lock = threading.Lock()
+
+
+def _get_or_create(engines, role, factory):
+    engine = engines.get(role)
+    if engine is None:
+        with _engine_lock:
+            engine = engines.get(role)
+            if engine is None:
+                engine = engines[role] = factory()
+    return engine
+
+
+def get_engine():
+    """ライターのエンジンを取得する（初回呼び出し時に作成）"""
+    return _get_or_create(_engines, "writer", lambda: _create_engine(DATABASE_URL))
+
 
-# セッションファクトリ
+def get_reader_engine():
+    """
+    リーダーのエンジンを取得する（初回呼び出し時に作成）
+
+    DATABASE_READER_URL / DB_READER_ENDPOINT が未設定の場合はライターのエンジンを返す。
+    """
+    if not DATABASE_READER_URL:
+        return get_engine()
+    return _get_or_create(_engines, "reader", lambda: _create_engine(DATABASE_READER_URL))
+
+
+def dedicated_connection():
+    """
+    プールを経由しないライターへのDBAPI接続を作成する（LISTEN など長時間保持する接続用、呼び出し側で close する）
+
+    プールの接続を占有すると DB_POOL_STRATEGY=single の場合にリクエストが接続を取得できなくなるため、別に接続する。
+    """
+    engine = _get_or_create(_engines, "dedicated", lambda: _create_engine(DATABASE_URL, poolclass=NullPool))
+    return engine.raw_connection()
+
+
+def get_async_engine():
+    """ライターの非同期エンジンを取得する（DB_ASYNC=true の場合のみ、初回呼び出し時に作成）"""
+    return _get_or_create(_async_engines, "writer", lambda: _create_async_engine(DATABASE_URL))
+
+
+def get_async_reader_engine():
+    """リーダーの非同期エンジンを取得する（未設定の場合はライターの非同期エンジン）"""
+    if not DATABASE_READER_URL:
+        return get_async_engine()
+    return _get_or_create(_async_engines, "reader", lambda: _create_async_engine(DATABASE_READER_URL))
+
+
+# セッションファクトリ（エンジンはセッション生成時に get_engine() でバインドする）
 SessionLocal = sessionmaker(
-    bind=engine,
     autocommit=False,
     autoflush=False
 )
 
+# 非同期セッションファクトリ（DB_ASYNC=true の場合のみ作成）
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    AsyncSessionLocal = async_sessionmaker(
+        autoflush=False,
+        expire_on_commit=False
+    )
+
 # Base作成
 Base = declarative_base()
 
 
-# モデル定義
+# モデルが対応するスキーマのバージョン（db/migrations の最新のマイグレーションと一致させる）
+SCHEMA_VERSION = 7
+
+
+# モデル定義（db/migrations/0002_gtin_key.sql のスキーマ）
 class JanUrlMappingModel(Base):
     __tablename__ = "jan_url_mapping"
 
-    id = Column(Integer, primary_key=True, index=True)
-    jan_code = Column(String(13), unique=True, nullable=False, index=True)
+    # 主キーのインデックスは url / brand / product_name / updated_at を INCLUDE した covering index
+    # （PRIMARY KEY ... INCLUDE はマイグレーションで作成する）
+    # product_name / brand には検索用の pg_trgm GIN インデックスがある（0003_trgm_search.sql）
+    # 変更はコミット時に jan_url_mapping_changed チャネルへ通知される（0004_change_notify.sql）
+    # created_at には登録済みJANコードのブルームフィルタのキャッチアップ用の BRIN インデックスがある（0005_created_at_brin.sql）
+    # created_at は行を追加した時刻（clock_timestamp()、0007_created_at_clock_timestamp.sql）
+    gtin = Column(BigInteger, primary_key=True, autoincrement=False)
+    jan_code = Column(String(13), Computed("lpad(gtin::text, 13, '0')", persisted=True))
     url = Column(Text, nullable=False)
     brand = Column(String(100))
     product_name = Column(String(255))
-    created_at = Column(DateTime, server_default=func.now())
+    created_at = Column(DateTime, server_default=func.clock_timestamp())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
 
+# ルックアップのヒット件数（db/migrations/0006_lookup_stats.sql、app/popularity.py がまとめて加算する）
+class JanLookupStatsModel(Base):
+    __tablename__ = "jan_lookup_stats"
+
+    # lookups には降順のインデックスがある（コールドスタート時のウォームアップで多い順に読む）
+    gtin = Column(BigInteger, primary_key=True, autoincrement=False)
+    lookups = Column(BigInteger, nullable=False, server_default="0")
+    first_lookup_at = Column(DateTime, nullable=False, server_default=func.now())
+    last_lookup_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
 # 依存関係注入用
 def get_db():
-    db = SessionLocal()
+    db = SessionLocal(bind=get_engine())
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# 依存性注入を使わない箇所（キャッシュ経由の参照など）で必要な時だけセッションを取得する
+@contextmanager
+def session_scope():
+    db = SessionLocal(bind=get_engine())
     try:
         yield db
     finally:
         db.close()
+
+
+# 依存関係注入用（非同期モード）
+async def get_async_db():
+    async with AsyncSessionLocal(bind=get_async_engine()) as db:
+        yield db
+
+
+# session_scope の非同期版
+@asynccontextmanager
+async def async_session_scope():
+    async with AsyncSessionLocal(bind=get_async_engine()) as db:
+        yield db
@@ -0,0 +1,40 @@
+"""
+/api/convert のレスポンスボディのエンコード
+
+response_model による再検証・jsonable_encoder を経由せず、ルックアップ結果から直接JSONのバイト列を組み立てる。
+出力は FastAPI の JSONResponse（ensure_ascii=False、区切り文字に空白なし）とバイト単位で一致する。
+orjson がインストールされていない環境では標準の json にフォールバックする。
+"""
+import json
+
+from .schemas import JanUrlMappingRecord
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _dumps_json(content: dict) -> bytes:
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+_dumps = orjson.dumps if orjson is not None else _dumps_json
+
+
+def encode_mapping(mapping: JanUrlMappingRecord) -> bytes:
+    """
+    ルックアップ結果を JanUrlMapping のJSONとしてエンコードする（updated_at は含めない）
+
+    Args:
+        mapping: ルックアップ結果
+
+    Returns:
+        bytes: レスポンスボディ
+    """
+    return _dumps({
+        "jan_code": mapping.jan_code,
+        "url": mapping.url,
+        "brand": mapping.brand,
+        "product_name": mapping.product_name,
+    })
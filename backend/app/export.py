@@ -0,0 +1,184 @@
+"""
+JAN-URLマッピングの全件エクスポート
+
+サーバーサイドカーソル（psycopg2の名前付きカーソル）と yield_per で主キー（gtin = jan_code）順に
+ストリーミング読み出しし、NDJSON / CSV（任意でgzip圧縮）として出力する。
+メモリ使用量はテーブルサイズに依存しない。
+中断した場合は最後に出力した jan_code を after_jan に指定すると続きから再開できる（キーセット方式）。
+
+使い方:
+    python -m app.export jan_url_mapping.ndjson
+    python -m app.export jan_url_mapping.csv.gz --format csv --gzip
+    python -m app.export - --after-jan 4900000000009 >> jan_url_mapping.ndjson
+"""
+from typing import Iterable, Iterator, List, Optional, Tuple
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+
+from sqlalchemy import select
+
+from .database import JanUrlMappingModel
+from .gtin import gtin_key, jan_code_from_key
+from .routing import read_session_scope
+
+EXPORT_COLUMNS = ("jan_code", "url", "brand", "product_name")
+
+# サーバーサイドカーソルから一度に取り出す行数
+DEFAULT_BATCH_SIZE = 5000
+
+# 出力チャンクのおおよそのサイズ（細かすぎる書き込みを避ける）
+CHUNK_BYTES = 64 * 1024
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def iter_rows(after_jan: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[Tuple]:
+    """
+    jan_url_mapping を jan_code 順にストリーミングで読み出す
+
+    13桁に0埋めした jan_code の順序は gtin（主キー）の順序と一致するため、
+    主キーのインデックス（covering index）を Index Only Scan で読み出す。
+    リーダーから読む（このプロセスで直近に書き込みがあった場合はライター）。
+
+    Args:
+        after_jan: この jan_code より後ろから読み出す（再開用、数字のみ）
+        batch_size: サーバーサイドカーソルから一度に取り出す行数
+
+    Yields:
+        Tuple: (jan_code, url, brand, product_name)
+    """
+    stmt = select(
+        JanUrlMappingModel.gtin,
+        JanUrlMappingModel.url,
+        JanUrlMappingModel.brand,
+        JanUrlMappingModel.product_name,
+    ).order_by(JanUrlMappingModel.gtin)
+    if after_jan:
+        stmt = stmt.where(JanUrlMappingModel.gtin > gtin_key(after_jan))
+
+    with read_session_scope() as db:
+        # yield_per はサーバーサイドカーソル（stream_results）を有効にする
+        result = db.execute(stmt.execution_options(yield_per=batch_size))
+        for gtin, url, brand, product_name in result:
+            yield (jan_code_from_key(gtin), url, brand, product_name)
+
+
+def encode_rows(rows: Iterable[Tuple], fmt: str = "ndjson", header: bool = True) -> Iterator[bytes]:
+    """
+    行を NDJSON / CSV のバイト列チャンクに変換する
+
+    Args:
+        rows: (jan_code, url, brand, product_name) のイテラブル
+        fmt: "ndjson" または "csv"
+        header: CSVの場合にヘッダ行を出力するか
+
+    Yields:
+        bytes: 約 CHUNK_BYTES ごとにまとめた出力
+    """
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n") if fmt == "csv" else None
+    if writer and header:
+        writer.writerow(EXPORT_COLUMNS)
+
+    for row in rows:
+        if writer:
+            writer.writerow(["" if value is None else value for value in row])
+        else:
+            buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False))
+            buffer.write("\n")
+
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """バイト列チャンクをストリーミングでgzip圧縮する"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzipヘッダ付き
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_chunks(
+    fmt: str = "ndjson",
+    compress: bool = False,
+    after_jan: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """
+    エクスポート全体をバイト列チャンクとして生成する（StreamingResponse用）
+
+    再開時（after_jan指定時）はCSVヘッダを出力しない。
+    """
+    chunks = encode_rows(iter_rows(after_jan, batch_size), fmt, header=after_jan is None)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export JAN-URL mappings as NDJSON/CSV")
+    parser.add_argument("path", help="output file, '-' for stdout")
+    parser.add_argument("--format", choices=sorted(MEDIA_TYPES), default="ndjson")
+    parser.add_argument("--gzip", action="store_true", help="gzip-compress the output")
+    parser.add_argument("--after-jan", default=None, help="resume after this jan_code")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--append", action="store_true", help="append to an existing file (resume)")
+    args = parser.parse_args(argv)
+
+    # 中断時に再開位置を表示するため、読み出し位置と書き込み済み位置を追跡する
+    last_jan = args.after_jan
+    written_jan = args.after_jan
+    exported = 0
+
+    def tracked_rows():
+        nonlocal last_jan, exported
+        for row in iter_rows(args.after_jan, args.batch_size):
+            last_jan = row[0]
+            exported += 1
+            yield row
+
+    chunks = encode_rows(tracked_rows(), args.format, header=args.after_jan is None)
+    if args.gzip:
+        chunks = gzip_chunks(chunks)
+
+    if args.path == "-":
+        out = sys.stdout.buffer
+    else:
+        out = open(args.path, "ab" if args.append else "wb")
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+            # 非圧縮の場合、チャンクには読み出し済みの行がすべて含まれる
+            if not args.gzip:
+                written_jan = last_jan
+    except KeyboardInterrupt:
+        # gzipは途中で切れたストリームになるため、再開時は別ファイルへ出力すること
+        print(f"interrupted; resume with --after-jan {written_jan}", file=sys.stderr)
+        return 130
+    finally:
+        out.flush()
+        if out is not sys.stdout.buffer:
+            out.close()
+
+    print(json.dumps({"rows": exported, "last_jan": last_jan}), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
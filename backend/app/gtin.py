@@ -0,0 +1,159 @@
+"""
+JAN / GTIN コードの検証と正規化
+
+JANコードの入力（スキャナのノイズ・EAN-8・UPC-A・GTIN-14・打ち間違いなど）を
+DBに問い合わせる前に検証し、GTIN-13（13桁のJANコード）に正規化する。
+
+- EAN-8 (8桁)  : 先頭を0で埋めて13桁にする（GS1のGTIN表現に従う）
+- UPC-A (12桁) : 先頭に0を付けて13桁にする
+- GTIN-13      : そのまま
+- GTIN-14      : インジケータが0の場合のみ先頭の0を除いて13桁にする
+                 （1〜9は集合包装の識別子のため単品のJANコードには変換できない）
+
+いずれもチェックデジット（モジュラス10 / ウェイト3-1）を検証する。
+"""
+from typing import Iterable, List, Optional
+
+GTIN_LENGTHS = (8, 12, 13, 14)
+
+# 数字以外を含むか判定するための削除文字（数字を削除して残りがあれば不正）
+_DIGITS = b"0123456789"
+
+# normalize_batch 用の変換表
+# 14桁に0埋めしたコードでは、先頭から偶数番目の桁にウェイト3、奇数番目にウェイト1が掛かる
+_WEIGHTED = (
+    bytes((d - 48) * 3 % 10 if 48 <= d <= 57 else 0 for d in range(256)),
+    bytes((d - 48) % 10 if 48 <= d <= 57 else 0 for d in range(256)),
+)
+# 桁ごとの合計（0〜117）から期待されるチェックデジット（ASCII）への変換表
+_CHECK_DIGIT = bytes(48 + (10 - total % 10) % 10 for total in range(256))
+
+
+class InvalidGtinError(ValueError):
+    """JAN / GTIN コードとして不正な入力"""
+
+
+def check_digit(body: bytes) -> int:
+    """
+    チェックデジットを除いた部分からチェックデジットを計算する
+
+    右端から奇数番目にウェイト3、偶数番目にウェイト1を掛けた合計から求める。
+    bytes のスライスと sum() で計算し、桁ごとのPythonレベルのループを行わない。
+
+    Args:
+        body: 数字のみのASCIIバイト列（チェックデジットを除く）
+
+    Returns:
+        int: チェックデジット（0〜9）
+    """
+    odd = body[::-1][::2]
+    even = body[::-1][1::2]
+    total = 3 * (sum(odd) - 48 * len(odd)) + (sum(even) - 48 * len(even))
+    return (10 - total % 10) % 10
+
+
+def _normalize(code: str) -> str:
+    """normalize_gtin の本体（不正な場合は理由を InvalidGtinError で送出）"""
+    length = len(code)
+    if length not in GTIN_LENGTHS:
+        raise InvalidGtinError(f"length must be 8, 12, 13 or 14 digits (got {length})")
+    if not code.isascii():
+        raise InvalidGtinError("must contain only digits")
+    raw = code.encode("ascii")
+    if raw.translate(None, _DIGITS):
+        raise InvalidGtinError("must contain only digits")
+    if check_digit(raw[:-1]) != raw[-1] - 48:
+        raise InvalidGtinError("check digit mismatch")
+
+    if length == 13:
+        return code
+    if length == 14:
+        if code[0] != "0":
+            raise InvalidGtinError("GTIN-14 with a packaging indicator cannot be mapped to a JAN code")
+        return code[1:]
+    return code.zfill(13)
+
+
+def normalize_gtin(code: str) -> str:
+    """
+    JAN / GTIN コードを検証し、GTIN-13 に正規化する
+
+    前後の空白は無視する。
+
+    Args:
+        code: EAN-8 / UPC-A / EAN-13 (JAN) / GTIN-14 のコード
+
+    Returns:
+        str: 13桁に正規化したJANコード
+
+    Raises:
+        InvalidGtinError: 数字以外を含む・桁数が不正・チェックデジット不一致の場合
+    """
+    return _normalize(code.strip())
+
+
+def gtin_key(jan_code: str) -> int:
+    """正規化済みのJANコードを jan_url_mapping.gtin（BIGINT）の値に変換する"""
+    return int(jan_code)
+
+
+def jan_code_from_key(gtin: int) -> str:
+    """jan_url_mapping.gtin（BIGINT）の値を13桁のJANコードに戻す"""
+    return str(gtin).zfill(13)
+
+
+def is_valid_gtin(code: str) -> bool:
+    """JAN / GTIN コードとして有効か判定する"""
+    try:
+        _normalize(code.strip())
+    except InvalidGtinError:
+        return False
+    return True
+
+
+def normalize_batch(codes: Iterable[str]) -> List[Optional[str]]:
+    """
+    大量のコードをまとめて検証・正規化する（ベクトル化版）
+
+    形式チェックを通ったコードを14桁に0埋めして1つのバイト列に連結し、桁位置ごとのスライスを
+    bytes.translate でウェイト付きの値に変換した後、多倍長整数として加算する。
+    各バイトの値は最大 13 × 9 = 117 で桁あふれしないため、1回の整数加算で全コードの
+    桁ごとの合計を同時に計算でき、チェックデジットの検証にコードごとのPythonレベルの演算を要しない。
+
+    Args:
+        codes: JAN / GTIN コードのイテラブル
+
+    Returns:
+        List[Optional[str]]: 入力と同じ順序の正規化済みJANコード（不正なコードはNone）
+    """
+    padded: List[Optional[str]] = []
+    for code in codes:
+        code = code.strip()
+        if len(code) in GTIN_LENGTHS and code.isascii() and code.isdigit():
+            padded.append(code.zfill(14))
+        else:
+            padded.append(None)
+
+    shaped = [code for code in padded if code is not None]
+    if not shaped:
+        return [None] * len(padded)
+
+    blob = "".join(shaped).encode("ascii")
+    count = len(shaped)
+    total = 0
+    for position in range(13):
+        total += int.from_bytes(blob[position::14].translate(_WEIGHTED[position % 2]), "big")
+    expected = total.to_bytes(count, "big").translate(_CHECK_DIGIT)
+    mismatched = (int.from_bytes(expected, "big") ^ int.from_bytes(blob[13::14], "big")).to_bytes(count, "big")
+
+    results: List[Optional[str]] = []
+    index = 0
+    for code in padded:
+        if code is None:
+            results.append(None)
+            continue
+        # 14桁に0埋めした先頭が0でなければ、インジケータ付きのGTIN-14
+        valid = not mismatched[index] and code[0] == "0"
+        results.append(code[1:] if valid else None)
+        index += 1
+    return results
@@ -0,0 +1,86 @@
+from typing import Optional
+import hashlib
+import os
+
+from .schemas import JanBatchResponse, JanUrlMappingRecord
+
+# HTTPキャッシュ設定（ブラウザ・CloudFront・API Gatewayでのレスポンス再利用）
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "60"))
+HTTP_CACHE_STALE_WHILE_REVALIDATE = int(os.getenv("HTTP_CACHE_STALE_WHILE_REVALIDATE", "300"))
+HTTP_CACHE_NEGATIVE_MAX_AGE = int(os.getenv("HTTP_CACHE_NEGATIVE_MAX_AGE", "10"))
+HTTP_CACHE_INVALID_MAX_AGE = int(os.getenv("HTTP_CACHE_INVALID_MAX_AGE", "86400"))
+
+
+def etag_for(mapping: JanUrlMappingRecord) -> str:
+    """jan_code と updated_at から強いETagを生成する"""
+    version = int(mapping.updated_at.timestamp() * 1_000_000) if mapping.updated_at else 0
+    return f'"{mapping.jan_code}-{version:x}"'
+
+
+def etag_for_batch(response: JanBatchResponse) -> str:
+    """
+    バッチ変換の結果から強いETagを生成する
+
+    指定されたコードごとに、見つかったマッピングのETag（jan_code と updated_at）・未登録・不正のいずれかを順にハッシュする。
+    """
+    digest = hashlib.sha256()
+    for code, mapping in response.found.items():
+        digest.update(f"found\0{code}\0{etag_for(mapping)}\n".encode())
+    for code in response.missing:
+        digest.update(f"missing\0{code}\n".encode())
+    for code in response.invalid:
+        digest.update(f"invalid\0{code}\n".encode())
+    return f'"batch-{digest.hexdigest()[:32]}"'
+
+
+def cache_control_for_hit() -> str:
+    """登録済みJANのレスポンスに付与するCache-Control"""
+    if HTTP_CACHE_MAX_AGE <= 0:
+        return "no-cache"
+    return f"public, max-age={HTTP_CACHE_MAX_AGE}, stale-while-revalidate={HTTP_CACHE_STALE_WHILE_REVALIDATE}"
+
+
+def cache_control_for_miss() -> str:
+    """未登録JAN（404）のレスポンスに付与するCache-Control"""
+    if HTTP_CACHE_NEGATIVE_MAX_AGE <= 0:
+        return "no-cache"
+    return f"public, max-age={HTTP_CACHE_NEGATIVE_MAX_AGE}"
+
+
+def cache_control_for_invalid() -> str:
+    """不正なJANコード（422）のレスポンスに付与するCache-Control（不正なコードは後から有効にならない）"""
+    if HTTP_CACHE_INVALID_MAX_AGE <= 0:
+        return "no-cache"
+    return f"public, max-age={HTTP_CACHE_INVALID_MAX_AGE}"
+
+
+def cache_control_for_batch(response: JanBatchResponse) -> str:
+    """
+    バッチ変換のレスポンスに付与するCache-Control
+
+    未登録のコードを含む場合は、後から登録されうるため未登録JANと同じ短い期間にする。
+    """
+    if response.missing:
+        return cache_control_for_miss()
+    if response.found:
+        return cache_control_for_hit()
+    return cache_control_for_invalid()
+
+
+def is_not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Match ヘッダがETagに一致するか判定する
+
+    If-None-Match は弱い比較で判定するため、W/ プレフィックスは無視する。
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
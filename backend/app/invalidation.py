@@ -0,0 +1,229 @@
+"""
+変更の通知（LISTEN / NOTIFY）によるプロセス内キャッシュの破棄
+
+jan_url_mapping の変更はコミット時に jan_url_mapping_changed チャネルへ通知される（db/migrations/0004_change_notify.sql）。
+専用の接続で LISTEN し、通知されたJANコードのエントリをプロセス内キャッシュから破棄する（任意で読み直す）。
+これによりキャッシュのTTLを長くしても、他のプロセス・一括インポートでの変更がすぐに反映される。
+
+- 一括インポートなどで通知が続く場合は CACHE_INVALIDATION_BATCH_MS の間まとめてから1回だけ反映する
+- まとめたJANコードが CACHE_INVALIDATION_MAX_KEYS を超えた場合・'*'（1文で多数の変更、TRUNCATE）を受けた場合は全件を破棄する
+- 接続が切れている間の通知は届かないため、再接続したときは全件を破棄する
+"""
+from typing import Callable, Dict, Optional, Set
+import logging
+import os
+import select
+import threading
+import time
+
+from .database import dedicated_connection
+from .lookup import apply_remote_changes
+
+logger = logging.getLogger(__name__)
+
+# 変更の通知を LISTEN してキャッシュを破棄する（uvicorn などコンテナ常駐実行向け、プロセスごとに1本の接続を保持する）
+CACHE_INVALIDATION_LISTEN = os.getenv("CACHE_INVALIDATION_LISTEN", "false").lower() == "true"
+# 通知をまとめる時間（最初の通知からこの時間の間に届いた通知を1回で反映する）
+CACHE_INVALIDATION_BATCH_MS = float(os.getenv("CACHE_INVALIDATION_BATCH_MS", "50"))
+# 1回に個別に破棄するJANコードの上限（超えた場合は全件を破棄する）
+CACHE_INVALIDATION_MAX_KEYS = int(os.getenv("CACHE_INVALIDATION_MAX_KEYS", "10000"))
+# 破棄したエントリのうちキャッシュにあったものを読み直す（次のリクエストでのキャッシュミスを避ける）
+CACHE_INVALIDATION_REFRESH = os.getenv("CACHE_INVALIDATION_REFRESH", "false").lower() == "true"
+# 接続に失敗した・切れた場合に再接続するまでの秒数
+CACHE_INVALIDATION_RECONNECT_SECONDS = float(os.getenv("CACHE_INVALIDATION_RECONNECT_SECONDS", "5"))
+
+CHANNEL = "jan_url_mapping_changed"
+# 全件の変更を表すペイロード
+ALL_CHANGED = "*"
+
+
+def parse_payload(payload: str) -> Optional[Set[str]]:
+    """
+    通知のペイロード（カンマ区切りのJANコード）を解析する
+
+    Returns:
+        Optional[Set[str]]: 変更されたJANコード（'*' の場合はNone、解析できないコードは無視する）
+    """
+    if payload.strip() == ALL_CHANGED:
+        return None
+    jan_codes = set()
+    for code in payload.split(","):
+        code = code.strip()
+        # DBの値をそのまま破棄する（チェックディジットは検証しない）
+        if len(code) == 13 and code.isdigit():
+            jan_codes.add(code)
+        elif code:
+            logger.warning("Ignoring malformed jan_code in change notification: %r", code)
+    return jan_codes
+
+
+class ChangeBatch:
+    """
+    通知をまとめて1回の破棄にする
+
+    Args:
+        max_keys: 個別に保持するJANコードの上限（超えた場合は全件の変更として扱う）
+    """
+
+    def __init__(self, max_keys: int = CACHE_INVALIDATION_MAX_KEYS) -> None:
+        self.max_keys = max_keys
+        self.jan_codes: Set[str] = set()
+        self.all_changed = False
+
+    def add(self, payload: str) -> None:
+        if self.all_changed:
+            return
+        jan_codes = parse_payload(payload)
+        if jan_codes is None or len(self.jan_codes) + len(jan_codes) > self.max_keys:
+            self.mark_all_changed()
+        else:
+            self.jan_codes.update(jan_codes)
+
+    def mark_all_changed(self) -> None:
+        self.all_changed = True
+        self.jan_codes = set()
+
+    def __bool__(self) -> bool:
+        return self.all_changed or bool(self.jan_codes)
+
+    def changes(self) -> Optional[Set[str]]:
+        """破棄するJANコード（全件の場合はNone）"""
+        return None if self.all_changed else self.jan_codes
+
+
+class InvalidationListener:
+    """
+    変更の通知を受けてプロセス内キャッシュを破棄するデーモンスレッド
+
+    Args:
+        connect: DBAPI接続（psycopg2）を返す関数（SQLAlchemy のプール経由の接続も可）
+        apply: 変更されたJANコード（全件の場合はNone）を受け取って反映する関数
+        batch_seconds: 通知をまとめる秒数
+        max_keys: 1回に個別に破棄するJANコードの上限
+        refresh: 破棄したエントリを読み直すか
+        reconnect_seconds: 再接続するまでの秒数
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], object] = dedicated_connection,
+        apply: Callable[..., int] = apply_remote_changes,
+        batch_seconds: float = CACHE_INVALIDATION_BATCH_MS / 1000,
+        max_keys: int = CACHE_INVALIDATION_MAX_KEYS,
+        refresh: bool = CACHE_INVALIDATION_REFRESH,
+        reconnect_seconds: float = CACHE_INVALIDATION_RECONNECT_SECONDS,
+    ) -> None:
+        self._connect = connect
+        self._apply = apply
+        self.batch_seconds = batch_seconds
+        self.max_keys = max_keys
+        self.refresh = refresh
+        self.reconnect_seconds = reconnect_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.connected = False
+        self.connects = 0
+        self.notifications = 0
+        self.batches = 0
+        self.keys = 0
+        self.full_flushes = 0
+        self.evicted = 0
+        self.errors = 0
+
+    def start(self) -> None:
+        """スレッドを開始する（開始済みの場合は何もしない）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="cache-invalidation", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def flush(self, batch: ChangeBatch) -> None:
+        """まとめた変更をキャッシュに反映する"""
+        if not batch:
+            return
+        changes = batch.changes()
+        evicted = self._apply(changes, refresh=self.refresh)
+        with self._lock:
+            self.batches += 1
+            self.evicted += evicted
+            if changes is None:
+                self.full_flushes += 1
+            else:
+                self.keys += len(changes)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception:
+                self.errors += 1
+                logger.exception("Cache invalidation listener failed; reconnecting in %.1fs", self.reconnect_seconds)
+            finally:
+                self.connected = False
+            self._stop.wait(self.reconnect_seconds)
+
+    def _listen(self) -> None:
+        conn = self._connect()
+        try:
+            dbapi = getattr(conn, "dbapi_connection", conn)
+            dbapi.autocommit = True
+            with dbapi.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            self.connected = True
+            self.connects += 1
+            if self.connects > 1:
+                # 切断中の通知は届かないため、再接続時は全件を破棄する
+                batch = ChangeBatch(self.max_keys)
+                batch.mark_all_changed()
+                self.flush(batch)
+            self._poll(dbapi)
+        except BaseException:
+            # 切断された接続はプールのリセット（ROLLBACK）をせずに破棄する
+            getattr(conn, "invalidate", conn.close)()
+            raise
+        conn.close()
+
+    def _poll(self, dbapi) -> None:
+        batch = ChangeBatch(self.max_keys)
+        deadline = None
+        while not self._stop.is_set():
+            # 通知待ちの間も停止を確認できるよう、待ち時間は最長1秒
+            timeout = 1.0 if deadline is None else max(0.0, deadline - time.monotonic())
+            if select.select([dbapi], [], [], timeout)[0]:
+                dbapi.poll()
+                while dbapi.notifies:
+                    notify = dbapi.notifies.pop(0)
+                    batch.add(notify.payload)
+                    self.notifications += 1
+                    if deadline is None:
+                        deadline = time.monotonic() + self.batch_seconds
+            if deadline is not None and time.monotonic() >= deadline:
+                self.flush(batch)
+                batch = ChangeBatch(self.max_keys)
+                deadline = None
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "enabled": self._thread is not None and self._thread.is_alive(),
+                "connected": self.connected,
+                "reconnects": max(0, self.connects - 1),
+                "notifications": self.notifications,
+                "batches": self.batches,
+                "keys": self.keys,
+                "full_flushes": self.full_flushes,
+                "evicted": self.evicted,
+                "errors": self.errors,
+            }
+
+
+invalidation_listener = InvalidationListener()
@@ -0,0 +1,484 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import select, bindparam, any_, func, BigInteger
+from sqlalchemy.dialects.postgresql import ARRAY
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from .bloom import jan_code_filter
+from .cache import LookupCache, MISSING
+from .circuit_breaker import db_breaker
+from .database import JanLookupStatsModel, JanUrlMappingModel
+from .gtin import gtin_key, jan_code_from_key
+from .routing import read_connection_scope, async_read_connection_scope, write_tracker
+from .schemas import JanUrlMappingRecord
+from .shared_cache import shared_cache
+from .single_flight import AsyncSingleFlight, SingleFlight
+from .snapshot import get_snapshot
+from .timing import stage
+
+logger = logging.getLogger(__name__)
+
+# ルックアップキャッシュ設定（ApiStackから環境変数で指定）
+LOOKUP_CACHE_ENABLED = os.getenv("LOOKUP_CACHE_ENABLED", "true").lower() == "true"
+LOOKUP_CACHE_MAX_ENTRIES = int(os.getenv("LOOKUP_CACHE_MAX_ENTRIES", "10000"))
+LOOKUP_CACHE_TTL_SECONDS = float(os.getenv("LOOKUP_CACHE_TTL_SECONDS", "300"))
+LOOKUP_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("LOOKUP_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+# 失効後も保持して古い値を返す期間（stale-while-revalidate、0で無効）
+LOOKUP_CACHE_STALE_TTL_SECONDS = float(os.getenv("LOOKUP_CACHE_STALE_TTL_SECONDS", "0"))
+# 古い値を返したエントリをバックグラウンドで再取得するスレッド数（同期ハンドラ用）
+LOOKUP_REFRESH_WORKERS = int(os.getenv("LOOKUP_REFRESH_WORKERS", "2"))
+# コールドスタート時（初期化中）にキャッシュへ読み込む、ヒット件数の多いマッピングの件数（0で無効、jan_lookup_stats が必要）
+LOOKUP_WARMUP_ENTRIES = int(os.getenv("LOOKUP_WARMUP_ENTRIES", "0"))
+# ウォームアップの対象にする、最後のヒットからの日数（人気の無くなったJANコードを読み込まない）
+LOOKUP_WARMUP_WINDOW_DAYS = int(os.getenv("LOOKUP_WARMUP_WINDOW_DAYS", "7"))
+
+# プロセス内キャッシュ（ウォームなLambdaコンテナ間で再利用される）
+lookup_cache = LookupCache(
+    max_entries=LOOKUP_CACHE_MAX_ENTRIES,
+    ttl=LOOKUP_CACHE_TTL_SECONDS,
+    negative_ttl=LOOKUP_CACHE_NEGATIVE_TTL_SECONDS,
+    stale_ttl=LOOKUP_CACHE_STALE_TTL_SECONDS,
+    enabled=LOOKUP_CACHE_ENABLED,
+)
+
+# 同じJANコードの同時のキャッシュミスを1回のDB問い合わせにまとめる（同期ハンドラ用・非同期ハンドラ用）
+LOOKUP_SINGLE_FLIGHT_ENABLED = os.getenv("LOOKUP_SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+lookup_flight = SingleFlight()
+async_lookup_flight = AsyncSingleFlight()
+
+
+# 主キーのインデックスにINCLUDEされた列だけを参照し、Index Only Scan で解決する
+_mapping_table = JanUrlMappingModel.__table__
+MAPPING_COLUMNS = (
+    _mapping_table.c.gtin,
+    _mapping_table.c.url,
+    _mapping_table.c.brand,
+    _mapping_table.c.product_name,
+    _mapping_table.c.updated_at,
+)
+
+# ルックアップの文はモジュールで1度だけ組み立てる（ORMを経由しないCoreの文のため、
+# コンパイル結果はエンジンのキャッシュでそのまま再利用される）
+LOOKUP_STATEMENT = select(*MAPPING_COLUMNS).where(_mapping_table.c.gtin == bindparam("gtin"))
+BATCH_LOOKUP_STATEMENT = select(*MAPPING_COLUMNS).where(
+    _mapping_table.c.gtin == any_(bindparam("codes", type_=ARRAY(BigInteger)))
+)
+
+# 直近にヒットしたマッピングをヒット件数の多い順に読む（lookups の降順インデックス + 主キーでの結合）
+_stats_table = JanLookupStatsModel.__table__
+WARM_UP_STATEMENT = (
+    select(*MAPPING_COLUMNS)
+    .join(_stats_table, _stats_table.c.gtin == _mapping_table.c.gtin)
+    .where(_stats_table.c.last_lookup_at >= func.localtimestamp() - func.make_interval(0, 0, 0, bindparam("days")))
+    .order_by(_stats_table.c.lookups.desc())
+    .limit(bindparam("limit"))
+)
+
+
+def _to_record(row) -> JanUrlMappingRecord:
+    return JanUrlMappingRecord(
+        jan_code=jan_code_from_key(row.gtin),
+        url=row.url,
+        brand=row.brand,
+        product_name=row.product_name,
+        updated_at=row.updated_at,
+    )
+
+
+# このプロセスで書き込んだ・変更の通知を受けたJANコード（スナップショットの値は古いため、以降はDBから読む）
+_written_since_snapshot = set()
+# 一括の変更の通知（'*'）を受けた後はスナップショット全体を参照しない
+_snapshot_invalidated = False
+
+
+def _from_snapshot(jan_code: str) -> Optional[JanUrlMappingRecord]:
+    """スナップショットインデックスから引く（スナップショットが無い・見つからない・書き込み済みの場合はNone）"""
+    snapshot = get_snapshot()
+    if snapshot is None or _snapshot_invalidated or jan_code in _written_since_snapshot:
+        return None
+    return snapshot.get(jan_code)
+
+
+def single_flight_stats() -> Dict[str, Dict[str, int]]:
+    """single-flight の集約件数（leader: DBへ問い合わせた件数、coalesced: 実行中の問い合わせの結果を共有した件数）"""
+    return {"sync": lookup_flight.stats(), "async": async_lookup_flight.stats(), "enabled": LOOKUP_SINGLE_FLIGHT_ENABLED}
+
+
+def invalidate_mappings(jan_codes: Iterable[str]) -> None:
+    """
+    書き込んだJANコードのキャッシュ（共有キャッシュを含む）を破棄し、以降のルックアップでスナップショットを参照しないようにする
+    （実行中の問い合わせは書き込み前の値を返しうるため、以降のルックアップでは共有しない）。
+    追加された行を404にしないよう、登録済みJANコードのブルームフィルタにも追加する。
+
+    Args:
+        jan_codes: 書き込んだ正規化済みのJANコード
+    """
+    jan_codes = list(jan_codes)
+    jan_code_filter.add(jan_codes)
+    for jan_code in jan_codes:
+        lookup_cache.invalidate(jan_code)
+        lookup_flight.forget(jan_code)
+        async_lookup_flight.forget(jan_code)
+        if get_snapshot() is not None:
+            _written_since_snapshot.add(jan_code)
+    shared_cache.delete_many(jan_codes)
+
+
+def apply_remote_changes(jan_codes: Optional[Iterable[str]], refresh: bool = False) -> int:
+    """
+    他のプロセスでの変更（LISTEN / NOTIFY の通知）をプロセス内キャッシュに反映する
+
+    変更されたJANコードは書き込みと同じく DB_READ_YOUR_WRITES_SECONDS の間ライターから読む
+    （通知はコミット時に届くため、リーダーのレプリケーション遅延で古い値を読み直さないようにする）。
+
+    Args:
+        jan_codes: 変更されたJANコード（Noneの場合は全件が変更された可能性があり、共有キャッシュの世代も進め、
+            ブルームフィルタはキャッチアップが終わるまで参照しない）
+        refresh: 破棄したエントリのうちキャッシュにあったものを、1回のクエリで読み直すか
+
+    Returns:
+        int: 破棄したエントリ数
+    """
+    global _snapshot_invalidated
+    if jan_codes is None:
+        write_tracker.record(None)
+        evicted = len(lookup_cache)
+        lookup_cache.clear()
+        shared_cache.flush()
+        jan_code_filter.mark_stale()
+        if get_snapshot() is not None:
+            _snapshot_invalidated = True
+        return evicted
+
+    jan_codes = list(jan_codes)
+    write_tracker.record(jan_codes)
+    cached = [jan_code for jan_code in jan_codes if jan_code in lookup_cache]
+    invalidate_mappings(jan_codes)
+    if refresh and cached:
+        _load_mappings(cached)
+    return len(cached)
+
+
+def warm_up_cache(limit: int = LOOKUP_WARMUP_ENTRIES, window_days: int = LOOKUP_WARMUP_WINDOW_DAYS) -> int:
+    """
+    ヒット件数の多いマッピングを1回のクエリで読み、プロセス内キャッシュに入れる（コールドスタート時の初期化で呼ぶ）
+
+    LRUで最後まで残るよう、件数の少ない順にキャッシュへ入れる。失敗しても起動は止めず、0件として扱う。
+
+    Args:
+        limit: 読み込む件数（LOOKUP_CACHE_MAX_ENTRIES が上限）
+        window_days: 最後のヒットからこの日数以内のJANコードだけを読む
+
+    Returns:
+        int: キャッシュに入れた件数
+    """
+    limit = min(limit, lookup_cache.max_entries)
+    if limit <= 0 or not lookup_cache.enabled:
+        return 0
+    started = time.perf_counter()
+    epoch = lookup_cache.epoch
+    try:
+        with read_connection_scope() as conn:
+            records = [_to_record(row) for row in conn.execute(WARM_UP_STATEMENT, {"days": window_days, "limit": limit})]
+    except Exception:
+        _warm_up_stats.update(failed=True, elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+        logger.exception("Cache warm-up failed; starting with an empty cache")
+        return 0
+    for record in reversed(records):
+        lookup_cache.set(record.jan_code, record, epoch)
+    _warm_up_stats.update(entries=len(records), failed=False, elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+    return len(records)
+
+
+_warm_up_stats = {"entries": 0, "failed": False, "elapsed_ms": 0.0}
+
+
+def warm_up_stats() -> Dict[str, object]:
+    """コールドスタート時のウォームアップでキャッシュに入れた件数・所要時間"""
+    return {"limit": LOOKUP_WARMUP_ENTRIES, **_warm_up_stats}
+
+
+def fetch_mapping(jan_code: str) -> Optional[JanUrlMappingRecord]:
+    """
+    JANコードに対応するマッピングを取得する（キャッシュ → ブルームフィルタ → スナップショット → 共有キャッシュ → DB の順）
+
+    キャッシュまたはスナップショットにヒットした場合、ブルームフィルタで登録されていないことが確実な場合はDB接続を取得しない。
+    失効後 LOOKUP_CACHE_STALE_TTL_SECONDS 以内のエントリは古い値をそのまま返し、バックグラウンドで再取得する
+    （DBのサーキットブレーカーが開いている間は再取得せず、古い値を返し続ける）。
+    同じJANコードの問い合わせが実行中の場合は新たに問い合わせず、その結果を共有する（single-flight、
+    共有した側のリクエストには query などの段階は記録されない）。
+    DBはORMセッションを経由せず、Coreの接続で LOOKUP_STATEMENT を実行してリーダーから読む（このプロセスで直近に書き込んだJANコードはライターから読む）。
+    各段階（cache / bloom / snapshot / l2 / checkout / query / hydrate）の所要時間は Server-Timing に記録される。
+
+    Args:
+        jan_code: 正規化済みのJANコード（13桁）
+
+    Returns:
+        Optional[JanUrlMappingRecord]: マッピング情報（存在しない場合はNone）
+    """
+    with stage("cache"):
+        # キャッシュを引く前の epoch（以降にこのJANコードが破棄されたら、読んだ値をキャッシュに入れない）
+        epoch = lookup_cache.epoch
+        cached = lookup_cache.get(jan_code)
+        if cached is MISSING:
+            cached = lookup_cache.get_stale(jan_code)
+            if cached is not MISSING:
+                _refresh_in_background([jan_code])
+    if cached is not MISSING:
+        return cached
+
+    with stage("bloom"):
+        absent = jan_code_filter.definitely_absent(jan_code)
+    if absent:
+        return None
+
+    with stage("snapshot"):
+        value = _from_snapshot(jan_code)
+    if value is not None:
+        return value
+
+    if not LOOKUP_SINGLE_FLIGHT_ENABLED:
+        return _query_mapping(jan_code, epoch)
+    return lookup_flight.do(jan_code, lambda: _query_mapping(jan_code, epoch))
+
+
+def _query_mapping(jan_code: str, epoch: Optional[int] = None) -> Optional[JanUrlMappingRecord]:
+    """
+    共有キャッシュ・DBから引いてキャッシュに入れる（single-flight の leader だけが実行する）
+
+    Args:
+        jan_code: 正規化済みのJANコード（13桁）
+        epoch: 呼び出し側がキャッシュを引く前に取得した lookup_cache.epoch（省略時は現在の値）
+    """
+    if epoch is None:
+        epoch = lookup_cache.epoch
+    if shared_cache.enabled:
+        with stage("l2"):
+            value = shared_cache.get(jan_code)
+        if value is not MISSING:
+            lookup_cache.set(jan_code, value, epoch)
+            return value
+
+    with read_connection_scope([jan_code]) as conn:
+        with stage("query"):
+            row = conn.execute(LOOKUP_STATEMENT, {"gtin": gtin_key(jan_code)}).one_or_none()
+        with stage("hydrate"):
+            value = _to_record(row) if row else None
+
+    lookup_cache.set(jan_code, value, epoch)
+    if shared_cache.enabled and not lookup_cache.invalidated_since(jan_code, epoch):
+        shared_cache.set(jan_code, value)
+    return value
+
+
+async def fetch_mapping_async(jan_code: str) -> Optional[JanUrlMappingRecord]:
+    """
+    fetch_mapping の非同期版（DB_ASYNC=true の場合に使用）
+
+    single-flight はイベントループ内のタスク同士でまとめる（問い合わせは leader のリクエストのタスクとは別のタスクで実行する）。
+
+    Args:
+        jan_code: 正規化済みのJANコード（13桁）
+
+    Returns:
+        Optional[JanUrlMappingRecord]: マッピング情報（存在しない場合はNone）
+    """
+    with stage("cache"):
+        epoch = lookup_cache.epoch
+        cached = lookup_cache.get(jan_code)
+        if cached is MISSING:
+            cached = lookup_cache.get_stale(jan_code)
+            if cached is not MISSING:
+                _refresh_in_background_async(jan_code)
+    if cached is not MISSING:
+        return cached
+
+    with stage("bloom"):
+        absent = jan_code_filter.definitely_absent(jan_code)
+    if absent:
+        return None
+
+    with stage("snapshot"):
+        value = _from_snapshot(jan_code)
+    if value is not None:
+        return value
+
+    if not LOOKUP_SINGLE_FLIGHT_ENABLED:
+        return await _query_mapping_async(jan_code, epoch)
+    return await async_lookup_flight.do(jan_code, lambda: _query_mapping_async(jan_code, epoch))
+
+
+async def _query_mapping_async(jan_code: str, epoch: Optional[int] = None) -> Optional[JanUrlMappingRecord]:
+    """_query_mapping の非同期版"""
+    if epoch is None:
+        epoch = lookup_cache.epoch
+    if shared_cache.enabled:
+        with stage("l2"):
+            value = await shared_cache.get_async(jan_code)
+        if value is not MISSING:
+            lookup_cache.set(jan_code, value, epoch)
+            return value
+
+    async with async_read_connection_scope([jan_code]) as conn:
+        with stage("query"):
+            row = (await conn.execute(LOOKUP_STATEMENT, {"gtin": gtin_key(jan_code)})).one_or_none()
+        with stage("hydrate"):
+            value = _to_record(row) if row else None
+
+    lookup_cache.set(jan_code, value, epoch)
+    if shared_cache.enabled and not lookup_cache.invalidated_since(jan_code, epoch):
+        await shared_cache.set_async(jan_code, value)
+    return value
+
+
+def fetch_mappings(jan_codes: List[str]) -> Dict[str, JanUrlMappingRecord]:
+    """
+    複数のJANコードに対応するマッピングをまとめて取得する（キャッシュ・スナップショット優先）
+
+    ブルームフィルタで登録されていないことが確実なJANコードは引かない。キャッシュ・スナップショットのどちらにも無いJANコードは共有キャッシュから1回の MGET で引き、残りのみを1回のクエリ（gtin = ANY(:codes)）で解決する。
+    失効後 LOOKUP_CACHE_STALE_TTL_SECONDS 以内のエントリは古い値を使い、まとめてバックグラウンドで再取得する。
+
+    Args:
+        jan_codes: 重複のない正規化済みJANコードのリスト
+
+    Returns:
+        Dict[str, JanUrlMappingRecord]: 見つかったJANコードをキーとしたマッピング
+    """
+    found: Dict[str, JanUrlMappingRecord] = {}
+    uncached: List[str] = []
+    stale: List[str] = []
+    for code in jan_codes:
+        value = lookup_cache.get(code)
+        if value is MISSING:
+            value = lookup_cache.get_stale(code)
+            if value is not MISSING:
+                stale.append(code)
+            elif jan_code_filter.definitely_absent(code):
+                continue
+            else:
+                value = _from_snapshot(code)
+                if value is None:
+                    uncached.append(code)
+        if value is not None and value is not MISSING:
+            found[code] = value
+
+    if stale:
+        _refresh_in_background(stale)
+    if uncached:
+        found.update(_resolve_mappings(uncached))
+
+    return found
+
+
+def _resolve_mappings(jan_codes: List[str]) -> Dict[str, JanUrlMappingRecord]:
+    """複数のJANコードを共有キャッシュ（1回の MGET）、残りをDB（1回のクエリ）から引き、キャッシュに入れる"""
+    found: Dict[str, JanUrlMappingRecord] = {}
+    if shared_cache.enabled:
+        epoch = lookup_cache.epoch
+        shared = shared_cache.get_many(jan_codes)
+        for code, value in shared.items():
+            lookup_cache.set(code, value, epoch)
+            if value is not None:
+                found[code] = value
+        jan_codes = [code for code in jan_codes if code not in shared]
+    if jan_codes:
+        found.update(_load_mappings(jan_codes))
+    return found
+
+
+def _load_mappings(jan_codes: List[str]) -> Dict[str, JanUrlMappingRecord]:
+    """
+    複数のJANコードを1回のクエリでDBから引き、結果（存在しないものはネガティブキャッシュ）をキャッシュ・共有キャッシュに入れる
+
+    読んでいる間に破棄（書き込み・変更の通知）されたJANコードは、読んだ値をキャッシュに入れない。
+    """
+    epoch = lookup_cache.epoch
+    with read_connection_scope(jan_codes) as conn:
+        result = conn.execute(BATCH_LOOKUP_STATEMENT, {"codes": [gtin_key(code) for code in jan_codes]})
+        rows = {record.jan_code: record for record in map(_to_record, result)}
+
+    for code in jan_codes:
+        lookup_cache.set(code, rows.get(code), epoch)
+    if shared_cache.enabled:
+        current = [code for code in jan_codes if not lookup_cache.invalidated_since(code, epoch)]
+        shared_cache.set_many({code: rows.get(code) for code in current})
+    return rows
+
+
+# バックグラウンドの再取得（stale-while-revalidate）
+# 再取得中のJANコードは重複して再取得しない。Lambdaではレスポンス後にコンテナが凍結されるため、
+# 再取得は次の呼び出しの間に完了することがある（その間も古い値を返す）
+_refresh_executor = ThreadPoolExecutor(max_workers=max(1, LOOKUP_REFRESH_WORKERS), thread_name_prefix="lookup-refresh")
+_refresh_lock = threading.Lock()
+_refreshing = set()
+_refresh_tasks = set()
+_refresh_counts = {"scheduled": 0, "completed": 0, "failed": 0, "skipped": 0}
+
+
+def _claim_refresh(jan_codes: List[str]) -> List[str]:
+    """再取得中でないJANコードを再取得中として登録する（ブレーカーが開いている間は再取得しない）"""
+    with _refresh_lock:
+        if db_breaker.is_open():
+            _refresh_counts["skipped"] += len(jan_codes)
+            return []
+        claimed = [code for code in jan_codes if code not in _refreshing]
+        _refreshing.update(claimed)
+        _refresh_counts["scheduled"] += len(claimed)
+        return claimed
+
+
+def _release_refresh(jan_codes: List[str], ok: bool) -> None:
+    with _refresh_lock:
+        _refreshing.difference_update(jan_codes)
+        _refresh_counts["completed" if ok else "failed"] += len(jan_codes)
+
+
+def _refresh(jan_codes: List[str]) -> None:
+    ok = False
+    try:
+        _resolve_mappings(jan_codes)
+        ok = True
+    except Exception:
+        # DBに接続できない失敗はブレーカーに記録済み。エントリは古いまま残り、次のリクエストで再試行する
+        pass
+    finally:
+        _release_refresh(jan_codes, ok)
+
+
+def _refresh_in_background(jan_codes: List[str]) -> None:
+    """古い値を返したエントリをスレッドプールで再取得する"""
+    claimed = _claim_refresh(jan_codes)
+    if claimed:
+        _refresh_executor.submit(_refresh, claimed)
+
+
+async def _refresh_async(jan_code: str) -> None:
+    ok = False
+    try:
+        await _query_mapping_async(jan_code)
+        ok = True
+    except Exception:
+        pass
+    finally:
+        _release_refresh([jan_code], ok)
+
+
+def _refresh_in_background_async(jan_code: str) -> None:
+    """_refresh_in_background の非同期版（イベントループのタスクで再取得する）"""
+    if not _claim_refresh([jan_code]):
+        return
+    # リクエストの段階別計測（contextvars）を引き継がないよう、空のコンテキストでタスクを作る
+    task = asyncio.get_running_loop().create_task(_refresh_async(jan_code), context=contextvars.Context())
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+def stale_refresh_stats() -> Dict[str, int]:
+    """バックグラウンドの再取得の件数（scheduled / completed / failed、ブレーカーが開いていて見送った skipped）"""
+    with _refresh_lock:
+        return {**_refresh_counts, "in_progress": len(_refreshing)}
@@ -1,11 +1,70 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from typing import List, Optional
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+import math
+import os
+import urllib.parse
 
-from .database import get_db, JanUrlMappingModel
+from .auth import require_write_api_key
+from .bloom import jan_code_filter
+from .circuit_breaker import CircuitOpenError, db_breaker
+from .database import get_db, get_async_db, get_reader_engine, get_async_reader_engine, DATABASE_READER_URL, DB_ASYNC
+from .encoding import encode_mapping
+from .export import export_chunks, MEDIA_TYPES
+from .gtin import InvalidGtinError, normalize_batch, normalize_gtin
+from .http_cache import (
+    cache_control_for_batch,
+    cache_control_for_hit,
+    cache_control_for_invalid,
+    cache_control_for_miss,
+    etag_for,
+    etag_for_batch,
+    is_not_modified,
+)
+from .invalidation import CACHE_INVALIDATION_LISTEN, invalidation_listener
+from .lookup import (
+    LOOKUP_WARMUP_ENTRIES,
+    fetch_mapping,
+    fetch_mapping_async,
+    fetch_mappings,
+    lookup_cache,
+    single_flight_stats,
+    stale_refresh_stats,
+    warm_up_cache,
+    warm_up_stats,
+)
+from .popularity import LOOKUP_STATS_ENABLED, lookup_stats
+from .schemas import (
+    MAX_BATCH_SIZE,
+    JanUrlMapping,
+    JanUrlMappingRecord,
+    JanBatchRequest,
+    JanBatchResponse,
+    MappingUpsert,
+    MappingBulkUpsertRequest,
+    MappingBulkUpsertResponse,
+    MappingUpsertResult,
+    MappingSearchResponse,
+)
+from .search import search_mappings
+from .shared_cache import shared_cache
+from .routing import routing_stats
+from .snapshot import get_snapshot
+from .upsert import upsert_mappings
+from .timing import TIMING_ENABLED, TimingMiddleware, mark_handler_done, stage, timed_handler, timing_stats
+
+# /r/{jan} で未登録・不正なJANコードのリダイレクト先（{jan} はスキャンしたコードに置き換える、未設定なら404/422）
+REDIRECT_FALLBACK_URL = os.getenv("REDIRECT_FALLBACK_URL") or None
+
+# 検索で1ページに返す最大件数
+MAX_SEARCH_LIMIT = int(os.getenv("MAX_SEARCH_LIMIT", "100"))
+
+# 一括書き込みで一度に受け付ける最大件数
+MAX_UPSERT_ITEMS = int(os.getenv("MAX_UPSERT_ITEMS", "10000"))
 
 app = FastAPI(title="JAN-URL Conversion API", version="1.0.0")
 
@@ -18,15 +77,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 段階別レイテンシの計測（Server-Timing ヘッダ + EMF、無効時はミドルウェア自体を登録しない）
+if TIMING_ENABLED:
+    app.add_middleware(TimingMiddleware)
+
+# 変更の通知（LISTEN / NOTIFY）によるキャッシュの破棄（プロセスごとに1本の接続を保持するデーモンスレッド）
+if CACHE_INVALIDATION_LISTEN:
+    invalidation_listener.start()
+
+# ルックアップのヒット件数の集計（メモリ上で数え、デーモンスレッドが jan_lookup_stats へまとめて書き込む）
+if LOOKUP_STATS_ENABLED:
+    lookup_stats.start()
 
-class JanUrlMapping(BaseModel):
-    jan_code: str
-    url: str
-    brand: Optional[str] = None
-    product_name: Optional[str] = None
+# コールドスタート時にヒット件数の多いマッピングをキャッシュへ読み込む（Lambdaでは初期化フェーズで実行される）
+if LOOKUP_WARMUP_ENTRIES > 0:
+    warm_up_cache()
 
-    class Config:
-        from_attributes = True
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    """DBのサーキットブレーカーが開いている間、キャッシュに無い読み取り・書き込みは接続を待たずに503を返す"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database temporarily unavailable"},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after))), "Cache-Control": "no-store"},
+    )
 
 
 @app.get("/")
@@ -35,43 +110,408 @@ def read_root():
     return {"message": "JAN-URL Conversion API", "status": "healthy"}
 
 
-@app.get("/api/convert", response_model=JanUrlMapping)
-def convert_jan_to_url(jan: str, db: Session = Depends(get_db)):
+def _normalize_or_422(jan: str) -> str:
+    """
+    JANコードを検証・正規化する（不正な場合はDBに問い合わせずに422を返す）
+
+    EAN-8 / UPC-A / GTIN-14 は13桁のJANコードに正規化する。
+    """
+    try:
+        return normalize_gtin(jan)
+    except InvalidGtinError as e:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Invalid JAN code '{jan}': {e}",
+            headers={"Cache-Control": cache_control_for_invalid()},
+        )
+
+
+def _convert_response(jan: str, mapping: Optional[JanUrlMappingRecord], request: Request) -> Response:
+    """
+    ルックアップ結果をHTTPキャッシュヘッダ付きのレスポンスにする（同期版・非同期版共通）
+
+    If-None-Match がETagに一致する場合はボディをシリアライズせずに304を返す。
+    ボディは encode_mapping で直接バイト列にし、response_model による再検証を省く
+    （response_model はOpenAPIスキーマのためにルートへ登録したまま）。
+    """
+    mark_handler_done()
+    if not mapping:
+        raise HTTPException(
+            status_code=404,
+            detail=f"JAN code '{jan}' not found",
+            headers={"Cache-Control": cache_control_for_miss()},
+        )
+    lookup_stats.record(mapping.jan_code)
+
+    etag = etag_for(mapping)
+    cache_control = cache_control_for_hit()
+    if is_not_modified(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+    return Response(
+        content=encode_mapping(mapping),
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": cache_control},
+    )
+
+
+def convert_jan_to_url(jan: str, request: Request):
     """
     JANコードからURLに変換するAPI
 
     Args:
-        jan: JANコード（13桁）
-        db: データベースセッション
+        jan: JANコード（13桁、EAN-8 / UPC-A / GTIN-14 も可）
+        request: リクエスト（If-None-Match の参照用）
 
     Returns:
         JanUrlMapping: JAN-URLマッピング情報
     """
-    result = db.execute(
-        select(JanUrlMappingModel).where(JanUrlMappingModel.jan_code == jan)
-    )
-    mapping = result.scalar_one_or_none()
+    with stage("normalize"):
+        jan_code = _normalize_or_422(jan)
+    return _convert_response(jan, fetch_mapping(jan_code), request)
+
 
+async def convert_jan_to_url_async(jan: str, request: Request):
+    """
+    JANコードからURLに変換するAPI（非同期版、DB_ASYNC=true の場合に使用）
+
+    Args:
+        jan: JANコード（13桁、EAN-8 / UPC-A / GTIN-14 も可）
+        request: リクエスト（If-None-Match の参照用）
+
+    Returns:
+        JanUrlMapping: JAN-URLマッピング情報
+    """
+    with stage("normalize"):
+        jan_code = _normalize_or_422(jan)
+    return _convert_response(jan, await fetch_mapping_async(jan_code), request)
+
+
+def _redirect_fallback(jan: str, status_code: int, detail: str, cache_control: str) -> Response:
+    """未登録・不正なJANコードを REDIRECT_FALLBACK_URL へリダイレクトする（未設定の場合は /api/convert と同じエラー）"""
+    if REDIRECT_FALLBACK_URL is None:
+        raise HTTPException(status_code=status_code, detail=detail, headers={"Cache-Control": cache_control})
+    url = REDIRECT_FALLBACK_URL.replace("{jan}", urllib.parse.quote(jan, safe=""))
+    return RedirectResponse(url, status_code=302, headers={"Cache-Control": cache_control})
+
+
+def _redirect_response(jan: str, mapping: Optional[JanUrlMappingRecord]) -> Response:
+    """
+    ルックアップ結果の url へ302でリダイレクトする（同期版・非同期版共通）
+
+    Cache-Control は /api/convert と同じで、CloudFront は /r/{jan} のパスをキーにリダイレクト自体をキャッシュする。
+    """
+    mark_handler_done()
     if not mapping:
+        return _redirect_fallback(jan, 404, f"JAN code '{jan}' not found", cache_control_for_miss())
+    lookup_stats.record(mapping.jan_code)
+    return RedirectResponse(mapping.url, status_code=302, headers={"Cache-Control": cache_control_for_hit()})
+
+
+def _normalize_for_redirect(jan: str):
+    """JANコードを正規化する（不正な場合はフォールバック先へのリダイレクトまたは422のレスポンスを返す）"""
+    try:
+        with stage("normalize"):
+            return normalize_gtin(jan), None
+    except InvalidGtinError as e:
+        return None, _redirect_fallback(jan, 422, f"Invalid JAN code '{jan}': {e}", cache_control_for_invalid())
+
+
+def redirect_jan(jan: str):
+    """
+    JANコードに対応する商品ページへ直接リダイレクトするAPI（スキャナー・QRコード向け）
+
+    Args:
+        jan: JANコード（13桁、EAN-8 / UPC-A / GTIN-14 も可）
+
+    Returns:
+        RedirectResponse: 商品ページ（未登録・不正な場合は REDIRECT_FALLBACK_URL）への302
+    """
+    jan_code, fallback = _normalize_for_redirect(jan)
+    if fallback is not None:
+        return fallback
+    return _redirect_response(jan, fetch_mapping(jan_code))
+
+
+async def redirect_jan_async(jan: str):
+    """
+    JANコードに対応する商品ページへ直接リダイレクトするAPI（非同期版、DB_ASYNC=true の場合に使用）
+
+    Args:
+        jan: JANコード（13桁、EAN-8 / UPC-A / GTIN-14 も可）
+
+    Returns:
+        RedirectResponse: 商品ページ（未登録・不正な場合は REDIRECT_FALLBACK_URL）への302
+    """
+    jan_code, fallback = _normalize_for_redirect(jan)
+    if fallback is not None:
+        return fallback
+    return _redirect_response(jan, await fetch_mapping_async(jan_code))
+
+
+def _check_batch_size(count: int) -> None:
+    """重複の除去・正規化の前に、指定された件数（空文字・重複を含む）が MAX_BATCH_SIZE 以下か確かめる"""
+    if count > MAX_BATCH_SIZE:
         raise HTTPException(
-            status_code=404,
-            detail=f"JAN code '{jan}' not found"
+            status_code=413,
+            detail=f"Too many JAN codes: {count} (max {MAX_BATCH_SIZE})"
+        )
+
+
+def _resolve_batch(jan_codes: List[str]) -> JanBatchResponse:
+    """
+    複数のJANコードを検証・正規化し、有効なものを1回のクエリ（gtin = ANY(:codes)）でまとめて解決する
+
+    Args:
+        jan_codes: JANコードのリスト（重複は除去される）
+
+    Returns:
+        JanBatchResponse: 見つかったマッピング・見つからなかったJANコード・不正なJANコード
+            （いずれもリクエストで指定されたコードをキーとする）
+    """
+    _check_batch_size(len(jan_codes))
+    # 入力順を保ったまま重複・空文字を除去
+    codes = list(dict.fromkeys(code.strip() for code in jan_codes if code.strip()))
+
+    normalized = normalize_batch(codes)
+    valid = list(dict.fromkeys(jan for jan in normalized if jan is not None))
+    rows = fetch_mappings(valid) if valid else {}
+    lookup_stats.record_many(rows)
+
+    found = {code: rows[jan] for code, jan in zip(codes, normalized) if jan in rows}
+    missing = [code for code, jan in zip(codes, normalized) if jan is not None and jan not in rows]
+    invalid = [code for code, jan in zip(codes, normalized) if jan is None]
+    return JanBatchResponse(found=found, missing=missing, invalid=invalid)
+
+
+@app.post("/api/convert/batch", response_model=JanBatchResponse)
+def convert_jan_batch(request: JanBatchRequest):
+    """
+    複数のJANコードをまとめてURLに変換するAPI
+
+    Args:
+        request: 変換対象のJANコードのリスト
+
+    Returns:
+        JanBatchResponse: JANコードをキーとしたマッピングと未登録・不正なJANコードのリスト
+    """
+    return _resolve_batch(request.jan_codes)
+
+
+@app.get("/api/convert/batch", response_model=JanBatchResponse)
+def convert_jan_batch_get(jans: str, request: Request, response: Response):
+    """
+    複数のJANコードをまとめてURLに変換するAPI（キャッシュ可能なGET版）
+
+    1件のルックアップと同じく ETag / Cache-Control を付与し、If-None-Match が一致する場合は304を返す。
+
+    Args:
+        jans: カンマ区切りのJANコード（例: 4900000000009,4900000000016）
+        request: リクエスト（If-None-Match の参照用）
+        response: ETag / Cache-Control を設定するレスポンス
+
+    Returns:
+        JanBatchResponse: JANコードをキーとしたマッピングと未登録・不正なJANコードのリスト
+    """
+    # 分割する前に区切りの数で件数を確かめる
+    _check_batch_size(jans.count(",") + 1)
+    result = _resolve_batch(jans.split(","))
+
+    etag = etag_for_batch(result)
+    cache_control = cache_control_for_batch(result)
+    if is_not_modified(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    return result
+
+
+@app.get("/api/search", response_model=MappingSearchResponse)
+def search(
+    q: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_LIMIT),
+    after: Optional[str] = None,
+):
+    """
+    product_name / brand の部分一致でマッピングを検索するAPI（スコアの高い順）
+
+    Args:
+        q: 検索語（typoや語順の違いも近いものとしてヒットする）
+        limit: 1ページの件数
+        after: 次のページを取得する場合に、前のレスポンスの next_after を指定する
+
+    Returns:
+        MappingSearchResponse: 検索結果と次のページのカーソル
+    """
+    try:
+        return search_mappings(q.strip(), limit, after)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Invalid cursor '{after}'")
+
+
+@app.put(
+    "/api/mappings/{jan}",
+    response_model=MappingUpsertResult,
+    dependencies=[Depends(require_write_api_key)],
+)
+def put_mapping(jan: str, mapping: MappingUpsert, response: Response):
+    """
+    JANコードのマッピングを登録・更新するAPI（要 X-API-Key）
+
+    値が変化しない場合は更新しない（updated_at・ETagも変わらない）。
+
+    Args:
+        jan: JANコード（13桁、EAN-8 / UPC-A / GTIN-14 も可）
+        mapping: url / brand / product_name
+        response: レスポンス（新規登録時のステータスコードの設定用）
+
+    Returns:
+        MappingUpsertResult: 結果（created / updated / unchanged）
+    """
+    jan_code = _normalize_or_422(jan)
+    result = upsert_mappings([{"jan_code": jan_code, **mapping.model_dump()}])[0]
+    if result.status == "invalid":
+        raise HTTPException(status_code=422, detail=result.error)
+    result.jan_code = jan
+    if result.status == "created":
+        response.status_code = 201
+    return result
+
+
+@app.post(
+    "/api/mappings:bulkUpsert",
+    response_model=MappingBulkUpsertResponse,
+    dependencies=[Depends(require_write_api_key)],
+)
+def bulk_upsert_mappings(request: MappingBulkUpsertRequest):
+    """
+    複数のマッピングをまとめて登録・更新するAPI（要 X-API-Key）
+
+    有効な行は UPSERT_PAGE_SIZE 行ごとに1つのINSERT文で書き込み、全体を1トランザクションでコミットする。
+    不正な行は書き込まずに invalid として返す（他の行は書き込まれる）。
+
+    Args:
+        request: 登録・更新するマッピングのリスト
+
+    Returns:
+        MappingBulkUpsertResponse: 入力と同じ順序の結果と件数
+    """
+    if len(request.items) > MAX_UPSERT_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many items: {len(request.items)} (max {MAX_UPSERT_ITEMS})"
         )
 
-    return mapping
+    results = upsert_mappings([item.model_dump() for item in request.items])
+    counts = {status: 0 for status in ("created", "updated", "unchanged", "invalid")}
+    for result in results:
+        if result.status in counts:
+            counts[result.status] += 1
+    return MappingBulkUpsertResponse(results=results, **counts)
+
+
+@app.get("/api/export")
+def export_mappings(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    gzip: bool = False,
+    after_jan: Optional[str] = Query(None, pattern="^[0-9]{1,13}$"),
+):
+    """
+    JAN-URLマッピングを全件ストリーミング出力するAPI
+
+    Args:
+        format: 出力形式（ndjson / csv）
+        gzip: gzip圧縮して出力するか
+        after_jan: このJANコードより後ろから出力する（中断したエクスポートの再開用）
+
+    Returns:
+        StreamingResponse: jan_code順のNDJSON / CSV
+    """
+    filename = f"jan_url_mapping.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_chunks(fmt=format, compress=gzip, after_jan=after_jan),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/metrics")
+def read_metrics():
+    """プロセス内メトリクス（キャッシュのヒット/ミス/追い出し・古い値を返した件数、共有キャッシュのヒット/ミス/失敗件数、single-flight の集約件数、変更の通知による破棄、DBのサーキットブレーカーの状態、スナップショットの版、ブルームフィルタで404にした件数、ウォームアップ・ヒット件数の集計、読み取りの振り分け、段階別レイテンシなど）"""
+    snapshot = get_snapshot()
+    return {
+        "lookup_cache": lookup_cache.stats(),
+        "l2_cache": shared_cache.stats(),
+        "single_flight": single_flight_stats(),
+        "stale_refresh": stale_refresh_stats(),
+        "warm_up": warm_up_stats(),
+        "lookup_stats": lookup_stats.stats(),
+        "invalidation": invalidation_listener.stats(),
+        "circuit_breaker": db_breaker.stats(),
+        "snapshot": snapshot.stats() if snapshot is not None else None,
+        "bloom_filter": jan_code_filter.stats(),
+        "db_routing": routing_stats(),
+        "timing": timing_stats(),
+    }
 
 
-@app.get("/health")
 def health_check(db: Session = Depends(get_db)):
-    """ヘルスチェック用エンドポイント（DB接続確認含む）"""
+    """
+    ヘルスチェック用エンドポイント（DB接続確認含む、リーダーがある場合はリーダーも確認）
+
+    DBのサーキットブレーカーが開いている間は接続を試みずに503を返す。
+    """
     try:
         # DB接続確認
-        db.execute(select(1))
+        with db_breaker.guard():
+            db.execute(select(1))
+            if DATABASE_READER_URL:
+                with get_reader_engine().connect() as reader:
+                    reader.execute(select(1))
         return {"status": "ok", "database": "connected"}
+    except CircuitOpenError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Database connection failed: {str(e)}")
 
 
+async def health_check_async(db: AsyncSession = Depends(get_async_db)):
+    """ヘルスチェック用エンドポイント（DB接続確認含む、非同期版）"""
+    try:
+        # DB接続確認
+        with db_breaker.guard():
+            await db.execute(select(1))
+            if DATABASE_READER_URL:
+                async with get_async_reader_engine().connect() as reader:
+                    await reader.execute(select(1))
+        return {"status": "ok", "database": "connected"}
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database connection failed: {str(e)}")
+
+
+def _add_db_routes(target: FastAPI, use_async: bool) -> None:
+    """DBを読むルートに同期版（スレッドプール実行）/ 非同期版のハンドラを登録する"""
+    target.add_api_route(
+        "/api/convert",
+        convert_jan_to_url_async if use_async else convert_jan_to_url,
+        methods=["GET"],
+        response_model=JanUrlMapping,
+    )
+    target.add_api_route(
+        "/r/{jan}",
+        redirect_jan_async if use_async else redirect_jan,
+        methods=["GET"],
+        response_class=RedirectResponse,
+        status_code=302,
+    )
+    target.add_api_route("/health", health_check_async if use_async else health_check, methods=["GET"])
+
+
+_add_db_routes(app, DB_ASYNC)
+
+
 # Lambda用のハンドラー（Mangum使用）
 from mangum import Mangum
-handler = Mangum(app)
+handler = timed_handler(Mangum(app))
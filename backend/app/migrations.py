@@ -0,0 +1,154 @@
+"""
+スキーマのマイグレーション
+
+db/migrations/NNNN_name.sql を番号順に1ファイル1トランザクションで適用する。
+各ファイルは最後に自身のバージョンを schema_migrations へ記録する
+（psql・docker-entrypoint-initdb.d の init.sql・Aurora Query Editor から直接実行しても
+同じ状態になるようにするため）。
+
+使い方:
+    python -m app.migrations status
+    python -m app.migrations upgrade
+    python -m app.migrations upgrade --target 1
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Set
+import argparse
+import json
+import os
+import re
+import sys
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "db", "migrations")
+
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+# 複数のプロセスから同時に upgrade した場合に直列化するためのアドバイザリロックのキー
+ADVISORY_LOCK_KEY = 7212013
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    path: str
+
+    def read(self) -> str:
+        with open(self.path, "r", encoding="utf-8") as f:
+            return f.read()
+
+
+def discover(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    """マイグレーションファイルをバージョン順に列挙する"""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def applied_versions(cursor) -> Set[int]:
+    """適用済みのバージョン（schema_migrations が無い場合は空）"""
+    cursor.execute("SELECT to_regclass('schema_migrations')")
+    if cursor.fetchone()[0] is None:
+        return set()
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def upgrade(target: Optional[int] = None, directory: str = MIGRATIONS_DIR, vacuum: bool = True) -> List[Migration]:
+    """
+    未適用のマイグレーションを番号順に適用する
+
+    Args:
+        target: このバージョンまで適用する（省略時は最新まで）
+        directory: マイグレーションファイルのディレクトリ
+        vacuum: 1件以上適用した場合に VACUUM (ANALYZE) を実行するか
+
+    Returns:
+        List[Migration]: 今回適用したマイグレーション
+    """
+    from .database import get_engine
+
+    applied: List[Migration] = []
+    connection = get_engine().raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_KEY,))
+        connection.commit()
+        try:
+            done = applied_versions(cursor)
+            for migration in discover(directory):
+                if migration.version in done or (target is not None and migration.version > target):
+                    continue
+                try:
+                    cursor.execute(migration.read())
+                    if migration.version not in applied_versions(cursor):
+                        raise RuntimeError(
+                            f"Migration {migration.version:04d}_{migration.name} did not record itself in schema_migrations"
+                        )
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+                applied.append(migration)
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_KEY,))
+            connection.commit()
+
+        if applied and vacuum:
+            # VACUUM はトランザクション外でしか実行できない
+            connection.dbapi_connection.autocommit = True
+            try:
+                cursor.execute("VACUUM (ANALYZE)")
+            finally:
+                connection.dbapi_connection.autocommit = False
+    finally:
+        connection.close()
+    return applied
+
+
+def status(directory: str = MIGRATIONS_DIR) -> dict:
+    """適用済みバージョン・最新バージョン・モデルが対応するバージョンを返す"""
+    from .database import get_engine, SCHEMA_VERSION
+
+    connection = get_engine().raw_connection()
+    try:
+        done = applied_versions(connection.cursor())
+    finally:
+        connection.close()
+    migrations = discover(directory)
+    return {
+        "current": max(done) if done else 0,
+        "latest": migrations[-1].version if migrations else 0,
+        "model": SCHEMA_VERSION,
+        "pending": [f"{m.version:04d}_{m.name}" for m in migrations if m.version not in done],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Apply versioned SQL schema migrations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="show applied and pending migrations")
+    upgrade_parser = subparsers.add_parser("upgrade", help="apply pending migrations")
+    upgrade_parser.add_argument("--target", type=int, default=None, help="stop after this version")
+    upgrade_parser.add_argument("--no-vacuum", action="store_true", help="skip VACUUM (ANALYZE) after applying")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        print(json.dumps(status()))
+        return 0
+
+    for migration in upgrade(target=args.target, vacuum=not args.no_vacuum):
+        print(f"applied {migration.version:04d}_{migration.name}", file=sys.stderr)
+    print(json.dumps(status()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
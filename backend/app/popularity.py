@@ -0,0 +1,242 @@
+"""
+ルックアップのヒット件数の集計
+
+マッピングが見つかったルックアップ（/api/convert・/r/{jan}・バッチ変換、キャッシュヒット・304を含む）を
+リクエストの処理中はメモリ上の辞書で数えるだけにし、デーモンスレッドが LOOKUP_STATS_FLUSH_SECONDS ごとに
+1文の INSERT ... ON CONFLICT DO UPDATE（unnest）で jan_lookup_stats へまとめて加算する（db/migrations/0006_lookup_stats.sql）。
+集計結果はコールドスタート時のキャッシュのウォームアップ（lookup.warm_up_cache）で使う。
+
+- 数えているJANコードが LOOKUP_STATS_MAX_KEYS に達したら、次の間隔を待たずに書き込む（それまでの新しいJANコードは数えない）
+- 書き込みに失敗した件数は次の書き込みに持ち越し、連続して失敗した間は間隔を倍にしていく（最大 MAX_BACKOFF_FACTOR 倍）。
+  DBのサーキットブレーカーが開いている間は書き込まない
+- Lambdaでは凍結中はスレッドが止まるため、書き込みは呼び出しの間に行われる（破棄されたコンテナの未書き込み分は失われる）
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import atexit
+import logging
+import os
+import threading
+import time
+
+from .gtin import gtin_key
+
+logger = logging.getLogger(__name__)
+
+# ヒット件数を集計する（jan_lookup_stats が必要）
+LOOKUP_STATS_ENABLED = os.getenv("LOOKUP_STATS_ENABLED", "false").lower() == "true"
+# jan_lookup_stats へ書き込む間隔
+LOOKUP_STATS_FLUSH_SECONDS = float(os.getenv("LOOKUP_STATS_FLUSH_SECONDS", "60"))
+# メモリ上で数えるJANコードの上限（1回の書き込みの行数の上限）
+LOOKUP_STATS_MAX_KEYS = int(os.getenv("LOOKUP_STATS_MAX_KEYS", "10000"))
+# 書き込みに連続して失敗した場合の待ち時間の上限（LOOKUP_STATS_FLUSH_SECONDS の倍数）
+MAX_BACKOFF_FACTOR = 16
+
+# gtin 順にロックを取り、複数のプロセスの同時の書き込み同士がデッドロックしないようにする
+UPSERT_STATS_SQL = """
+    INSERT INTO jan_lookup_stats AS stats (gtin, lookups, first_lookup_at, last_lookup_at)
+    SELECT counted.gtin, counted.lookups, localtimestamp, localtimestamp
+    FROM unnest(%s::bigint[], %s::bigint[]) AS counted(gtin, lookups)
+    ORDER BY counted.gtin
+    ON CONFLICT (gtin) DO UPDATE
+    SET lookups = stats.lookups + EXCLUDED.lookups,
+        last_lookup_at = EXCLUDED.last_lookup_at
+"""
+
+
+def db_available() -> bool:
+    """DBのサーキットブレーカーが開いていないか（開いている間は書き込みを試みない）"""
+    from .circuit_breaker import db_breaker
+
+    return not db_breaker.is_open()
+
+
+def upsert_stats(counts: List[Tuple[int, int]]) -> None:
+    """
+    (gtin, 件数) のリストを1文で jan_lookup_stats に加算する（ライター）
+
+    Args:
+        counts: gtin 順の (gtin, 件数) のリスト
+    """
+    from .circuit_breaker import db_breaker
+    from .database import get_engine
+
+    with db_breaker.guard():
+        connection = get_engine().raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(UPSERT_STATS_SQL, ([gtin for gtin, _ in counts], [count for _, count in counts]))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+
+class LookupStatsRecorder:
+    """
+    ヒット件数をメモリ上で数え、定期的にまとめて書き込むレコーダー
+
+    Args:
+        enabled: Falseの場合 record は何もしない
+        flush_seconds: 書き込む間隔（秒）
+        max_keys: メモリ上で数えるJANコードの上限
+        write: gtin 順の (gtin, 件数) のリストを書き込む関数
+        available: 書き込めるか（Falseの間は定期の書き込みを見送る）
+    """
+
+    def __init__(
+        self,
+        enabled: bool = LOOKUP_STATS_ENABLED,
+        flush_seconds: float = LOOKUP_STATS_FLUSH_SECONDS,
+        max_keys: int = LOOKUP_STATS_MAX_KEYS,
+        write: Callable[[List[Tuple[int, int]]], None] = upsert_stats,
+        available: Callable[[], bool] = db_available,
+    ) -> None:
+        self.enabled = enabled
+        self.flush_seconds = flush_seconds
+        self.max_keys = max_keys
+        self._write = write
+        self._available = available
+        self._lock = threading.Lock()
+        # 書き込みを直列化する（定期の書き込みと終了時の書き込みが重ならないようにする）
+        self._flush_lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.recorded = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.errors = 0
+        self.skipped = 0
+        self.last_flush_ms = 0.0
+        # 連続して失敗した回数（定期の書き込みの間隔を延ばす）
+        self._failures = 0
+
+    def record(self, jan_code: str) -> None:
+        """マッピングが見つかったルックアップを1件数える"""
+        if not self.enabled:
+            return
+        with self._lock:
+            count = self._counts.get(jan_code)
+            if count is None:
+                if len(self._counts) >= self.max_keys:
+                    self.dropped += 1
+                    return
+                # 上限に達したときに1回だけ書き込みのスレッドを起こす（数えなかった件数ごとには起こさない）
+                if len(self._counts) + 1 >= self.max_keys:
+                    self._wake.set()
+            self._counts[jan_code] = (count or 0) + 1
+            self.recorded += 1
+
+    def record_many(self, jan_codes: Iterable[str]) -> None:
+        """複数のルックアップを数える（バッチ変換用）"""
+        if not self.enabled:
+            return
+        for jan_code in jan_codes:
+            self.record(jan_code)
+
+    def flush(self) -> int:
+        """
+        数えた件数を書き込む（失敗した場合は次の書き込みに持ち越して例外を送出する）
+
+        Returns:
+            int: 書き込んだ行数
+        """
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts = self._counts, {}
+            if not counts:
+                return 0
+            started = time.perf_counter()
+            try:
+                self._write(sorted((gtin_key(jan_code), count) for jan_code, count in counts.items()))
+            except Exception:
+                self._restore(counts)
+                with self._lock:
+                    self.errors += 1
+                raise
+            with self._lock:
+                self.flushes += 1
+                self.rows_written += len(counts)
+                self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+            return len(counts)
+
+    def _restore(self, counts: Dict[str, int]) -> None:
+        """書き込めなかった件数を戻す（上限を超える分は捨てる）"""
+        with self._lock:
+            for jan_code, count in counts.items():
+                if jan_code in self._counts or len(self._counts) < self.max_keys:
+                    self._counts[jan_code] = self._counts.get(jan_code, 0) + count
+                else:
+                    self.dropped += count
+
+    def start(self) -> None:
+        """書き込みのスレッドを開始する（プロセスの終了時に残りを書き込む）"""
+        with self._lock:
+            if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="lookup-stats", daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """スレッドを止め、残りを書き込む"""
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Failed to flush lookup stats on shutdown")
+
+    def _delay(self) -> float:
+        """次の定期の書き込みまでの秒数（連続して失敗した間は倍にしていく）"""
+        return self.flush_seconds * min(2 ** self._failures, MAX_BACKOFF_FACTOR)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if self._failures:
+                # 失敗の後は上限に達しても早めず、待ち時間が過ぎるまで書き込まない
+                self._stop.wait(self._delay())
+            else:
+                self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            if not self._available():
+                with self._lock:
+                    self.skipped += 1
+                continue
+            try:
+                self.flush()
+            except Exception:
+                self._failures += 1
+                if self._failures == 1:
+                    logger.exception("Failed to flush lookup stats; retrying in %.1fs", self._delay())
+                else:
+                    logger.warning("Failed to flush lookup stats %d times in a row; retrying in %.1fs", self._failures, self._delay())
+            else:
+                self._failures = 0
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "pending_keys": len(self._counts),
+                "recorded": self.recorded,
+                "dropped": self.dropped,
+                "flushes": self.flushes,
+                "rows_written": self.rows_written,
+                "errors": self.errors,
+                "skipped": self.skipped,
+                "last_flush_ms": self.last_flush_ms,
+            }
+
+
+lookup_stats = LookupStatsRecorder()
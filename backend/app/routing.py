@@ -0,0 +1,235 @@
+"""
+読み取り・書き込みの接続先の振り分け
+
+- 読み取り（ルックアップ・エクスポート）はリーダー、書き込みはライターへ接続する
+- read-your-writes: このプロセスで書き込んだJANコードは DB_READ_YOUR_WRITES_SECONDS の間ライターから読む
+  （リーダーのレプリケーション遅延で、書き込み直後に古い値や404が返るのを避ける）
+- JANコードを指定しない書き込み（一括更新など）の後は、同じ期間すべての読み取りをライターへ向ける
+- いずれの接続もサーキットブレーカー（app/circuit_breaker.py）を通し、開いている間は接続せずに失敗させる
+
+記録はプロセス内のみ（Lambdaではコンテナごと）。別のコンテナで書き込んだ値は
+レプリケーション遅延（Auroraでは通常100ms未満）の後に見えるようになる。
+"""
+from collections import OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+from typing import Callable, Dict, Iterable, Optional
+import os
+import threading
+import time
+
+from .database import (
+    AsyncSessionLocal,
+    DATABASE_READER_URL,
+    SessionLocal,
+    get_async_engine,
+    get_async_reader_engine,
+    get_engine,
+    get_reader_engine,
+)
+from .circuit_breaker import db_breaker
+from .timing import stage
+
+# 書き込み後にライターから読む期間（秒）
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+
+# 個別に記録するJANコードの上限（超えた分は全体の読み取りをライターへ向ける扱いにする）
+DB_READ_YOUR_WRITES_MAX_KEYS = int(os.getenv("DB_READ_YOUR_WRITES_MAX_KEYS", "10000"))
+
+
+class WriteTracker:
+    """
+    直近に書き込んだJANコードを記録し、読み取りをライターへ向けるべきか判定する
+
+    Args:
+        window: 書き込み後にライターから読む期間（秒）
+        max_keys: 個別に記録するJANコードの上限
+        clock: 時刻関数（テスト用）
+    """
+
+    def __init__(
+        self,
+        window: float = 5.0,
+        max_keys: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.window = window
+        self.max_keys = max_keys
+        self._clock = clock
+        self._lock = threading.Lock()
+        # JANコード -> ライターから読む期限（期限の昇順に並ぶ）
+        self._keys: "OrderedDict[str, float]" = OrderedDict()
+        # すべての読み取りをライターへ向ける期限
+        self._all_until = 0.0
+        # いずれかの書き込みがあった場合にライターへ向ける期限（キーを指定しない読み取り用）
+        self._any_until = 0.0
+        self.reader_reads = 0
+        self.writer_reads = 0
+
+    def record(self, keys: Optional[Iterable[str]] = None) -> None:
+        """
+        書き込みを記録する
+
+        Args:
+            keys: 書き込んだJANコード（Noneの場合は全体に影響する書き込み）
+        """
+        now = self._clock()
+        until = now + self.window
+        with self._lock:
+            self._any_until = until
+            if keys is None:
+                self._all_until = until
+                return
+            for key in keys:
+                self._keys[key] = until
+                self._keys.move_to_end(key)
+            self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        while self._keys:
+            key, until = next(iter(self._keys.items()))
+            if until > now and len(self._keys) <= self.max_keys:
+                break
+            del self._keys[key]
+            if until > now:
+                # 上限を超えて追い出したキーは、期限まで全体をライターへ向けることで取りこぼさない
+                self._all_until = max(self._all_until, until)
+
+    def use_writer(self, keys: Optional[Iterable[str]] = None) -> bool:
+        """
+        読み取りをライターへ向けるべきか判定する
+
+        Args:
+            keys: 読み取るJANコード（Noneの場合は範囲の読み取り）
+
+        Returns:
+            bool: 直近の書き込みが読み取り対象に影響する場合はTrue
+        """
+        now = self._clock()
+        with self._lock:
+            if keys is None:
+                use_writer = self._any_until > now
+            else:
+                use_writer = self._all_until > now or any(self._keys.get(key, 0.0) > now for key in keys)
+            if use_writer:
+                self.writer_reads += 1
+            else:
+                self.reader_reads += 1
+            return use_writer
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "reader_reads": self.reader_reads,
+                "writer_reads": self.writer_reads,
+                "tracked_keys": len(self._keys),
+                "window_seconds": self.window,
+            }
+
+
+write_tracker = WriteTracker(window=DB_READ_YOUR_WRITES_SECONDS, max_keys=DB_READ_YOUR_WRITES_MAX_KEYS)
+
+
+@contextmanager
+def read_session_scope(keys: Optional[Iterable[str]] = None):
+    """
+    読み取り用のセッションを取得する（直近に書き込んだキーを含む場合はライター）
+
+    Args:
+        keys: 読み取るJANコード（Noneの場合は範囲の読み取り）
+    """
+    engine = get_engine() if write_tracker.use_writer(keys) else get_reader_engine()
+    with db_breaker.guard():
+        db = SessionLocal(bind=engine)
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+@asynccontextmanager
+async def async_read_session_scope(keys: Optional[Iterable[str]] = None):
+    """read_session_scope の非同期版"""
+    engine = get_async_engine() if write_tracker.use_writer(keys) else get_async_reader_engine()
+    with db_breaker.guard():
+        async with AsyncSessionLocal(bind=engine) as db:
+            yield db
+
+
+@contextmanager
+def read_connection_scope(keys: Optional[Iterable[str]] = None):
+    """
+    読み取り用のCore接続を取得する（ORMセッションを経由しないルックアップ用、振り分けは read_session_scope と同じ）
+
+    Args:
+        keys: 読み取るJANコード（Noneの場合は範囲の読み取り）
+    """
+    engine = get_engine() if write_tracker.use_writer(keys) else get_reader_engine()
+    with db_breaker.guard():
+        with stage("checkout"):
+            conn = engine.connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+@asynccontextmanager
+async def async_read_connection_scope(keys: Optional[Iterable[str]] = None):
+    """read_connection_scope の非同期版"""
+    engine = get_async_engine() if write_tracker.use_writer(keys) else get_async_reader_engine()
+    with db_breaker.guard():
+        with stage("checkout"):
+            conn = await engine.connect()
+        try:
+            yield conn
+        finally:
+            await conn.close()
+
+
+@contextmanager
+def write_session_scope(keys: Optional[Iterable[str]] = None):
+    """
+    書き込み用のセッションを取得する（ライター、正常終了時にコミットして書き込みを記録する）
+
+    Args:
+        keys: 書き込むJANコード（Noneの場合は全体に影響する書き込み）
+    """
+    with db_breaker.guard():
+        db = SessionLocal(bind=get_engine())
+        try:
+            yield db
+            db.commit()
+            write_tracker.record(keys)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+@contextmanager
+def write_connection_scope(keys: Optional[Iterable[str]] = None):
+    """
+    書き込み用のDBAPI接続を取得する（psycopg2 の execute_values などで一括書き込みする場合に使う）
+
+    振る舞いは write_session_scope と同じ（ライター、正常終了時にコミットして書き込みを記録する）。
+
+    Args:
+        keys: 書き込むJANコード（Noneの場合は全体に影響する書き込み）
+    """
+    with db_breaker.guard():
+        connection = get_engine().raw_connection()
+        try:
+            yield connection
+            connection.commit()
+            write_tracker.record(keys)
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+
+def routing_stats() -> Dict[str, object]:
+    """/metrics 用の振り分け状況"""
+    return {"reader_configured": DATABASE_READER_URL is not None, **write_tracker.stats()}
@@ -0,0 +1,73 @@
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from datetime import datetime
+import os
+
+# バッチ変換で一度に受け付けるJANコードの最大件数
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+
+
+class JanUrlMapping(BaseModel):
+    jan_code: str
+    url: str
+    brand: Optional[str] = None
+    product_name: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class JanUrlMappingRecord(JanUrlMapping):
+    """ルックアップ結果の内部表現（ETag生成用に updated_at を保持、レスポンスには含めない）"""
+    updated_at: Optional[datetime] = None
+
+
+class JanBatchRequest(BaseModel):
+    # 上限を超えるリストは重複の除去・正規化の前にリクエストの検証で拒否する
+    jan_codes: List[str] = Field(..., max_length=MAX_BATCH_SIZE)
+
+
+class JanBatchResponse(BaseModel):
+    found: Dict[str, JanUrlMapping]
+    missing: List[str]
+    invalid: List[str] = []
+
+
+class MappingUpsert(BaseModel):
+    url: str
+    brand: Optional[str] = None
+    product_name: Optional[str] = None
+
+
+class MappingUpsertItem(MappingUpsert):
+    jan_code: str
+
+
+class MappingBulkUpsertRequest(BaseModel):
+    items: List[MappingUpsertItem]
+
+
+class MappingUpsertResult(BaseModel):
+    """1件分の書き込み結果（status: created / updated / unchanged / invalid / superseded）"""
+    jan_code: str
+    status: str
+    normalized_jan_code: Optional[str] = None
+    error: Optional[str] = None
+
+
+class MappingBulkUpsertResponse(BaseModel):
+    results: List[MappingUpsertResult]
+    created: int
+    updated: int
+    unchanged: int
+    invalid: int
+
+
+class MappingSearchResult(JanUrlMapping):
+    """検索結果の1件（score: product_name / brand の word_similarity の大きい方）"""
+    score: float
+
+
+class MappingSearchResponse(BaseModel):
+    results: List[MappingSearchResult]
+    next_after: Optional[str] = None
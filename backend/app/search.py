@@ -0,0 +1,114 @@
+"""
+product_name / brand の部分一致検索（GET /api/search）
+
+pg_trgm の word_similarity で、検索語が product_name / brand のいずれかの語に近い行を探す
+（`<%` 演算子は 0003_trgm_search.sql の GIN インデックスで解決する）。
+スコア（2列の word_similarity の大きい方）の降順、同点は gtin の昇順に並べ、
+次のページは直前の最後の行の (スコア, JANコード) より後ろから取得する（keyset pagination）。
+OFFSET と異なり読み飛ばした行を返さないため、深いページでも1ページ目と同じコストで済む。
+"""
+from typing import List, Optional, Tuple
+
+from sqlalchemy import REAL, String, and_, bindparam, cast, func, or_, select
+
+from .database import JanUrlMappingModel
+from .gtin import gtin_key, jan_code_from_key
+from .lookup import MAPPING_COLUMNS
+from .routing import read_connection_scope
+from .schemas import MappingSearchResponse, MappingSearchResult
+from .timing import stage
+
+_mapping_table = JanUrlMappingModel.__table__
+_query = bindparam("q", type_=String)
+
+SCORE = func.greatest(
+    func.word_similarity(_query, _mapping_table.c.product_name),
+    func.word_similarity(_query, _mapping_table.c.brand),
+).label("score")
+
+_matched = (
+    select(*MAPPING_COLUMNS, SCORE)
+    .where(or_(_query.op("<%")(_mapping_table.c.product_name), _query.op("<%")(_mapping_table.c.brand)))
+    .subquery("matched")
+)
+
+# 1ページ目と2ページ目以降の文（いずれもモジュールで1度だけ組み立てる）
+SEARCH_STATEMENT = (
+    select(_matched)
+    .order_by(_matched.c.score.desc(), _matched.c.gtin)
+    .limit(bindparam("limit"))
+)
+SEARCH_AFTER_STATEMENT = (
+    select(_matched)
+    .where(or_(
+        _matched.c.score < cast(bindparam("after_score"), REAL),
+        and_(
+            _matched.c.score == cast(bindparam("after_score"), REAL),
+            _matched.c.gtin > bindparam("after_gtin"),
+        ),
+    ))
+    .order_by(_matched.c.score.desc(), _matched.c.gtin)
+    .limit(bindparam("limit"))
+)
+
+
+def encode_cursor(score: float, jan_code: str) -> str:
+    """ページの最後の行から次のページのカーソル（after）を作る"""
+    return f"{score!r}:{jan_code}"
+
+
+def decode_cursor(after: str) -> Tuple[float, int]:
+    """
+    カーソル（after）を (スコア, gtin) に戻す
+
+    Raises:
+        ValueError: カーソルの形式が不正な場合
+    """
+    score, _, jan_code = after.partition(":")
+    # 格納済みの行のキーをそのまま指すため、チェックデジットは検証しない
+    if not (jan_code.isdigit() and len(jan_code) <= 13):
+        raise ValueError(f"invalid cursor: {after!r}")
+    return float(score), gtin_key(jan_code)
+
+
+def search_mappings(query: str, limit: int, after: Optional[str] = None) -> MappingSearchResponse:
+    """
+    product_name / brand に検索語を含む（または近い）マッピングをスコア順に検索する
+
+    Args:
+        query: 検索語
+        limit: 1ページの件数
+        after: 前のページの next_after（省略時は1ページ目）
+
+    Returns:
+        MappingSearchResponse: 検索結果と次のページのカーソル（最後のページの場合はNone）
+
+    Raises:
+        ValueError: after の形式が不正な場合
+    """
+    params = {"q": query, "limit": limit + 1}
+    statement = SEARCH_STATEMENT
+    if after:
+        params["after_score"], params["after_gtin"] = decode_cursor(after)
+        statement = SEARCH_AFTER_STATEMENT
+
+    with read_connection_scope() as conn:
+        with stage("query"):
+            rows = conn.execute(statement, params).all()
+
+    # 1件多く取得し、次のページがあるかどうかを判定する
+    results: List[MappingSearchResult] = [
+        MappingSearchResult(
+            jan_code=jan_code_from_key(row.gtin),
+            url=row.url,
+            brand=row.brand,
+            product_name=row.product_name,
+            score=row.score,
+        )
+        for row in rows[:limit]
+    ]
+    next_after = None
+    if len(rows) > limit:
+        last = results[-1]
+        next_after = encode_cursor(last.score, last.jan_code)
+    return MappingSearchResponse(results=results, next_after=next_after)
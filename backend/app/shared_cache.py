@@ -0,0 +1,395 @@
+"""
+プロセス間で共有するルックアップキャッシュ（L2）
+
+プロセス内キャッシュ（L1、app/cache.py）はLambdaコンテナ・uvicornワーカーごとに空から始まるため、
+同時実行数が増えるほどDBへの問い合わせが増える。L1とDBの間にRedis互換のキャッシュ（ElastiCache / Valkey）を置き、
+あるプロセスがDBから読んだ結果を他のプロセスでも使えるようにする。
+
+- バックエンドは SharedCacheBackend を実装したもの（redis:// / rediss:// は RedisBackend、memory:// はテスト用の InMemoryBackend）
+- 値はスナップショットと同じバイナリ形式（app/snapshot.py の encode_record）に先頭1バイトの種別を付けたもの。
+  未登録のJANコードも NEGATIVE としてキャッシュする
+- バッチルックアップは1回の MGET、書き込みはパイプラインの1往復でまとめる
+- DBから読んだ値は SET NX で書き込み（キーがあれば書き込まない）、書き込み・変更の通知では削除する代わりに
+  L2_CACHE_TOMBSTONE_SECONDS の間 TOMBSTONE を置く。変更の前に（またはレプリケーションの遅れたリーダーから）
+  古い値を読んだ別のプロセスが、削除の後でその値をL2へ書き戻さないようにするため（TOMBSTONE はキャッシュミスとして扱う）
+- キーは世代番号を含む（{prefix}{世代}:{JANコード}）。一括インポートなど全件が変わりうる変更の後は世代を進め、
+  古い世代のエントリはTTLで消える。各プロセスは L2_CACHE_GENERATION_REFRESH_SECONDS ごとに世代を読み直す
+- L2に接続できない・タイムアウトした場合はDBから読む（連続して失敗した場合は一定時間L2を使わない）
+"""
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from .cache import MISSING
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .schemas import JanUrlMappingRecord
+from .snapshot import decode_record, encode_record
+
+logger = logging.getLogger(__name__)
+
+# 共有キャッシュの接続先（redis:// / rediss:// / memory://、未設定なら無効）
+L2_CACHE_URL = os.getenv("L2_CACHE_URL", "")
+L2_CACHE_TTL_SECONDS = int(os.getenv("L2_CACHE_TTL_SECONDS", "300"))
+L2_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("L2_CACHE_NEGATIVE_TTL_SECONDS", "60"))
+# 書き込み・変更の通知の後、DBから読んだ値をL2へ書き込ませない期間
+# （DB_READ_YOUR_WRITES_SECONDS・リーダーのレプリケーション遅延・1回の読み取りの所要時間より長くする）
+L2_CACHE_TOMBSTONE_SECONDS = int(os.getenv("L2_CACHE_TOMBSTONE_SECONDS", "30"))
+L2_CACHE_KEY_PREFIX = os.getenv("L2_CACHE_KEY_PREFIX", "bronzedraw:jan:v1:")
+# 1回の操作のタイムアウト（L2が遅い・落ちている場合にリクエストを待たせない）
+L2_CACHE_TIMEOUT_MS = float(os.getenv("L2_CACHE_TIMEOUT_MS", "100"))
+# 世代番号を読み直す間隔（他のプロセスが世代を進めてから反映されるまでの最大時間）
+L2_CACHE_GENERATION_REFRESH_SECONDS = float(os.getenv("L2_CACHE_GENERATION_REFRESH_SECONDS", "30"))
+# 連続してこの回数失敗したら L2_CACHE_RESET_SECONDS の間はL2を使わない
+L2_CACHE_FAILURE_THRESHOLD = int(os.getenv("L2_CACHE_FAILURE_THRESHOLD", "3"))
+L2_CACHE_RESET_SECONDS = float(os.getenv("L2_CACHE_RESET_SECONDS", "30"))
+
+# 値の種別（先頭1バイト）
+FOUND = b"\x01"
+NEGATIVE = b"\x00"
+TOMBSTONE = b"\x02"
+
+
+def encode_value(value: Optional[JanUrlMappingRecord]) -> bytes:
+    """ルックアップ結果（未登録はNone）をL2の値にエンコードする"""
+    if value is None:
+        return NEGATIVE
+    return FOUND + encode_record(value.url, value.brand, value.product_name, value.updated_at)
+
+
+def decode_value(jan_code: str, data: bytes) -> Optional[JanUrlMappingRecord]:
+    """encode_value でエンコードした値をデコードする（種別が不明な値は ValueError）"""
+    kind = data[:1]
+    if kind == NEGATIVE:
+        return None
+    if kind == FOUND:
+        return decode_record(data, 1, jan_code)
+    raise ValueError(f"Unknown shared cache value type: {kind!r}")
+
+
+class SharedCacheBackend(ABC):
+    """
+    共有キャッシュのバックエンド（Redis のコマンドに相当する操作）
+
+    各操作は1往復で実行すること。
+    """
+
+    @abstractmethod
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        """キーの値を順に返す（無いキーはNone、MGET に相当）"""
+
+    @abstractmethod
+    def set_many(self, items: List[Tuple[str, bytes, int]], only_if_absent: bool = False) -> None:
+        """
+        (キー, 値, TTL秒) をまとめて書き込む（SET EX のパイプラインに相当）
+
+        only_if_absent の場合、キーが既にあるものは書き込まない（SET EX NX に相当）。
+        """
+
+    @abstractmethod
+    def incr(self, key: str) -> int:
+        """キーの整数値を1増やして返す（INCR に相当）"""
+
+    def close(self) -> None:
+        pass
+
+
+class InMemoryBackend(SharedCacheBackend):
+    """
+    プロセス内の辞書によるバックエンド（テスト・ローカル確認用、プロセス間では共有されない）
+
+    Args:
+        clock: 時刻関数（テスト用）
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[float, bytes]] = {}
+        # 往復の回数（テスト・ベンチマーク用）
+        self.round_trips = 0
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        now = self._clock()
+        with self._lock:
+            self.round_trips += 1
+            values = []
+            for key in keys:
+                entry = self._entries.get(key)
+                values.append(entry[1] if entry is not None and entry[0] > now else None)
+            return values
+
+    def set_many(self, items: List[Tuple[str, bytes, int]], only_if_absent: bool = False) -> None:
+        now = self._clock()
+        with self._lock:
+            self.round_trips += 1
+            for key, value, ttl in items:
+                entry = self._entries.get(key)
+                if only_if_absent and entry is not None and entry[0] > now:
+                    continue
+                self._entries[key] = (now + ttl, value)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self.round_trips += 1
+            _, value = self._entries.get(key, (float("inf"), b"0"))
+            value = int(value) + 1
+            self._entries[key] = (float("inf"), str(value).encode())
+            return value
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend(SharedCacheBackend):
+    """
+    Redis プロトコルのバックエンド（ElastiCache / Valkey / Redis、redis-py を使用）
+
+    Args:
+        url: redis://host:6379/0、TLSの場合は rediss://
+        timeout: 接続・操作のタイムアウト（秒）
+    """
+
+    def __init__(self, url: str, timeout: float) -> None:
+        # redis-py は共有キャッシュを使う場合のみ必要なため、ここでインポートする
+        import redis
+
+        # 接続は最初の操作時に確立する（プールはスレッド間で共有される）
+        self._client = redis.Redis.from_url(
+            url,
+            socket_timeout=timeout,
+            socket_connect_timeout=timeout,
+            health_check_interval=30,
+        )
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        if len(keys) == 1:
+            return [self._client.get(keys[0])]
+        return self._client.mget(keys)
+
+    def set_many(self, items: List[Tuple[str, bytes, int]], only_if_absent: bool = False) -> None:
+        pipeline = self._client.pipeline(transaction=False)
+        for key, value, ttl in items:
+            pipeline.set(key, value, ex=ttl, nx=only_if_absent)
+        pipeline.execute()
+
+    def incr(self, key: str) -> int:
+        return int(self._client.incr(key))
+
+    def close(self) -> None:
+        self._client.close()
+
+
+class SharedCache:
+    """
+    ルックアップ結果の共有キャッシュ
+
+    バックエンドの例外は送出せずにキャッシュミス（書き込み・削除は何もしない）として扱い、件数を数える。
+
+    Args:
+        backend: バックエンド（Noneの場合は無効）
+        ttl: 登録済みJANのTTL（秒）
+        negative_ttl: 未登録JANのTTL（秒）
+        tombstone_ttl: 変更されたJANコードに置く TOMBSTONE のTTL（秒）
+        prefix: キーの接頭辞
+        generation_refresh: 世代番号を読み直す間隔（秒）
+        breaker: 連続した失敗でL2の利用を止めるサーキットブレーカー
+        clock: 時刻関数（テスト用）
+    """
+
+    def __init__(
+        self,
+        backend: Optional[SharedCacheBackend] = None,
+        ttl: int = 300,
+        negative_ttl: int = 60,
+        tombstone_ttl: int = 30,
+        prefix: str = "bronzedraw:jan:v1:",
+        generation_refresh: float = 30.0,
+        breaker: Optional[CircuitBreaker] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.tombstone_ttl = tombstone_ttl
+        self.prefix = prefix
+        self.generation_refresh = generation_refresh
+        self.breaker = breaker or CircuitBreaker()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._generation: Optional[int] = None
+        self._generation_checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.deletes = 0
+        self.flushes = 0
+        self.errors = 0
+        self.skipped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def _call(self, operation: str, fn: Callable, default):
+        """バックエンドの操作を実行する（ブレーカーが開いている・失敗した場合は default を返す）"""
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._count("skipped")
+            return default
+        try:
+            result = fn()
+        except Exception as e:
+            self.breaker.record_failure()
+            self._count("errors")
+            logger.warning("Shared cache %s failed: %s", operation, e)
+            return default
+        self.breaker.record_success()
+        return result
+
+    def _key_prefix(self) -> Optional[str]:
+        """現在の世代のキーの接頭辞（世代番号を読めない場合はNone）"""
+        now = self._clock()
+        with self._lock:
+            generation = self._generation
+            if generation is not None and now - self._generation_checked_at < self.generation_refresh:
+                return f"{self.prefix}{generation}:"
+        values = self._call("get generation", lambda: self.backend.get_many([self.prefix + "generation"]), None)
+        if values is None:
+            return None
+        generation = int(values[0] or 0)
+        with self._lock:
+            self._generation = generation
+            self._generation_checked_at = now
+        return f"{self.prefix}{generation}:"
+
+    def get_many(self, jan_codes: List[str]) -> Dict[str, Optional[JanUrlMappingRecord]]:
+        """
+        JANコードの値をまとめて取得する（1往復）
+
+        Returns:
+            Dict[str, Optional[JanUrlMappingRecord]]: L2にあったJANコードの値（未登録としてキャッシュされたものはNone、
+                TOMBSTONE は含まない）
+        """
+        if not self.enabled or not jan_codes:
+            return {}
+        prefix = self._key_prefix()
+        if prefix is None:
+            return {}
+        values = self._call("get", lambda: self.backend.get_many([prefix + code for code in jan_codes]), None)
+        if values is None:
+            return {}
+
+        found = {}
+        for code, data in zip(jan_codes, values):
+            if data is None or data[:1] == TOMBSTONE:
+                continue
+            try:
+                found[code] = decode_value(code, data)
+            except Exception:
+                logger.warning("Ignoring undecodable shared cache value for %s", code)
+        self._count("hits", len(found))
+        self._count("misses", len(jan_codes) - len(found))
+        return found
+
+    def get(self, jan_code: str):
+        """1件取得する（無い場合は MISSING、未登録としてキャッシュされている場合はNone）"""
+        return self.get_many([jan_code]).get(jan_code, MISSING)
+
+    def set_many(self, values: Dict[str, Optional[JanUrlMappingRecord]]) -> None:
+        """
+        DBから読んだ値（未登録はNone）をまとめて書き込む（1往復）
+
+        キーが既にある（他のプロセスが書き込んだ値・変更後の TOMBSTONE がある）JANコードは書き込まない。
+        """
+        if not self.enabled or not values:
+            return
+        prefix = self._key_prefix()
+        if prefix is None:
+            return
+        items = [
+            (prefix + code, encode_value(value), self.ttl if value is not None else self.negative_ttl)
+            for code, value in values.items()
+        ]
+        if self._call("set", lambda: self.backend.set_many(items, only_if_absent=True), False) is not False:
+            self._count("sets", len(items))
+
+    def set(self, jan_code: str, value: Optional[JanUrlMappingRecord]) -> None:
+        self.set_many({jan_code: value})
+
+    def delete_many(self, jan_codes: Iterable[str]) -> None:
+        """変更されたJANコードのエントリを TOMBSTONE で上書きする（tombstone_ttl の間はDBから読んだ値を書き込ませない）"""
+        jan_codes = list(jan_codes)
+        if not self.enabled or not jan_codes:
+            return
+        prefix = self._key_prefix()
+        if prefix is None:
+            return
+        items = [(prefix + code, TOMBSTONE, self.tombstone_ttl) for code in jan_codes]
+        if self._call("delete", lambda: self.backend.set_many(items), False) is not False:
+            self._count("deletes", len(jan_codes))
+
+    def flush(self) -> None:
+        """世代を進めてすべてのエントリを使わないようにする（古い世代のエントリはTTLで消える）"""
+        if not self.enabled:
+            return
+        generation = self._call("flush", lambda: self.backend.incr(self.prefix + "generation"), None)
+        if generation is None:
+            return
+        with self._lock:
+            self._generation = generation
+            self._generation_checked_at = self._clock()
+            self.flushes += 1
+
+    async def get_async(self, jan_code: str):
+        """get の非同期版（バックエンドの操作はスレッドで実行する）"""
+        return await asyncio.to_thread(self.get, jan_code)
+
+    async def set_async(self, jan_code: str, value: Optional[JanUrlMappingRecord]) -> None:
+        await asyncio.to_thread(self.set, jan_code, value)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "backend": type(self.backend).__name__ if self.backend is not None else None,
+                "generation": self._generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "sets": self.sets,
+                "deletes": self.deletes,
+                "flushes": self.flushes,
+                "errors": self.errors,
+                "skipped": self.skipped,
+                "breaker": self.breaker.state,
+            }
+
+
+def create_backend(url: str, timeout: float = L2_CACHE_TIMEOUT_MS / 1000) -> Optional[SharedCacheBackend]:
+    """接続先のURLからバックエンドを作成する（空文字の場合はNone）"""
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return InMemoryBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url, timeout)
+    raise ValueError(f"Unsupported L2_CACHE_URL scheme: {url}")
+
+
+shared_cache = SharedCache(
+    backend=create_backend(L2_CACHE_URL),
+    ttl=L2_CACHE_TTL_SECONDS,
+    negative_ttl=L2_CACHE_NEGATIVE_TTL_SECONDS,
+    tombstone_ttl=L2_CACHE_TOMBSTONE_SECONDS,
+    prefix=L2_CACHE_KEY_PREFIX,
+    generation_refresh=L2_CACHE_GENERATION_REFRESH_SECONDS,
+    breaker=CircuitBreaker(failure_threshold=L2_CACHE_FAILURE_THRESHOLD, reset_timeout=L2_CACHE_RESET_SECONDS),
+)
@@ -0,0 +1,134 @@
+"""
+同じキーに対する同時実行の集約（single-flight）
+
+同じJANコードのルックアップがキャッシュミスのまま同時に届いた場合、最初の1件（leader）だけがDBへ問い合わせ、
+実行中に届いた残り（coalesced）はその結果を待って共有する。
+完了した呼び出しは保持しない（結果の再利用はルックアップキャッシュの役割）。
+
+- SingleFlight: 同期ハンドラ（スレッドプール）用。待機はスレッドのイベントで行う
+- AsyncSingleFlight: 非同期ハンドラ用。leader の処理をタスクとして実行し、各呼び出しは shield して待つ
+  （待っている側のリクエストがキャンセルされても、共有中の問い合わせは中断しない）。
+  forget は変更の通知を受けるスレッドからも呼ばれるため、実行中のタスクの辞書はロックで保護する
+"""
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.value: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """同期処理の single-flight（スレッドセーフ）"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        key の処理が実行中ならその結果を待って返し、そうでなければ fn を実行する
+
+        Args:
+            key: 集約するキー
+            fn: 実行する処理
+
+        Returns:
+            fn の戻り値（fn が例外を送出した場合は待っていた呼び出しにも同じ例外を送出する）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.event.set()
+
+    def forget(self, key: Hashable) -> None:
+        """実行中の key を切り離し、以降の呼び出しで新たに実行させる（書き込み後など）"""
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """非同期処理の single-flight（イベントループごとに集約する）"""
+
+    def __init__(self) -> None:
+        # イベントループのスレッドと forget を呼ぶスレッド（変更の通知など）の両方から更新する
+        self._lock = threading.Lock()
+        self._tasks: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        key の処理が実行中ならその結果を待って返し、そうでなければ fn() を実行する
+
+        Args:
+            key: 集約するキー
+            fn: 実行するコルーチン関数
+
+        Returns:
+            fn() の戻り値
+        """
+        task_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is not None:
+                self.coalesced += 1
+        if task is None:
+            # タスクの作成（fn() の呼び出し）はロックの外で行い、登録だけをロックする
+            task = asyncio.ensure_future(fn())
+            with self._lock:
+                self.leaders += 1
+                self._tasks[task_key] = task
+
+            def _done(finished: asyncio.Future) -> None:
+                with self._lock:
+                    if self._tasks.get(task_key) is finished:
+                        del self._tasks[task_key]
+
+            task.add_done_callback(_done)
+        return await asyncio.shield(task)
+
+    def forget(self, key: Hashable) -> None:
+        """実行中の key を切り離し、以降の呼び出しで新たに実行させる（書き込み後など、任意のスレッドから呼べる）"""
+        with self._lock:
+            for task_key in [task_key for task_key in self._tasks if task_key[1] == key]:
+                del self._tasks[task_key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._tasks)}
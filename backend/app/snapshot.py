@@ -0,0 +1,359 @@
+"""
+JAN-URLマッピングのスナップショットインデックス
+
+jan_url_mapping をコンパクトなバイナリファイルに書き出し、読み込み側は mmap して
+二分探索（O(log n)）で引く。行ごとのPythonオブジェクトは生成せず、ヒットした1件だけを
+デコードするため、行数に関わらずメモリ使用量（RSS）はアクセスしたページ分に限られる。
+夜間のカタログ投入後にスナップショットを作り直す運用を想定し、
+スナップショットに無いJANコード（作成後に追加された行など）はDBへフォールバックする。
+
+ファイル形式（リトルエンディアン）:
+    header  : magic(8) / format_version(u32) / reserved(u32) / count(u64) /
+              built_at(i64, UNIX秒) / blob_size(u64) / 0埋め（計 HEADER_SIZE バイト）
+    keys    : u64 × count（昇順、上位8bitに桁数・下位56bitにJANコードの数値）
+    offsets : u64 × (count + 1)（blob内の各レコードの開始位置）
+    blob    : レコードの連結
+              updated_at(i64, 1970-01-01からのマイクロ秒) / url長(u32) /
+              brand長(u16) / product_name長(u16) / 各UTF-8バイト列（NULLは長さ 0xFFFF）
+
+使い方:
+    python -m app.snapshot build jan_url_mapping.snap
+    python -m app.snapshot info jan_url_mapping.snap
+    python -m app.snapshot get jan_url_mapping.snap 4571657070839
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import argparse
+import array
+import bisect
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import text
+
+from .gtin import jan_code_from_key
+from .schemas import JanUrlMappingRecord
+
+MAGIC = b"BZSNAP\x00\x00"
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct("<8sIIQqQ")
+HEADER_SIZE = 64
+RECORD_HEADER = struct.Struct("<qIHH")
+
+NULL_LENGTH = 0xFFFF
+NULL_UPDATED_AT = -(2 ** 63)
+EPOCH = datetime(1970, 1, 1)
+
+# JANコードの桁数を上位8bitに持たせ、先頭0の有無が異なるコードを区別する
+KEY_VALUE_BITS = 56
+MAX_KEY_DIGITS = 15
+
+# Lambdaレイヤーは /opt に展開される
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "/opt/snapshot/jan_url_mapping.snap")
+
+# キー順に読み出すクエリ（jan_code はすべて13桁のため、キー順は gtin の順序と一致する）
+SNAPSHOT_QUERY = text(
+    """
+    SELECT gtin, url, brand, product_name, updated_at
+    FROM jan_url_mapping
+    ORDER BY gtin
+    """
+)
+
+
+def encode_key(jan_code: str) -> Optional[int]:
+    """JANコードをスナップショットのキーに変換する（対象外のコードはNone）"""
+    if not jan_code or len(jan_code) > MAX_KEY_DIGITS or not jan_code.isascii() or not jan_code.isdigit():
+        return None
+    return (len(jan_code) << KEY_VALUE_BITS) | int(jan_code)
+
+
+def decode_key(key: int) -> str:
+    """スナップショットのキーをJANコードに戻す"""
+    digits = key >> KEY_VALUE_BITS
+    return str(key & ((1 << KEY_VALUE_BITS) - 1)).zfill(digits)
+
+
+def encode_record(url: str, brand: Optional[str], product_name: Optional[str], updated_at: Optional[datetime]) -> bytes:
+    """1件分のレコード（updated_at・各列の長さ + UTF-8の列）をエンコードする（共有キャッシュの値にも使用）"""
+    url_bytes = url.encode("utf-8")
+    brand_bytes = brand.encode("utf-8") if brand is not None else b""
+    product_bytes = product_name.encode("utf-8") if product_name is not None else b""
+    if updated_at is None:
+        micros = NULL_UPDATED_AT
+    else:
+        if updated_at.tzinfo is not None:
+            updated_at = updated_at.astimezone().replace(tzinfo=None)
+        micros = (updated_at - EPOCH) // timedelta(microseconds=1)
+    return RECORD_HEADER.pack(
+        micros,
+        len(url_bytes),
+        len(brand_bytes) if brand is not None else NULL_LENGTH,
+        len(product_bytes) if product_name is not None else NULL_LENGTH,
+    ) + url_bytes + brand_bytes + product_bytes
+
+
+def decode_record(buffer, position: int, jan_code: str) -> JanUrlMappingRecord:
+    """buffer の position から encode_record でエンコードしたレコードを読み出す"""
+    micros, url_length, brand_length, product_length = RECORD_HEADER.unpack_from(buffer, position)
+    position += RECORD_HEADER.size
+
+    url = buffer[position:position + url_length].decode("utf-8")
+    position += url_length
+    brand = None
+    if brand_length != NULL_LENGTH:
+        brand = buffer[position:position + brand_length].decode("utf-8")
+        position += brand_length
+    product_name = None
+    if product_length != NULL_LENGTH:
+        product_name = buffer[position:position + product_length].decode("utf-8")
+
+    return JanUrlMappingRecord(
+        jan_code=jan_code,
+        url=url,
+        brand=brand,
+        product_name=product_name,
+        updated_at=EPOCH + timedelta(microseconds=micros) if micros != NULL_UPDATED_AT else None,
+    )
+
+
+def build_snapshot(rows: Iterable[Tuple], path: str) -> Dict[str, object]:
+    """
+    行のイテラブルからスナップショットファイルを作成する
+
+    一時ファイルに書き出してから置き換えるため、読み込み中のプロセスが壊れたファイルを見ることはない。
+
+    Args:
+        rows: (jan_code, url, brand, product_name, updated_at) のイテラブル（キー順であること）
+        path: 出力先のファイルパス
+
+    Returns:
+        Dict[str, object]: 行数・スキップ件数・ファイルサイズ・所要時間
+    """
+    started = time.perf_counter()
+    keys = array.array("Q")
+    offsets = array.array("Q", [0])
+    skipped = 0
+    previous = -1
+
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.TemporaryFile(dir=directory) as blob:
+        blob_size = 0
+        for jan_code, url, brand, product_name, updated_at in rows:
+            key = encode_key(jan_code)
+            if key is None:
+                skipped += 1
+                continue
+            if key <= previous:
+                raise ValueError(f"rows must be sorted by snapshot key: {jan_code!r}")
+            previous = key
+
+            record = encode_record(url, brand, product_name, updated_at)
+            blob.write(record)
+            blob_size += len(record)
+            keys.append(key)
+            offsets.append(blob_size)
+
+        if sys.byteorder != "little":
+            keys.byteswap()
+            offsets.byteswap()
+
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(keys), int(time.time()), blob_size)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(header.ljust(HEADER_SIZE, b"\x00"))
+                keys.tofile(out)
+                offsets.tofile(out)
+                blob.seek(0)
+                shutil.copyfileobj(blob, out, 1024 * 1024)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    return {
+        "rows": len(keys),
+        "skipped": skipped,
+        "bytes": os.path.getsize(path),
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def iter_snapshot_rows(batch_size: int = 5000) -> Iterator[Tuple]:
+    """jan_url_mapping をスナップショットのキー順にストリーミングで読み出す（リーダーから読む）"""
+    from .routing import read_session_scope
+
+    with read_session_scope() as db:
+        result = db.execute(SNAPSHOT_QUERY.execution_options(yield_per=batch_size))
+        for gtin, url, brand, product_name, updated_at in result:
+            yield (jan_code_from_key(gtin), url, brand, product_name, updated_at)
+
+
+class SnapshotIndex:
+    """
+    スナップショットファイルを mmap し、JANコードを二分探索で引くリーダー
+
+    Args:
+        path: スナップショットファイルのパス
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Snapshot file is empty: {path}")
+
+        if len(self._mmap) < HEADER_SIZE:
+            self.close()
+            raise ValueError(f"Truncated snapshot file: {path}")
+        magic, version, _, count, built_at, blob_size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Not a snapshot file: {path}")
+        if version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported snapshot format version {version} (expected {FORMAT_VERSION})")
+
+        keys_start = HEADER_SIZE
+        offsets_start = keys_start + count * 8
+        self._blob_start = offsets_start + (count + 1) * 8
+        if len(self._mmap) != self._blob_start + blob_size:
+            self.close()
+            raise ValueError(f"Truncated snapshot file: {path}")
+
+        self.format_version = version
+        self.count = count
+        self.built_at = datetime.fromtimestamp(built_at)
+
+        view = self._view = memoryview(self._mmap)
+        if sys.byteorder == "little":
+            # memoryview のまま参照し、キー配列をPythonオブジェクトに展開しない
+            self._keys = view[keys_start:offsets_start].cast("Q")
+            self._offsets = view[offsets_start:self._blob_start].cast("Q")
+        else:
+            self._keys = array.array("Q", view[keys_start:offsets_start])
+            self._offsets = array.array("Q", view[offsets_start:self._blob_start])
+            self._keys.byteswap()
+            self._offsets.byteswap()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, jan_code: str) -> Optional[JanUrlMappingRecord]:
+        """
+        JANコードに対応するマッピングを取得する
+
+        Args:
+            jan_code: JANコード
+
+        Returns:
+            Optional[JanUrlMappingRecord]: マッピング情報（スナップショットに無い場合はNone）
+        """
+        key = encode_key(jan_code)
+        if key is not None:
+            index = bisect.bisect_left(self._keys, key)
+            if index < self.count and self._keys[index] == key:
+                self.hits += 1
+                return self._decode(jan_code, index)
+        self.misses += 1
+        return None
+
+    def __contains__(self, jan_code: str) -> bool:
+        key = encode_key(jan_code)
+        if key is None:
+            return False
+        index = bisect.bisect_left(self._keys, key)
+        return index < self.count and self._keys[index] == key
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _decode(self, jan_code: str, index: int) -> JanUrlMappingRecord:
+        return decode_record(self._mmap, self._blob_start + self._offsets[index], jan_code)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "path": self.path,
+            "format_version": self.format_version,
+            "built_at": self.built_at.isoformat(),
+            "rows": self.count,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def close(self) -> None:
+        # cast済みのmemoryviewが残っているとmmapを閉じられないため先に解放する
+        for name in ("_keys", "_offsets", "_view"):
+            view = self.__dict__.pop(name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        self._mmap.close()
+        self._file.close()
+
+
+_snapshot: Optional[SnapshotIndex] = None
+_snapshot_loaded = False
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> Optional[SnapshotIndex]:
+    """
+    SNAPSHOT_PATH のスナップショットを初回呼び出し時に開いて返す
+
+    ファイルが存在しない場合（SNAPSHOT_PATH が空の場合を含む）はNoneを返し、DBのみで動作する。
+    """
+    global _snapshot, _snapshot_loaded
+    if not _snapshot_loaded:
+        with _snapshot_lock:
+            if not _snapshot_loaded:
+                if SNAPSHOT_PATH and os.path.exists(SNAPSHOT_PATH):
+                    _snapshot = SnapshotIndex(SNAPSHOT_PATH)
+                _snapshot_loaded = True
+    return _snapshot
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build and inspect JAN-URL snapshot index files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="export jan_url_mapping into a snapshot file")
+    build_parser.add_argument("path")
+    info_parser = subparsers.add_parser("info", help="show snapshot header")
+    info_parser.add_argument("path")
+    get_parser = subparsers.add_parser("get", help="look up a JAN code in a snapshot")
+    get_parser.add_argument("path")
+    get_parser.add_argument("jan")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        print(json.dumps(build_snapshot(iter_snapshot_rows(), args.path)))
+        return 0
+
+    index = SnapshotIndex(args.path)
+    try:
+        if args.command == "info":
+            print(json.dumps(index.stats()))
+            return 0
+        mapping = index.get(args.jan)
+        if mapping is None:
+            print(f"JAN code '{args.jan}' not found", file=sys.stderr)
+            return 1
+        print(mapping.model_dump_json())
+        return 0
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
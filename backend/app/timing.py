@@ -0,0 +1,339 @@
+"""
+リクエストの段階別レイテンシ計測
+
+- stage("query") などの区間で各段階の所要時間を計測し、Server-Timing ヘッダで返す
+- レスポンス開始までの時間から、ハンドラ終了後の response_model の検証・シリアライズ時間（serialize）を求める
+- Lambdaでは Mangum のイベント変換を含むハンドラ全体の時間から、ASGIアプリ外の時間（mangum）を求める
+- 段階ごとのヒストグラムをプロセス内で集計し、/metrics で参照できるほか、
+  TIMING_EMF_FLUSH_SECONDS ごとに CloudWatch Embedded Metric Format (EMF) のJSONとして標準出力へ書き出す
+  （Lambdaでは標準出力がCloudWatch Logsに送られ、メトリクスとして取り込まれる）
+
+TIMING_ENABLED=false の場合はミドルウェアを登録せず、stage() は何もしないコンテキストマネージャを返す。
+"""
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+TIMING_ENABLED = os.getenv("TIMING_ENABLED", "false").lower() == "true"
+
+# ヒストグラムに記録するリクエストの割合（Server-Timing ヘッダは常に付与する）
+TIMING_SAMPLE_RATE = float(os.getenv("TIMING_SAMPLE_RATE", "1.0"))
+
+# EMFを書き出す間隔（秒）、0で書き出さない
+TIMING_EMF_FLUSH_SECONDS = float(os.getenv("TIMING_EMF_FLUSH_SECONDS", "60"))
+TIMING_EMF_NAMESPACE = os.getenv("TIMING_EMF_NAMESPACE", "Bronzedraw")
+
+# ヒストグラムのバケット（0.01ms〜約30秒を公比1.25で分割、EMFの上限100個に収まる）
+BUCKET_MIN_MS = 0.01
+BUCKET_RATIO = 1.25
+BUCKET_COUNT = int(math.ceil(math.log(30_000 / BUCKET_MIN_MS) / math.log(BUCKET_RATIO))) + 1
+_LOG_RATIO = math.log(BUCKET_RATIO)
+
+
+class Histogram:
+    """対数バケットのレイテンシヒストグラム（ミリ秒）"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def bucket_value(index: int) -> float:
+        """バケットの代表値（上端）"""
+        return BUCKET_MIN_MS * BUCKET_RATIO ** index
+
+    @staticmethod
+    def bucket_index(ms: float) -> int:
+        if ms <= BUCKET_MIN_MS:
+            return 0
+        return min(BUCKET_COUNT - 1, int(math.log(ms / BUCKET_MIN_MS) / _LOG_RATIO) + 1)
+
+    def add(self, ms: float, index: Optional[int] = None) -> None:
+        if index is None:
+            index = self.bucket_index(ms)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, p: float) -> float:
+        """パーセンタイル（バケットの上端で近似）"""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(math.ceil(p / 100.0 * self.count)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bucket_value(index), self.max)
+        return self.max
+
+    def emf_values(self) -> Dict[str, List[float]]:
+        values, counts = [], []
+        for index, count in enumerate(self.counts):
+            if count:
+                values.append(round(min(self.bucket_value(index), self.max), 3))
+                counts.append(count)
+        return {"Values": values, "Counts": counts}
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(self.max, 3),
+        }
+
+
+class TimingRecorder:
+    """
+    ルート・段階ごとのヒストグラムを集計し、EMFとして書き出す
+
+    Args:
+        flush_seconds: EMFを書き出す間隔（秒）、0で書き出さない
+        namespace: CloudWatchメトリクスの名前空間
+        sample_rate: ヒストグラムに記録するリクエストの割合
+        write: EMFの出力先（既定は標準出力）
+    """
+
+    def __init__(
+        self,
+        flush_seconds: float = 60.0,
+        namespace: str = "Bronzedraw",
+        sample_rate: float = 1.0,
+        write: Callable[[str], None] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.flush_seconds = flush_seconds
+        self.namespace = namespace
+        self.sample_rate = sample_rate
+        self._write = write or self._write_stdout
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (ルート, 段階) -> ヒストグラム（/metrics 用の累計と、次のEMF出力までの差分）
+        self._totals: Dict[Tuple[str, str], Histogram] = {}
+        self._pending: Dict[Tuple[str, str], Histogram] = {}
+        self._last_flush = clock()
+        self.requests = 0
+        self.sampled = 0
+
+    @staticmethod
+    def _write_stdout(line: str) -> None:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    def should_sample(self) -> bool:
+        self.requests += 1
+        if self.sample_rate >= 1.0 or random.random() < self.sample_rate:
+            self.sampled += 1
+            return True
+        return False
+
+    def record(self, route: str, durations: Dict[str, float]) -> None:
+        """1リクエスト分の段階別の所要時間（ミリ秒）を記録する"""
+        with self._lock:
+            for stage_name, ms in durations.items():
+                key = (route, stage_name)
+                index = Histogram.bucket_index(ms)
+                for histograms in (self._totals, self._pending):
+                    histogram = histograms.get(key)
+                    if histogram is None:
+                        histogram = histograms[key] = Histogram()
+                    histogram.add(ms, index)
+
+    def maybe_flush(self) -> None:
+        """前回の出力から flush_seconds 経過していればEMFを書き出す"""
+        if self.flush_seconds > 0 and self._clock() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        """集計中のヒストグラムをEMFとして書き出す（ルート・段階ごとに1行）"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = self._clock()
+        timestamp = int(time.time() * 1000)
+        for (route, stage_name), histogram in sorted(pending.items()):
+            self._write(json.dumps({
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [{
+                        "Namespace": self.namespace,
+                        "Dimensions": [["Route", "Stage"]],
+                        "Metrics": [{"Name": "StageLatency", "Unit": "Milliseconds"}],
+                    }],
+                },
+                "Route": route,
+                "Stage": stage_name,
+                "Env": os.getenv("ENV", "dev"),
+                "SampleRate": self.sample_rate,
+                "StageLatency": histogram.emf_values(),
+            }, separators=(",", ":")))
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            stages: Dict[str, Dict[str, object]] = {}
+            for (route, stage_name), histogram in sorted(self._totals.items()):
+                stages.setdefault(route, {})[stage_name] = histogram.summary()
+        return {"requests": self.requests, "sampled": self.sampled, "routes": stages}
+
+
+recorder = TimingRecorder(
+    flush_seconds=TIMING_EMF_FLUSH_SECONDS,
+    namespace=TIMING_EMF_NAMESPACE,
+    sample_rate=TIMING_SAMPLE_RATE,
+)
+
+
+class RequestTimings:
+    """1リクエスト分の段階別の所要時間（ミリ秒、同じ段階は合算）"""
+
+    __slots__ = ("started", "durations", "handler_done")
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.durations: Dict[str, float] = {}
+        self.handler_done: Optional[float] = None
+
+    def add(self, name: str, ms: float) -> None:
+        self.durations[name] = self.durations.get(name, 0.0) + ms
+
+    def header(self) -> str:
+        return ", ".join(f"{name};dur={ms:.3f}" for name, ms in self.durations.items())
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+class _NoopStage:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+_NOOP_STAGE = _NoopStage()
+
+
+class _Stage:
+    __slots__ = ("timings", "name", "started")
+
+    def __init__(self, timings: RequestTimings, name: str) -> None:
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.timings.add(self.name, (time.perf_counter() - self.started) * 1000)
+
+
+def stage(name: str):
+    """
+    区間の所要時間を現在のリクエストの段階として記録するコンテキストマネージャ
+
+    無効時・リクエスト外（CLIなど）では何もしない。
+    """
+    if not TIMING_ENABLED:
+        return _NOOP_STAGE
+    timings = _current.get()
+    if timings is None:
+        return _NOOP_STAGE
+    return _Stage(timings, name)
+
+
+def mark_handler_done() -> None:
+    """エンドポイントの処理が終わった時刻を記録する（以降レスポンス開始までを serialize とする）"""
+    if TIMING_ENABLED:
+        timings = _current.get()
+        if timings is not None:
+            timings.handler_done = time.perf_counter()
+
+
+# 直前のリクエストのASGIアプリ内の所要時間（Lambdaは1コンテナで同時に1リクエストのみ処理する）
+_last_request: Optional[Tuple[str, float, bool]] = None
+
+
+class TimingMiddleware:
+    """
+    段階別の所要時間を Server-Timing ヘッダで返し、ヒストグラムに記録するASGIミドルウェア
+
+    BaseHTTPMiddleware はレスポンスをタスク間で中継するため使わず、send をラップする。
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                now = time.perf_counter()
+                if timings.handler_done is not None:
+                    timings.add("serialize", (now - timings.handler_done) * 1000)
+                timings.add("app", (now - timings.started) * 1000)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", timings.header().encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            global _last_request
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            sampled = recorder.should_sample()
+            _last_request = (route_path, timings.durations.get("app", 0.0), sampled)
+            if sampled:
+                recorder.record(route_path, timings.durations)
+            recorder.maybe_flush()
+
+
+def timed_handler(handler):
+    """
+    Lambdaハンドラ（Mangum）をラップし、ASGIアプリ外の時間（イベント変換など）を mangum として記録する
+    """
+    if not TIMING_ENABLED:
+        return handler
+
+    def wrapped(event, context):
+        global _last_request
+        _last_request = None
+        started = time.perf_counter()
+        response = handler(event, context)
+        total_ms = (time.perf_counter() - started) * 1000
+        if _last_request is not None:
+            route_path, app_ms, sampled = _last_request
+            if sampled:
+                recorder.record(route_path, {"mangum": max(0.0, total_ms - app_ms), "lambda": total_ms})
+        return response
+
+    return wrapped
+
+
+def timing_stats() -> Optional[Dict[str, object]]:
+    """/metrics 用の段階別レイテンシ（無効時はNone）"""
+    return recorder.stats() if TIMING_ENABLED else None
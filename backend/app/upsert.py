@@ -0,0 +1,85 @@
+"""
+書き込みAPI（PUT /api/mappings/{jan}、POST /api/mappings:bulkUpsert）の登録・更新
+
+INSERT ... ON CONFLICT (gtin) DO UPDATE ... WHERE で url / brand / product_name が変化した行だけを更新し、
+psycopg2 の execute_values で UPSERT_PAGE_SIZE 行を1つの文にまとめて送る（1行ごとの往復にしない）。
+検証は一括インポート（app/bulk_import.py）と同じ規則で行い、不正な行は書き込まずに結果で返す。
+コミット後、書き込んだJANコードのルックアップキャッシュを破棄する。
+"""
+from typing import Dict, List, Optional
+import os
+
+from psycopg2.extras import execute_values
+
+from .bulk_import import validate_record
+from .gtin import gtin_key, jan_code_from_key, normalize_batch
+from .lookup import invalidate_mappings
+from .routing import write_connection_scope
+from .schemas import MappingUpsertResult
+from .timing import stage
+
+# 1つのINSERT文（1往復）にまとめる行数
+UPSERT_PAGE_SIZE = int(os.getenv("UPSERT_PAGE_SIZE", "1000"))
+
+UPSERT_SQL = """
+    INSERT INTO jan_url_mapping (gtin, url, brand, product_name)
+    VALUES %s
+    ON CONFLICT (gtin) DO UPDATE
+    SET url = EXCLUDED.url,
+        brand = EXCLUDED.brand,
+        product_name = EXCLUDED.product_name
+    WHERE (jan_url_mapping.url, jan_url_mapping.brand, jan_url_mapping.product_name)
+        IS DISTINCT FROM (EXCLUDED.url, EXCLUDED.brand, EXCLUDED.product_name)
+    RETURNING gtin, (xmax = 0) AS inserted
+"""
+
+
+def upsert_mappings(records: List[Dict[str, Optional[str]]]) -> List[MappingUpsertResult]:
+    """
+    マッピングをまとめて登録・更新する
+
+    同じJANコード（正規化後）が複数回現れた場合は最後のものを採用し、それより前は superseded とする。
+
+    Args:
+        records: jan_code / url / brand / product_name を持つレコードのリスト
+
+    Returns:
+        List[MappingUpsertResult]: 入力と同じ順序の結果
+            （created / updated / unchanged / invalid / superseded）
+    """
+    normalized = normalize_batch(
+        str(record.get("jan_code")) if record.get("jan_code") is not None else ""
+        for record in records
+    )
+    results: List[MappingUpsertResult] = []
+    rows: Dict[str, tuple] = {}
+    last_index: Dict[str, int] = {}
+    for index, (record, jan_code) in enumerate(zip(records, normalized)):
+        row, error = validate_record(record, normalized_jan=jan_code)
+        requested = str(record.get("jan_code"))
+        if error:
+            results.append(MappingUpsertResult(jan_code=requested, status="invalid", error=error))
+            continue
+        jan_code = row[0]
+        if jan_code in last_index:
+            results[last_index[jan_code]].status = "superseded"
+        last_index[jan_code] = index
+        rows[jan_code] = (gtin_key(jan_code),) + row[1:]
+        results.append(MappingUpsertResult(jan_code=requested, status="unchanged", normalized_jan_code=jan_code))
+
+    if not rows:
+        return results
+
+    # 並行する一括書き込み同士がデッドロックしないよう、行ロックを取る順序（gtin順）を揃える
+    values = sorted(rows.values())
+    with write_connection_scope(rows.keys()) as connection:
+        cursor = connection.cursor()
+        with stage("query"):
+            returned = execute_values(cursor, UPSERT_SQL, values, page_size=UPSERT_PAGE_SIZE, fetch=True)
+
+    changed = {jan_code_from_key(gtin): inserted for gtin, inserted in returned}
+    for jan_code, index in last_index.items():
+        if jan_code in changed:
+            results[index].status = "created" if changed[jan_code] else "updated"
+    invalidate_mappings(changed)
+    return results
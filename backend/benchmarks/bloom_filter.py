@@ -0,0 +1,160 @@
+"""
+登録済みJANコードのブルームフィルタのベンチマーク
+
+1. サイズと偽陽性率: --keys 件（既定1000万件）の合成JANコードでフィルタのファイルを作り、
+   ファイルサイズ（mmap したときのメモリ）・作成時間・未登録のJANコード --probes 件での実測の偽陽性率・1件の判定時間を測る
+2. DB問い合わせの削減: 合成カタログ（benchmarks/suite.py）に未登録のJANコードを --miss-ratio の割合で混ぜた
+   Zipf 分布のワークロードを、フィルタなし・ありのサーバーに送り、DBへの問い合わせ回数
+   （pg_stat_user_tables のスキャン回数の差分、benchmarks/shared_cache.py）を比べる
+
+使い方:
+    # docker compose の db を起動して計測
+    python -m benchmarks.bloom_filter --compose
+    # 既存のPostgreSQLを使う（サイズの計測だけなら DATABASE_URL は不要）
+    DATABASE_URL=... python -m benchmarks.bloom_filter --rows 100000 --miss-ratio 0.3
+    python -m benchmarks.bloom_filter --skip-workload --keys 10000000
+"""
+from typing import Dict, List, Optional
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+from .loadgen import BACKEND_DIR, UvicornServer, run_load
+from .shared_cache import table_scans
+from .suite import COMPOSE_DATABASE_URL, SYNTHETIC_MAX, SYNTHETIC_MIN, seed_catalog, start_compose_db, zipf_workload
+
+
+def measure_sizing(keys: int, probes: int, fpr: float, headroom: float, seed: int) -> Dict[str, object]:
+    """合成の gtin でフィルタを作り、サイズ・偽陽性率・判定時間を測る"""
+    from app.bloom import BloomFilter, build_filter
+
+    rng = random.Random(seed)
+    # 登録済みは偶数、未登録は奇数の gtin にして重ならないようにする
+    registered = range(SYNTHETIC_MIN, SYNTHETIC_MIN + keys * 2, 2)
+    capacity = math.ceil(keys * (1 + headroom))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "jan_codes.bloom")
+        built = build_filter(registered, path, capacity, fpr)
+        bloom = BloomFilter.open(path)
+        try:
+            absent = [rng.randrange(SYNTHETIC_MIN, SYNTHETIC_MAX) | 1 for _ in range(probes)]
+            started = time.perf_counter()
+            false_positives = sum(1 for key in absent if bloom.might_contain(key))
+            check_us = (time.perf_counter() - started) / probes * 1e6
+            return {
+                "keys": keys,
+                "capacity": capacity,
+                "hashes": built["hashes"],
+                "bytes": built["bytes"],
+                "mib": round(built["bytes"] / 2 ** 20, 2),
+                "build_seconds": built["elapsed_seconds"],
+                "target_fpr": fpr,
+                "estimated_fpr": built["estimated_fpr"],
+                "measured_fpr": round(false_positives / probes, 5),
+                "check_us": round(check_us, 2),
+            }
+        finally:
+            bloom.close()
+
+
+def run_scenario(args: argparse.Namespace, workload: List[str], bloom_path: str) -> Dict[str, object]:
+    """フィルタなし（bloom_path が空）・ありで1回計測する"""
+    env = {
+        "SNAPSHOT_PATH": "",
+        "L2_CACHE_URL": "",
+        "BLOOM_FILTER_PATH": bloom_path,
+        "LOOKUP_CACHE_ENABLED": "true" if args.cache else "false",
+        "TIMING_ENABLED": "false",
+    }
+    database_url = os.environ["DATABASE_URL"]
+    before = table_scans(database_url)
+    with UvicornServer(env=env, workers=1) as server:
+        stats = run_load(server.base_url, lambda i: f"/api/convert?jan={workload[i]}", args.concurrency, len(workload))
+    # 終了したバックエンドの統計が反映されるのを待つ
+    time.sleep(1.0)
+    queries = table_scans(database_url) - before
+    return {
+        "bloom": bool(bloom_path),
+        "requests": len(workload),
+        "not_found": stats["statuses"].get("404", 0),
+        "db_queries": queries,
+        "db_queries_per_1000_requests": round(queries * 1000 / len(workload), 1),
+        "rps": stats["rps"],
+        "p50_ms": stats["p50_ms"],
+        "p99_ms": stats["p99_ms"],
+        "errors": stats["errors"],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure bloom filter size, false-positive rate and avoided DB queries")
+    parser.add_argument("--compose", action="store_true", help="start the docker compose db first")
+    parser.add_argument("--keys", type=int, default=10_000_000, help="keys for the size / false-positive measurement")
+    parser.add_argument("--probes", type=int, default=1_000_000)
+    parser.add_argument("--fpr", type=float, default=0.01)
+    parser.add_argument("--headroom", type=float, default=0.2)
+    parser.add_argument("--skip-sizing", action="store_true")
+    parser.add_argument("--skip-workload", action="store_true")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--miss-ratio", type=float, default=0.3)
+    parser.add_argument("--no-cache", dest="cache", action="store_false", help="disable the in-process lookup cache")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, BACKEND_DIR)
+    results: Dict[str, object] = {}
+
+    if not args.skip_sizing:
+        sizing = measure_sizing(args.keys, args.probes, args.fpr, args.headroom, args.seed)
+        results["sizing"] = sizing
+        print(
+            f"{sizing['keys']} keys (capacity {sizing['capacity']}, k={sizing['hashes']}): {sizing['mib']} MiB, "
+            f"built in {sizing['build_seconds']}s, fpr target {sizing['target_fpr']} / estimated {sizing['estimated_fpr']} / "
+            f"measured {sizing['measured_fpr']}, {sizing['check_us']} us per check"
+        )
+
+    if not args.skip_workload:
+        if args.compose:
+            os.environ.setdefault("DATABASE_URL", COMPOSE_DATABASE_URL)
+            start_compose_db()
+        if "DATABASE_URL" not in os.environ:
+            raise SystemExit("DATABASE_URL is not set (or use --compose, --skip-workload)")
+
+        from app.bloom import build_from_database
+
+        seed_catalog(os.environ["DATABASE_URL"], args.rows)
+        workload = zipf_workload(args.rows, args.requests, args.zipf, args.miss_ratio, args.seed)
+        with tempfile.TemporaryDirectory() as directory:
+            bloom_path = os.path.join(directory, "jan_codes.bloom")
+            results["build"] = build_from_database(bloom_path, fpr=args.fpr, headroom=args.headroom)
+            scenarios = [run_scenario(args, workload, ""), run_scenario(args, workload, bloom_path)]
+        results["workload"] = scenarios
+
+        without, with_bloom = scenarios
+        avoided = 1 - with_bloom["db_queries"] / without["db_queries"] if without["db_queries"] else 0.0
+        results["db_queries_avoided"] = round(avoided, 3)
+        print(f"{'bloom':>5} {'404s':>6} {'db_queries':>10} {'per_1000':>8} {'rps':>8} {'p50_ms':>7} {'p99_ms':>7}")
+        for result in scenarios:
+            print(
+                f"{str(result['bloom']):>5} {result['not_found']:>6} {result['db_queries']:>10} "
+                f"{result['db_queries_per_1000_requests']:>8} {result['rps']:>8} {result['p50_ms']:>7} {result['p99_ms']:>7}"
+            )
+        print(f"DB queries avoided: {avoided:.1%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,107 @@
+"""
+コールドスタート（初期化時間）のベンチマーク
+
+ローカルのスタブHTTPサーバーを Parameters and Secrets Lambda Extension に見立て、
+新しいPythonプロセスで app.main をインポートする時間（Lambdaの Init Duration に相当）と
+最初のリクエストの処理時間を計測する。
+
+- lazy : 現在の実装（シークレットは最初の接続時に取得）
+- eager: インポート直後にシークレットを取得する（従来の import 時取得を再現）
+
+使い方:
+    export DATABASE_HOST=localhost  # Secrets経由で接続するPostgreSQLのホスト
+    python -m benchmarks.cold_start --runs 10 --secret-latency-ms 80 \\
+        --username bronzedraw --password bronzedraw_dev_password
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from .loadgen import BACKEND_DIR
+
+# 子プロセスで実行するスクリプト（インポート時間と最初のリクエスト時間をJSONで出力）
+CHILD_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+from app import database
+if sys.argv[1] == "eager":
+    database.secret_provider.get()
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+response = TestClient(app.main.app).get("/health")
+finished = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_request_ms": (finished - imported) * 1000,
+    "status": response.status_code,
+}))
+"""
+
+
+def start_stub_extension(username: str, password: str, latency_ms: float) -> ThreadingHTTPServer:
+    """Secrets Extension の /secretsmanager/get を模したスタブサーバーを起動する"""
+    secret = json.dumps({"username": username, "password": password})
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency_ms / 1000.0)
+            body = json.dumps({"SecretString": secret}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure init duration with lazy vs eager secret resolution")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--secret-latency-ms", type=float, default=80.0)
+    parser.add_argument("--username", default="bronzedraw")
+    parser.add_argument("--password", default="bronzedraw_dev_password")
+    args = parser.parse_args(argv)
+
+    server = start_stub_extension(args.username, args.password, args.secret_latency_ms)
+    env = {k: v for k, v in os.environ.items() if k != "DATABASE_URL"}
+    env.update({
+        "DB_SECRET_ARN": "arn:aws:secretsmanager:local:000000000000:secret:stub",
+        "DB_CLUSTER_ENDPOINT": os.getenv("DATABASE_HOST", "localhost"),
+        "SECRETS_EXTENSION_ENDPOINT": f"http://127.0.0.1:{server.server_port}",
+    })
+
+    results = {}
+    for mode in ("eager", "lazy"):
+        samples = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, "-c", CHILD_SCRIPT, mode],
+                cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+        results[mode] = {
+            "import_ms_median": round(statistics.median(s["import_ms"] for s in samples), 1),
+            "first_request_ms_median": round(statistics.median(s["first_request_ms"] for s in samples), 1),
+            "statuses": sorted({s["status"] for s in samples}),
+        }
+        print(f"{mode:>5}: {json.dumps(results[mode])}")
+
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,188 @@
+"""
+DB停止中の /api/convert の可用性ベンチマーク
+
+uvicorn に一定の負荷をかけたまま、途中でPostgreSQLを停止（既定は docker compose stop db）・再開し、
+1秒ごとのステータスコードの内訳とレイテンシ、停止前・停止中・再開後の集計を比べる。
+
+- baseline: 失効したキャッシュは使わず、サーキットブレーカーも無効（従来の動作）
+- resilient: LOOKUP_CACHE_STALE_TTL_SECONDS で失効後のエントリを返し、サーキットブレーカーで即座に失敗させる
+
+停止中にキャッシュのエントリが失効するよう、どちらもキャッシュのTTLを短く（--cache-ttl）して計測する。
+ワークロードは負荷試験スイートと同じ合成カタログ・Zipf分布（benchmarks/suite.py）。
+
+使い方:
+    python -m benchmarks.db_outage --compose
+    # docker compose を使わない場合は停止・再開のコマンドを指定する
+    python -m benchmarks.db_outage --stop-cmd "pg_ctl -D /path/to/data stop -m fast" --start-cmd "pg_ctl -D /path/to/data start"
+"""
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+from .loadgen import BACKEND_DIR, UvicornServer, percentile, run_load
+from .suite import COMPOSE_DATABASE_URL, REPO_DIR, seed_catalog, start_compose_db, zipf_workload
+
+SCENARIOS = {
+    "baseline": {"LOOKUP_CACHE_STALE_TTL_SECONDS": "0", "DB_CIRCUIT_BREAKER_ENABLED": "false"},
+    "resilient": {"LOOKUP_CACHE_STALE_TTL_SECONDS": "3600", "DB_CIRCUIT_BREAKER_ENABLED": "true"},
+}
+
+
+def _phase_summary(samples: List[tuple]) -> Dict[str, object]:
+    latencies = sorted(latency for _, _, latency in samples)
+    statuses: Dict[str, int] = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": len(samples),
+        "statuses": dict(sorted(statuses.items())),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+async def _timed_load(base_url: str, workload: List[str], concurrency: int, duration: float, timeout: float) -> List[tuple]:
+    """duration 秒の間 workload を繰り返し送り、(開始からの秒数, ステータス, レイテンシ) を返す（接続エラーは 'error'）"""
+    samples: List[tuple] = []
+    counter = iter(range(10 ** 12))
+    started = time.perf_counter()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+
+        async def worker():
+            for i in counter:
+                sent = time.perf_counter()
+                if sent - started >= duration:
+                    return
+                try:
+                    status = (await client.get(f"/api/convert?jan={workload[i % len(workload)]}")).status_code
+                except httpx.HTTPError:
+                    status = "error"
+                samples.append((sent - started, status, time.perf_counter() - sent))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples
+
+
+def _run_at(delay: float, command: Optional[str], events: List[Dict[str, object]], started: float) -> Optional[threading.Timer]:
+    if not command:
+        return None
+
+    def run():
+        at = round(time.perf_counter() - started, 2)
+        result = subprocess.run(shlex.split(command), cwd=REPO_DIR, capture_output=True, text=True)
+        events.append({"at_seconds": at, "command": command, "returncode": result.returncode})
+
+    timer = threading.Timer(delay, run)
+    timer.start()
+    return timer
+
+
+def run_scenario(name: str, args: argparse.Namespace, workload: List[str]) -> Dict[str, object]:
+    """1つのシナリオで負荷をかけながらDBを停止・再開し、結果を返す"""
+    env = {
+        "SNAPSHOT_PATH": "",
+        "LOOKUP_CACHE_MAX_ENTRIES": str(len(set(workload)) * 2),
+        "LOOKUP_CACHE_TTL_SECONDS": str(args.cache_ttl),
+        "LOOKUP_CACHE_NEGATIVE_TTL_SECONDS": str(args.cache_ttl),
+        "DB_CONNECT_TIMEOUT_SECONDS": str(args.connect_timeout),
+        "DB_STATEMENT_TIMEOUT_MS": str(args.statement_timeout_ms),
+        **SCENARIOS[name],
+    }
+    events: List[Dict[str, object]] = []
+    with UvicornServer(env=env) as server:
+        # すべてのJANコードをキャッシュに載せてから計測する
+        distinct = sorted(set(workload))
+        run_load(server.base_url, lambda i: f"/api/convert?jan={distinct[i]}", 16, len(distinct))
+
+        started = time.perf_counter()
+        timers = [
+            _run_at(args.stop_at, args.stop_cmd, events, started),
+            _run_at(args.restart_at, args.start_cmd, events, started) if args.restart_at > 0 else None,
+        ]
+        samples = asyncio.run(_timed_load(server.base_url, workload, args.concurrency, args.duration, args.timeout))
+        for timer in timers:
+            if timer is not None:
+                timer.join()
+        metrics = httpx.get(f"{server.base_url}/metrics", timeout=10).json()
+
+    restart_at = args.restart_at if args.restart_at > 0 else args.duration
+    phases = {
+        "before": [s for s in samples if s[0] < args.stop_at],
+        "outage": [s for s in samples if args.stop_at <= s[0] < restart_at],
+        "after": [s for s in samples if s[0] >= restart_at],
+    }
+    timeline = []
+    for second in range(int(args.duration) + 1):
+        window = [s for s in samples if second <= s[0] < second + 1]
+        if window:
+            timeline.append({"second": second, **_phase_summary(window)})
+    return {
+        "scenario": name,
+        "server_env": env,
+        "events": events,
+        "phases": {phase: _phase_summary(values) for phase, values in phases.items()},
+        "timeline": timeline,
+        "metrics": {key: metrics.get(key) for key in ("lookup_cache", "stale_refresh", "circuit_breaker")},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure /api/convert availability while the database is stopped")
+    parser.add_argument("--compose", action="store_true", help="start the docker compose db first")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=20_000, help="length of the generated workload (cycled)")
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--miss-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=40.0)
+    parser.add_argument("--stop-at", type=float, default=10.0)
+    parser.add_argument("--restart-at", type=float, default=25.0, help="0 keeps the database stopped")
+    parser.add_argument("--stop-cmd", default="docker compose stop db")
+    parser.add_argument("--start-cmd", default="docker compose start db")
+    parser.add_argument("--cache-ttl", type=float, default=2.0)
+    parser.add_argument("--connect-timeout", type=int, default=2)
+    parser.add_argument("--statement-timeout-ms", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30.0, help="client timeout per request")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=["baseline", "resilient"])
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.compose:
+        os.environ.setdefault("DATABASE_URL", COMPOSE_DATABASE_URL)
+        start_compose_db()
+    if "DATABASE_URL" not in os.environ:
+        raise SystemExit("DATABASE_URL is not set (or use --compose)")
+
+    sys.path.insert(0, BACKEND_DIR)
+    seed_catalog(os.environ["DATABASE_URL"], args.rows)
+    workload = zipf_workload(args.rows, args.requests, args.zipf, args.miss_ratio, args.seed)
+
+    results = []
+    for name in args.scenarios:
+        result = run_scenario(name, args, workload)
+        results.append(result)
+        print(json.dumps({"scenario": name, "phases": result["phases"], "metrics": result["metrics"]}, indent=2), file=sys.stderr)
+        if args.restart_at <= 0 and args.start_cmd:
+            # 次のシナリオのためにDBを再開する
+            subprocess.run(shlex.split(args.start_cmd), cwd=REPO_DIR, check=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
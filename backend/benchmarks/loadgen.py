@@ -0,0 +1,137 @@
+"""
+ベンチマーク用の簡易負荷生成ユーティリティ
+
+固定並列数でHTTPリクエストを送り、スループットとレイテンシのパーセンタイルを集計する。
+"""
+from typing import Callable, Dict, List, Optional
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """昇順ソート済みの値からパーセンタイルを求める（最近傍法）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int, statuses: Dict[int, int]) -> Dict[str, object]:
+    """レイテンシ（秒）のリストから集計結果を作成する"""
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "elapsed_seconds": round(elapsed, 3),
+        "rps": round(len(values) / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+
+async def _run(base_url: str, path_fn: Callable[[int], str], concurrency: int, total: int, timeout: float) -> Dict[str, object]:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    errors = 0
+    counter = iter(range(total))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path_fn(i))
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return summarize(latencies, elapsed, errors, statuses)
+
+
+def run_load(base_url: str, path_fn: Callable[[int], str], concurrency: int, total: int, timeout: float = 30.0) -> Dict[str, object]:
+    """
+    固定並列数で total 件のGETリクエストを送り、集計結果を返す
+
+    Args:
+        base_url: 対象サーバーのURL
+        path_fn: リクエスト番号からパス（クエリ含む）を返す関数
+        concurrency: 同時実行数
+        total: 総リクエスト数
+        timeout: 1リクエストあたりのタイムアウト（秒）
+    """
+    return asyncio.run(_run(base_url, path_fn, concurrency, total, timeout))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class UvicornServer:
+    """
+    ベンチマーク対象のAPIサーバーを別プロセスのuvicornで起動するコンテキストマネージャ
+
+    Args:
+        env: 追加の環境変数（DB_ASYNC など）
+        workers: uvicornのワーカー数
+    """
+
+    def __init__(self, env: Optional[Dict[str, str]] = None, workers: int = 1) -> None:
+        self.env = env or {}
+        self.workers = workers
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.process = None
+
+    def __enter__(self) -> "UvicornServer":
+        env = {**os.environ, "DEBUG": "false", **self.env}
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "app.main:app",
+                "--host", "127.0.0.1", "--port", str(self.port),
+                "--workers", str(self.workers), "--log-level", "warning",
+            ],
+            cwd=BACKEND_DIR,
+            env=env,
+        )
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                if httpx.get(f"{self.base_url}/health", timeout=1.0).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            if self.process.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise RuntimeError("uvicorn did not become healthy within 30 seconds")
+
+    def __exit__(self, *exc) -> None:
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
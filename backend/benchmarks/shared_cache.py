@@ -0,0 +1,120 @@
+"""
+共有キャッシュ（L2）の有無による、ワーカー数ごとのDB問い合わせ回数のベンチマーク
+
+uvicorn のワーカー数（Lambdaのウォームなコンテナ数に相当、それぞれ空のプロセス内キャッシュから始まる）を変えて
+同じワークロード（合成カタログ・Zipf分布、benchmarks/suite.py）を送り、L2なし・ありでDBへの問い合わせ回数を比べる。
+問い合わせ回数は jan_url_mapping のスキャン回数（pg_stat_user_tables の idx_scan + seq_scan）の差分で数える
+（統計はバックエンドの終了時に確実に反映されるため、サーバーを停止してから読む）。
+各実行は別のキー接頭辞を使い、前の実行のL2のエントリを使わない。
+
+使い方:
+    # docker compose の db と valkey を起動して計測
+    python -m benchmarks.shared_cache --compose
+    # 既存のPostgreSQL・Redis互換サーバーを使う
+    DATABASE_URL=... python -m benchmarks.shared_cache --l2-url redis://localhost:6379/0 --workers 1 2 4 8
+"""
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+from .loadgen import BACKEND_DIR, UvicornServer, run_load
+from .suite import COMPOSE_DATABASE_URL, REPO_DIR, seed_catalog, start_compose_db, zipf_workload
+
+COMPOSE_L2_URL = "redis://localhost:6379/0"
+
+
+def table_scans(database_url: str) -> int:
+    """jan_url_mapping のスキャン回数（インデックス・シーケンシャルの合計）"""
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(database_url)
+    try:
+        with engine.connect() as conn:
+            return conn.execute(
+                text(
+                    "SELECT coalesce(idx_scan, 0) + coalesce(seq_scan, 0) "
+                    "FROM pg_stat_user_tables WHERE relname = 'jan_url_mapping'"
+                )
+            ).scalar_one()
+    finally:
+        engine.dispose()
+
+
+def run_scenario(args: argparse.Namespace, workload: List[str], workers: int, l2: bool) -> Dict[str, object]:
+    """ワーカー数・L2の有無を指定して1回計測する"""
+    env = {
+        "SNAPSHOT_PATH": "",
+        "L2_CACHE_URL": args.l2_url if l2 else "",
+        "L2_CACHE_KEY_PREFIX": f"bench:{uuid.uuid4().hex[:8]}:",
+        "TIMING_ENABLED": "false",
+    }
+    database_url = os.environ["DATABASE_URL"]
+    before = table_scans(database_url)
+    with UvicornServer(env=env, workers=workers) as server:
+        stats = run_load(server.base_url, lambda i: f"/api/convert?jan={workload[i]}", args.concurrency, len(workload))
+    # 終了したバックエンドの統計が反映されるのを待つ
+    time.sleep(1.0)
+    queries = table_scans(database_url) - before
+    return {
+        "workers": workers,
+        "l2": l2,
+        "requests": len(workload),
+        "db_queries": queries,
+        "db_queries_per_1000_requests": round(queries * 1000 / len(workload), 1),
+        "db_queries_per_second": round(queries / stats["elapsed_seconds"], 1),
+        "rps": stats["rps"],
+        "p50_ms": stats["p50_ms"],
+        "p99_ms": stats["p99_ms"],
+        "errors": stats["errors"],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure DB query rate vs. number of workers with and without the L2 cache")
+    parser.add_argument("--compose", action="store_true", help="start the docker compose db and valkey first")
+    parser.add_argument("--l2-url", default=os.getenv("L2_CACHE_URL") or COMPOSE_L2_URL)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--miss-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.compose:
+        os.environ.setdefault("DATABASE_URL", COMPOSE_DATABASE_URL)
+        start_compose_db()
+        subprocess.run(["docker", "compose", "up", "-d", "--wait", "valkey"], cwd=REPO_DIR, check=True)
+    if "DATABASE_URL" not in os.environ:
+        raise SystemExit("DATABASE_URL is not set (or use --compose)")
+
+    sys.path.insert(0, BACKEND_DIR)
+    seed_catalog(os.environ["DATABASE_URL"], args.rows)
+    workload = zipf_workload(args.rows, args.requests, args.zipf, args.miss_ratio, args.seed)
+
+    results = []
+    print(f"{'workers':>7} {'l2':>5} {'db_queries':>10} {'per_1000':>8} {'queries/s':>9} {'rps':>8} {'p99_ms':>8}")
+    for workers in args.workers:
+        for l2 in (False, True):
+            result = run_scenario(args, workload, workers, l2)
+            results.append(result)
+            print(
+                f"{workers:>7} {str(l2):>5} {result['db_queries']:>10} {result['db_queries_per_1000_requests']:>8} "
+                f"{result['db_queries_per_second']:>9} {result['rps']:>8} {result['p99_ms']:>8}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
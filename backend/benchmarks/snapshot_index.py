@@ -0,0 +1,109 @@
+"""
+スナップショットインデックスのベンチマーク
+
+合成データ（デフォルト1000万行）でスナップショットファイルを作成し、新しいPythonプロセスで
+mmap して開いた場合のルックアップレイテンシ（p50/p99）と RSS（オープン前後・ルックアップ後の
+RssAnon / RssFile）を計測する。
+DBは使用しない。
+
+使い方:
+    python -m benchmarks.snapshot_index --rows 10000000 --lookups 200000
+    python -m benchmarks.snapshot_index --path /tmp/jan_url_mapping.snap --skip-build
+"""
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from .loadgen import BACKEND_DIR
+
+# 子プロセスで実行するスクリプト（RSSはインポート済みの状態を基準に計測する）
+CHILD_SCRIPT = """
+import json, random, sys, time
+from app.snapshot import SnapshotIndex
+from benchmarks.loadgen import percentile
+
+def rss_mb():
+    # RssFile はmmapしたファイルのページ（ページキャッシュと共有）、RssAnon はヒープ等の固有メモリ
+    values = {}
+    with open("/proc/self/status") as status:
+        for line in status:
+            name, _, rest = line.partition(":")
+            if name in ("RssAnon", "RssFile"):
+                values[name] = round(int(rest.split()[0]) / 1024.0, 1)
+    return values
+
+path, rows, lookups = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+rss_before = rss_mb()
+started = time.perf_counter()
+index = SnapshotIndex(path)
+open_ms = (time.perf_counter() - started) * 1000
+rss_opened = rss_mb()
+
+random.seed(0)
+# 9割はヒット、1割は未登録のJANコード
+codes = [str(4500000000000 + random.randrange(rows * 10 // 9)) for _ in range(lookups)]
+latencies = []
+hits = 0
+for code in codes:
+    started = time.perf_counter()
+    mapping = index.get(code)
+    latencies.append(time.perf_counter() - started)
+    hits += mapping is not None
+latencies.sort()
+print(json.dumps({
+    "open_ms": round(open_ms, 3),
+    "lookups": lookups,
+    "hit_ratio": round(hits / lookups, 3),
+    "p50_us": round(percentile(latencies, 50) * 1e6, 2),
+    "p99_us": round(percentile(latencies, 99) * 1e6, 2),
+    "max_us": round(latencies[-1] * 1e6, 2),
+    "rss_before_open_mb": rss_before,
+    "rss_after_open_mb": rss_opened,
+    "rss_after_lookups_mb": rss_mb(),
+}))
+"""
+
+
+def synthetic_rows(count: int) -> Iterator[Tuple]:
+    """キー順の合成データ（13桁のJANコード）を生成する"""
+    updated_at = datetime(2025, 1, 1)
+    for i in range(count):
+        jan_code = str(4500000000000 + i)
+        yield (
+            jan_code,
+            f"https://example.com/products/{jan_code}",
+            f"Brand {i % 1000}",
+            f"Product {jan_code}",
+            updated_at,
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure snapshot index lookup latency and RSS")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument("--path", default=os.path.join(BACKEND_DIR, "snapshot-bench.snap"))
+    parser.add_argument("--skip-build", action="store_true", help="reuse an existing snapshot file")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, BACKEND_DIR)
+    from app.snapshot import build_snapshot
+
+    if not args.skip_build:
+        build = build_snapshot(synthetic_rows(args.rows), args.path)
+        print(f"build: {json.dumps(build)}")
+
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, args.path, str(args.rows), str(args.lookups)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    print(f"lookup: {output.strip().splitlines()[-1]}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,153 @@
+"""
+コールドスタート直後のキャッシュのヒット率のベンチマーク（ウォームアップなし・あり）
+
+1. 合成カタログ（benchmarks/suite.py）に対する過去のワークロード（Zipf分布、別のシード）のヒット件数を
+   LookupStatsRecorder で数えて jan_lookup_stats へ書き込む（合成カタログの範囲の統計は作り直す）
+2. LOOKUP_WARMUP_ENTRIES を変えてサーバーを起動し直し（空のプロセス内キャッシュ）、同じ分布の新しいワークロードの
+   最初の --requests 件を順に送って、チェックポイントごとのキャッシュのヒット率（/metrics の lookup_cache.hits の差分 / リクエスト数）と
+   キャッシュに無くDBへ問い合わせたリクエスト数を比べる（ウォームアップの1回の問い合わせは含めない。
+   pg_stat_user_tables のスキャン回数はウォームアップの結合の実行計画で変わるため使わない）
+
+使い方:
+    # docker compose の db を起動して計測
+    python -m benchmarks.warm_up --compose
+    # 既存のPostgreSQLを使う（0006_lookup_stats の適用が必要）
+    DATABASE_URL=... python -m benchmarks.warm_up --rows 100000 --warm-up 0 1000 5000
+"""
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import sys
+import time
+
+import httpx
+
+from .loadgen import BACKEND_DIR, UvicornServer, run_load
+from .suite import COMPOSE_DATABASE_URL, SYNTHETIC_MAX, SYNTHETIC_MIN, seed_catalog, start_compose_db, zipf_workload
+
+
+def seed_lookup_stats(database_url: str, workload: List[str]) -> Dict[str, object]:
+    """過去のワークロードのヒット件数を jan_lookup_stats へ書き込む（合成カタログの範囲のみ入れ替える）"""
+    from sqlalchemy import create_engine, text
+
+    from app.popularity import LookupStatsRecorder
+
+    engine = create_engine(database_url)
+    try:
+        with engine.begin() as conn:
+            conn.execute(
+                text("DELETE FROM jan_lookup_stats WHERE gtin BETWEEN :low AND :high"),
+                {"low": SYNTHETIC_MIN, "high": SYNTHETIC_MAX},
+            )
+            registered = set(
+                conn.execute(
+                    text("SELECT jan_code FROM jan_url_mapping WHERE gtin = ANY(:codes)"),
+                    {"codes": sorted({int(code) for code in workload})},
+                ).scalars()
+            )
+    finally:
+        engine.dispose()
+
+    # マッピングが見つかったルックアップだけを数える（API と同じ）
+    hits = [code for code in workload if code in registered]
+    recorder = LookupStatsRecorder(enabled=True, max_keys=len(registered) + 1)
+    started = time.perf_counter()
+    recorder.record_many(hits)
+    rows = recorder.flush()
+    return {"lookups": len(hits), "rows": rows, "flush_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+def _cache_hits(base_url: str) -> int:
+    return httpx.get(f"{base_url}/metrics", timeout=5.0).json()["lookup_cache"]["hits"]
+
+
+def run_scenario(args: argparse.Namespace, workload: List[str], warm_up: int) -> Dict[str, object]:
+    """LOOKUP_WARMUP_ENTRIES を指定して起動し、最初のリクエストのヒット率を測る"""
+    env = {
+        "SNAPSHOT_PATH": "",
+        "L2_CACHE_URL": "",
+        "BLOOM_FILTER_PATH": "",
+        "LOOKUP_STATS_ENABLED": "false",
+        "LOOKUP_CACHE_MAX_ENTRIES": str(args.cache_entries),
+        "LOOKUP_WARMUP_ENTRIES": str(warm_up),
+        "TIMING_ENABLED": "false",
+    }
+    checkpoints = sorted(set(min(point, len(workload)) for point in args.checkpoints + [len(workload)]))
+    started = time.perf_counter()
+    with UvicornServer(env=env, workers=1) as server:
+        startup_seconds = time.perf_counter() - started
+        metrics = httpx.get(f"{server.base_url}/metrics", timeout=5.0).json()
+        hits_before = metrics["lookup_cache"]["hits"]
+        hit_rates = {}
+        sent = 0
+        first = None
+        hits = 0
+        for point in checkpoints:
+            offset = sent
+            stats = run_load(server.base_url, lambda i: f"/api/convert?jan={workload[offset + i]}", 1, point - sent)
+            sent = point
+            hits = _cache_hits(server.base_url) - hits_before
+            hit_rates[str(point)] = round(hits / point, 3)
+            first = first or stats
+    return {
+        "warm_up_entries": warm_up,
+        "warmed": metrics["warm_up"]["entries"],
+        "warm_up_ms": metrics["warm_up"]["elapsed_ms"],
+        "startup_seconds": round(startup_seconds, 2),
+        "hit_rate": hit_rates,
+        "db_lookups": sent - hits,
+        "first_p50_ms": first["p50_ms"],
+        "first_p99_ms": first["p99_ms"],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure cache hit rate right after a cold start with and without warm-up")
+    parser.add_argument("--compose", action="store_true", help="start the docker compose db first")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--history", type=int, default=200_000, help="requests in the workload used for the lookup stats")
+    parser.add_argument("--requests", type=int, default=1000, help="requests measured after each cold start")
+    parser.add_argument("--checkpoints", type=int, nargs="+", default=[100])
+    parser.add_argument("--warm-up", type=int, nargs="+", default=[0, 2000])
+    parser.add_argument("--cache-entries", type=int, default=10000)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--miss-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.compose:
+        os.environ.setdefault("DATABASE_URL", COMPOSE_DATABASE_URL)
+        start_compose_db()
+    if "DATABASE_URL" not in os.environ:
+        raise SystemExit("DATABASE_URL is not set (or use --compose)")
+
+    sys.path.insert(0, BACKEND_DIR)
+    database_url = os.environ["DATABASE_URL"]
+    seed_catalog(database_url, args.rows)
+    history = zipf_workload(args.rows, args.history, args.zipf, args.miss_ratio, args.seed + 1)
+    seeded = seed_lookup_stats(database_url, history)
+    print(f"lookup stats: {seeded['lookups']} hits over {seeded['rows']} JAN codes, flushed in {seeded['flush_ms']}ms")
+
+    workload = zipf_workload(args.rows, args.requests, args.zipf, args.miss_ratio, args.seed)
+    results = []
+    checkpoints = sorted(set(args.checkpoints + [args.requests]))
+    print(f"{'warm_up':>7} {'warmed':>6} {'warm_ms':>7} " + " ".join(f"{'hit@' + str(p):>8}" for p in checkpoints) + f" {'db_lookups':>10} {'p50_ms':>7} {'p99_ms':>7}")
+    for warm_up in args.warm_up:
+        result = run_scenario(args, workload, warm_up)
+        results.append(result)
+        print(
+            f"{warm_up:>7} {result['warmed']:>6} {result['warm_up_ms']:>7} "
+            + " ".join(f"{result['hit_rate'][str(p)]:>8}" for p in checkpoints)
+            + f" {result['db_lookups']:>10} {result['first_p50_ms']:>7} {result['first_p99_ms']:>7}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"lookup_stats": seeded, "scenarios": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,31 +1,15 @@
--- JAN-URL マッピングテーブル
-CREATE TABLE jan_url_mapping (
-    id SERIAL PRIMARY KEY,
-    jan_code VARCHAR(13) UNIQUE NOT NULL,
-    url TEXT NOT NULL,
-    brand VARCHAR(100),
-    product_name VARCHAR(255),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-
--- インデックス作成
-CREATE INDEX idx_jan_code ON jan_url_mapping(jan_code);
+-- ローカル開発用の初期化スクリプト（docker-entrypoint-initdb.d から psql で実行される）
+-- スキーマは db/migrations のマイグレーションを順に適用して作成する
+-- （マイグレーションを追加した場合はここにも追記すること）
+\ir migrations/0001_initial.sql
+\ir migrations/0002_gtin_key.sql
+\ir migrations/0003_trgm_search.sql
+\ir migrations/0004_change_notify.sql
+\ir migrations/0005_created_at_brin.sql
+\ir migrations/0006_lookup_stats.sql
+\ir migrations/0007_created_at_clock_timestamp.sql
 
 -- サンプルデータ投入（架空の商品）
-INSERT INTO jan_url_mapping (jan_code, url, brand, product_name) VALUES
-    ('4900000000001', 'https://example.com/products/outdoor-jacket-001', 'Mountain Gear', 'Alpine Pro Jacket'),
-    ('4900000000002', 'https://example.com/products/running-shoes-002', 'RunFast', 'Speed Runner X1');
-
--- 更新日時を自動更新するトリガー関数
-CREATE OR REPLACE FUNCTION update_updated_at_column()
-RETURNS TRIGGER AS $$
-BEGIN
-    NEW.updated_at = CURRENT_TIMESTAMP;
-    RETURN NEW;
-END;
-$$ language 'plpgsql';
-
--- トリガー設定
-CREATE TRIGGER update_jan_url_mapping_updated_at BEFORE UPDATE ON jan_url_mapping
-FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+INSERT INTO jan_url_mapping (gtin, url, brand, product_name) VALUES
+    (4900000000009, 'https://example.com/products/outdoor-jacket-001', 'Mountain Gear', 'Alpine Pro Jacket'),
+    (4900000000016, 'https://example.com/products/running-shoes-002', 'RunFast', 'Speed Runner X1');
@@ -0,0 +1,39 @@
+-- 0001: 初期スキーマ（マイグレーション導入前の init.sql と同じ定義）
+-- 既存のデータベースにも適用できるよう、すべて IF NOT EXISTS / OR REPLACE で作成する
+
+-- 適用済みマイグレーションの記録
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- JAN-URL マッピングテーブル
+CREATE TABLE IF NOT EXISTS jan_url_mapping (
+    id SERIAL PRIMARY KEY,
+    jan_code VARCHAR(13) UNIQUE NOT NULL,
+    url TEXT NOT NULL,
+    brand VARCHAR(100),
+    product_name VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- インデックス作成
+CREATE INDEX IF NOT EXISTS idx_jan_code ON jan_url_mapping(jan_code);
+
+-- 更新日時を自動更新するトリガー関数
+CREATE OR REPLACE FUNCTION update_updated_at_column()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+-- トリガー設定
+DROP TRIGGER IF EXISTS update_jan_url_mapping_updated_at ON jan_url_mapping;
+CREATE TRIGGER update_jan_url_mapping_updated_at BEFORE UPDATE ON jan_url_mapping
+FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+INSERT INTO schema_migrations (version, name) VALUES (1, 'initial');
@@ -0,0 +1,79 @@
+-- 0002: BIGINT の GTIN キーと covering index への移行
+--
+-- - jan_code (VARCHAR) の UNIQUE 制約と idx_jan_code は同じ内容のB-treeが2本になっていたため、
+--   gtin (BIGINT) の主キー1本にまとめる
+-- - 主キーのインデックスに url / brand / product_name / updated_at を INCLUDE し、
+--   ルックアップ（WHERE gtin = ?）をヒープを読まない Index Only Scan にする
+-- - jan_code は gtin から生成する列として残す（13桁、先頭0埋め）
+-- - 新しいテーブルへ gtin 順に詰め直してから入れ替える（既存行の UPDATE による肥大化を避ける）
+--
+-- 適用後に VACUUM (ANALYZE) を実行すること（Index Only Scan には visibility map が必要）。
+-- python -m app.migrations upgrade は適用後に自動で実行する。
+
+-- 数字以外・14桁以上の jan_code が残っている場合、
+-- チェックデジットが一致しない jan_code（アプリケーションは問い合わせる前に422を返すため、移行しても読めない行になる）がある場合、
+-- 0埋めの有無だけが異なり同じ gtin になる jan_code（例: EAN-8 の 49000009 と 0000049000009）がある場合は移行できない
+DO $$
+DECLARE
+    invalid_count BIGINT;
+    mismatched TEXT;
+    conflicts TEXT;
+BEGIN
+    SELECT count(*) INTO invalid_count FROM jan_url_mapping WHERE jan_code !~ '^[0-9]{1,13}$';
+    IF invalid_count > 0 THEN
+        RAISE EXCEPTION 'jan_url_mapping has % rows whose jan_code is not numeric; fix them before migrating', invalid_count;
+    END IF;
+
+    -- 13桁に0埋めした左から偶数番目の桁にウェイト3、奇数番目にウェイト1を掛ける（app/gtin.py と同じモジュラス10）
+    SELECT count(*), array_to_string((array_agg(jan_code ORDER BY jan_code))[1:20], ', ')
+    INTO invalid_count, mismatched
+    FROM (
+        SELECT jan_code, lpad(jan_code, 13, '0') AS padded
+        FROM jan_url_mapping
+    ) AS codes
+    WHERE (10 - (
+        SELECT sum(substr(padded, i, 1)::int * CASE WHEN i % 2 = 0 THEN 3 ELSE 1 END)
+        FROM generate_series(1, 12) AS i
+    ) % 10) % 10 <> substr(padded, 13, 1)::int;
+    IF invalid_count > 0 THEN
+        RAISE EXCEPTION 'jan_url_mapping has % rows whose jan_code check digit does not match (e.g. %); correct or delete them before migrating', invalid_count, mismatched;
+    END IF;
+
+    SELECT string_agg(codes, '; ' ORDER BY gtin) INTO conflicts
+    FROM (
+        SELECT jan_code::bigint AS gtin, string_agg(jan_code, ', ' ORDER BY jan_code) AS codes
+        FROM jan_url_mapping
+        GROUP BY jan_code::bigint
+        HAVING count(*) > 1
+    ) AS duplicated;
+    IF conflicts IS NOT NULL THEN
+        RAISE EXCEPTION 'jan_url_mapping has jan_codes that map to the same gtin: %; merge them before migrating', conflicts;
+    END IF;
+END $$;
+
+CREATE TABLE jan_url_mapping_v2 (
+    gtin BIGINT NOT NULL,
+    jan_code VARCHAR(13) GENERATED ALWAYS AS (lpad(gtin::text, 13, '0')) STORED,
+    url TEXT NOT NULL,
+    brand VARCHAR(100),
+    product_name VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- EAN-8 / UPC-A のまま格納されていた行は、アプリケーションと同じく13桁に0埋めした値になる
+INSERT INTO jan_url_mapping_v2 (gtin, url, brand, product_name, created_at, updated_at)
+SELECT jan_code::bigint, url, brand, product_name, created_at, updated_at
+FROM jan_url_mapping
+ORDER BY jan_code::bigint;
+
+DROP TABLE jan_url_mapping;
+ALTER TABLE jan_url_mapping_v2 RENAME TO jan_url_mapping;
+
+ALTER TABLE jan_url_mapping
+    ADD CONSTRAINT jan_url_mapping_pkey PRIMARY KEY (gtin) INCLUDE (url, brand, product_name, updated_at);
+
+CREATE TRIGGER update_jan_url_mapping_updated_at BEFORE UPDATE ON jan_url_mapping
+FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+INSERT INTO schema_migrations (version, name) VALUES (2, 'gtin_key');
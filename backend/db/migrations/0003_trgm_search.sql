@@ -0,0 +1,20 @@
+-- 0003: product_name / brand の部分一致検索用の pg_trgm GIN インデックス
+--
+-- - GET /api/search の word_similarity（<% 演算子）による検索をシーケンシャルスキャンにしない
+-- - gin_trgm_ops は LIKE / ILIKE '%...%' にも使われるため、Query Editor での部分一致検索も速くなる
+-- - Aurora PostgreSQL・postgres:16 イメージのどちらも pg_trgm を同梱している
+--   （CREATE EXTENSION には rds_superuser 権限が必要。マスターユーザーで適用すること）
+--
+-- インデックスの作成中は jan_url_mapping への書き込みがブロックされる（数百万行で数十秒〜数分）。
+-- 書き込みを止められない環境では、適用前に同じ名前のインデックスを CREATE INDEX CONCURRENTLY で
+-- 作成しておけば、このファイルは IF NOT EXISTS によりスキップする。
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_jan_url_mapping_product_name_trgm
+    ON jan_url_mapping USING gin (product_name gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_jan_url_mapping_brand_trgm
+    ON jan_url_mapping USING gin (brand gin_trgm_ops);
+
+INSERT INTO schema_migrations (version, name) VALUES (3, 'trgm_search');
@@ -0,0 +1,68 @@
+-- 0004: 変更の通知（LISTEN / NOTIFY）
+--
+-- - jan_url_mapping への INSERT / UPDATE / DELETE / TRUNCATE を jan_url_mapping_changed チャネルへ通知し、
+--   稼働中のAPIプロセスがプロセス内キャッシュの該当エントリを破棄できるようにする（app/invalidation.py）
+-- - update_jan_url_mapping_updated_at（行単位の BEFORE UPDATE）で行ごとに通知すると一括更新で通知が溢れるため、
+--   文単位の AFTER トリガーで遷移テーブルから変更されたJANコードを集め、カンマ区切りでまとめて送る
+--   （ペイロードの上限 8000 バイトに収まるよう 500件ずつ）
+-- - 1文で 1000件を超える変更（一括インポートのマージなど）は個々のJANコードを送らず、'*'（全件の破棄）を1回だけ送る
+-- - 通知はコミット時に配送され、同じトランザクション内の同じペイロードは1回にまとめられる（ロールバックした変更は通知されない）
+
+CREATE OR REPLACE FUNCTION notify_jan_url_mapping_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    keys BIGINT[];
+    payload TEXT;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('jan_url_mapping_changed', '*');
+        RETURN NULL;
+    END IF;
+
+    -- 上限を1件超えるところまでだけ集める（一括インポートで全行を配列にしない）
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(gtin) INTO keys FROM (SELECT gtin FROM new_rows LIMIT 1001) changed;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(gtin) INTO keys FROM (SELECT gtin FROM old_rows LIMIT 1001) changed;
+    ELSE
+        SELECT array_agg(gtin) INTO keys FROM (
+            SELECT gtin FROM new_rows UNION SELECT gtin FROM old_rows LIMIT 1001
+        ) changed;
+    END IF;
+
+    IF keys IS NULL THEN
+        RETURN NULL;
+    END IF;
+    IF cardinality(keys) > 1000 THEN
+        PERFORM pg_notify('jan_url_mapping_changed', '*');
+        RETURN NULL;
+    END IF;
+
+    FOR payload IN
+        SELECT string_agg(lpad(key::text, 13, '0'), ',')
+        FROM unnest(keys) WITH ORDINALITY AS changed(key, position)
+        GROUP BY (position - 1) / 500
+    LOOP
+        PERFORM pg_notify('jan_url_mapping_changed', payload);
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 遷移テーブルを使うトリガーは1つのイベントにしか指定できないため、操作ごとに作成する
+CREATE TRIGGER notify_jan_url_mapping_insert AFTER INSERT ON jan_url_mapping
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_jan_url_mapping_change();
+
+CREATE TRIGGER notify_jan_url_mapping_update AFTER UPDATE ON jan_url_mapping
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_jan_url_mapping_change();
+
+CREATE TRIGGER notify_jan_url_mapping_delete AFTER DELETE ON jan_url_mapping
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_jan_url_mapping_change();
+
+CREATE TRIGGER notify_jan_url_mapping_truncate AFTER TRUNCATE ON jan_url_mapping
+FOR EACH STATEMENT EXECUTE FUNCTION notify_jan_url_mapping_change();
+
+INSERT INTO schema_migrations (version, name) VALUES (4, 'change_notify');
@@ -0,0 +1,12 @@
+-- 0005: created_at の BRIN インデックス
+--
+-- - 登録済みJANコードのブルームフィルタ（app/bloom.py）を読み込んだプロセスが、作成後に追加された行
+--   （created_at >= ウォーターマーク）を定期的に読むキャッチアップ用
+-- - created_at は追加時の時刻で更新されないため、行の物理的な並びとの相関が高く BRIN が効く
+--   （1000万行でも数十KB、B-tree の 1/1000 以下で書き込みの負担もほとんど無い）
+-- - 作成中も書き込みはブロックされるが、BRIN はページの要約を作るだけのため数百万行でも数秒で終わる
+
+CREATE INDEX IF NOT EXISTS idx_jan_url_mapping_created_at_brin
+    ON jan_url_mapping USING brin (created_at);
+
+INSERT INTO schema_migrations (version, name) VALUES (5, 'created_at_brin');
@@ -0,0 +1,20 @@
+-- 0006: ルックアップのヒット件数（jan_lookup_stats）
+--
+-- - 各プロセスがメモリ上で数えたヒット件数を LOOKUP_STATS_FLUSH_SECONDS ごとに1文の
+--   INSERT ... ON CONFLICT DO UPDATE でまとめて加算する（app/popularity.py、リクエストの処理中には書き込まない）
+-- - コールドスタート時のキャッシュのウォームアップで、直近にヒットした行を lookups の多い順に読む
+--   （lookups の降順インデックスを先頭から読み、jan_url_mapping の主キーで結合する）
+-- - jan_url_mapping から削除された行の統計は残るが、ウォームアップでは結合で除外される
+--   （外部キーにすると一括削除・TRUNCATE のたびに統計の削除が必要になるため付けない）
+
+CREATE TABLE IF NOT EXISTS jan_lookup_stats (
+    gtin BIGINT PRIMARY KEY,
+    lookups BIGINT NOT NULL DEFAULT 0,
+    first_lookup_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_lookup_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_jan_lookup_stats_lookups
+    ON jan_lookup_stats (lookups DESC);
+
+INSERT INTO schema_migrations (version, name) VALUES (6, 'lookup_stats');
@@ -0,0 +1,11 @@
+-- 0007: created_at を行を追加した時刻にする
+--
+-- - CURRENT_TIMESTAMP（トランザクションの開始時刻）では、開始してから時間が経ってから行を追加したトランザクションの
+--   created_at が、その間に進めたブルームフィルタのキャッチアップのウォーターマークより前になり、取りこぼされることがある
+-- - clock_timestamp() にすると、スナップショットの取得時に実行中でなかったトランザクションが後から追加する行の
+--   created_at はその時刻以降になる（app/bloom.py はスナップショットの xip で実行中だったトランザクションの終了を待つ）
+-- - 既定値の変更だけでテーブルは書き換えない（既存の行の created_at はそのまま）
+
+ALTER TABLE jan_url_mapping ALTER COLUMN created_at SET DEFAULT clock_timestamp();
+
+INSERT INTO schema_migrations (version, name) VALUES (7, 'created_at_clock_timestamp');
@@ -0,0 +1,113 @@
+"""
+バッチ変換（/api/convert/batch）のテスト
+
+DBへの接続は conftest.py の fake_read_connection に差し替え、有効なJANコードがまとめて1回の問い合わせ
+（gtin = ANY(:codes)）で解決されることを確かめる。
+"""
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from app import lookup, main
+from app.http_cache import cache_control_for_hit, cache_control_for_invalid, cache_control_for_miss
+from app.schemas import MAX_BATCH_SIZE
+
+JAN_CODE = "4900000000009"
+UPC_A = "049000000009"
+MISSING_JAN_CODE = "4900000000023"
+BAD_CHECK_DIGIT = "4900000000001"
+
+
+def test_batch_returns_found_missing_and_invalid_with_one_query(fake_read_connection):
+    fake_read_connection.add(JAN_CODE)
+    fake_read_connection.add("0049000000009")
+
+    with TestClient(main.app) as client:
+        response = client.post(
+            "/api/convert/batch",
+            json={"jan_codes": [JAN_CODE, UPC_A, MISSING_JAN_CODE, f" {JAN_CODE} ", BAD_CHECK_DIGIT, "abc", ""]},
+        )
+
+    assert response.status_code == 200
+    body = response.json()
+    # キーはリクエストで指定したコード、値は正規化した13桁のJANコードのマッピング
+    assert list(body["found"]) == [JAN_CODE, UPC_A]
+    assert body["found"][JAN_CODE]["url"] == f"https://example.com/products/{JAN_CODE}"
+    assert body["found"][UPC_A]["jan_code"] == "0049000000009"
+    assert body["missing"] == [MISSING_JAN_CODE]
+    assert body["invalid"] == [BAD_CHECK_DIGIT, "abc"]
+    assert fake_read_connection.queries == [{"codes": [int(JAN_CODE), 49000000009, int(MISSING_JAN_CODE)]}]
+
+
+def test_batch_get_splits_comma_separated_codes(fake_read_connection):
+    fake_read_connection.add(JAN_CODE)
+
+    with TestClient(main.app) as client:
+        response = client.get("/api/convert/batch", params={"jans": f"{JAN_CODE},{MISSING_JAN_CODE}"})
+
+    assert response.status_code == 200
+    assert list(response.json()["found"]) == [JAN_CODE]
+    assert response.json()["missing"] == [MISSING_JAN_CODE]
+
+
+def test_only_invalid_codes_do_not_query_the_database(fake_read_connection):
+    with TestClient(main.app) as client:
+        response = client.post("/api/convert/batch", json={"jan_codes": [BAD_CHECK_DIGIT]})
+
+    assert response.json() == {"found": {}, "missing": [], "invalid": [BAD_CHECK_DIGIT]}
+    assert fake_read_connection.connects == []
+
+
+def test_too_many_codes_are_rejected_with_413(monkeypatch, fake_read_connection):
+    monkeypatch.setattr(main, "MAX_BATCH_SIZE", 2)
+
+    with TestClient(main.app) as client:
+        assert client.post("/api/convert/batch", json={"jan_codes": [JAN_CODE, MISSING_JAN_CODE]}).status_code == 200
+        # 重複・空文字を除く前の件数で数える
+        duplicated = client.post("/api/convert/batch", json={"jan_codes": [JAN_CODE, JAN_CODE, MISSING_JAN_CODE]})
+        response = client.get("/api/convert/batch", params={"jans": f"{JAN_CODE},,{MISSING_JAN_CODE}"})
+
+    assert duplicated.status_code == 413
+    assert response.status_code == 413
+    assert "max 2" in response.json()["detail"]
+    assert len(fake_read_connection.queries) == 1
+
+
+def test_request_body_over_the_limit_is_rejected_before_the_handler(fake_read_connection):
+    with TestClient(main.app) as client:
+        response = client.post("/api/convert/batch", json={"jan_codes": [JAN_CODE] * (MAX_BATCH_SIZE + 1)})
+
+    assert response.status_code == 422
+    assert fake_read_connection.connects == []
+
+
+def test_batch_get_has_the_cache_headers_of_a_single_lookup(fake_read_connection):
+    fake_read_connection.add(JAN_CODE)
+
+    with TestClient(main.app) as client:
+        found = client.get("/api/convert/batch", params={"jans": JAN_CODE})
+        with_missing = client.get("/api/convert/batch", params={"jans": f"{JAN_CODE},{MISSING_JAN_CODE}"})
+        only_invalid = client.get("/api/convert/batch", params={"jans": BAD_CHECK_DIGIT})
+        not_modified = client.get(
+            "/api/convert/batch", params={"jans": JAN_CODE}, headers={"If-None-Match": found.headers["etag"]},
+        )
+
+    assert found.headers["cache-control"] == cache_control_for_hit()
+    assert with_missing.headers["cache-control"] == cache_control_for_miss()
+    assert only_invalid.headers["cache-control"] == cache_control_for_invalid()
+    assert len({found.headers["etag"], with_missing.headers["etag"], only_invalid.headers["etag"]}) == 3
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == found.headers["etag"]
+    assert not_modified.headers["cache-control"] == cache_control_for_hit()
+
+
+def test_batch_etag_changes_when_a_mapping_is_updated(fake_read_connection):
+    fake_read_connection.add(JAN_CODE, updated_at=datetime(2024, 1, 1))
+    with TestClient(main.app) as client:
+        before = client.get("/api/convert/batch", params={"jans": JAN_CODE}).headers["etag"]
+        lookup.lookup_cache.clear()
+        fake_read_connection.add(JAN_CODE, url="https://example.com/new", updated_at=datetime(2024, 1, 2))
+        after = client.get("/api/convert/batch", params={"jans": JAN_CODE}).headers["etag"]
+
+    assert before != after
@@ -0,0 +1,189 @@
+"""
+登録済みJANコードのブルームフィルタのテスト
+
+キャッチアップはDBに接続せず、created_at 以降の行を返す関数（FakeCatchUp）を渡して確認する。
+"""
+from datetime import datetime
+
+import pytest
+
+from app import lookup
+from app.bloom import BloomFilter, JanCodeFilter, build_filter
+
+REGISTERED = [str(4900000000000 + i * 7).zfill(13) for i in range(2000)]
+NEW_JAN_CODE = "4999999999994"
+BUILT_WATERMARK = datetime(2024, 1, 1)
+
+
+class FakeCatchUp:
+    """
+    created_at がウォーターマーク以降の gtin を返す（rows に追加した行が作成後に追加された行）
+
+    xmin / next_xid はスナップショットの実行中の最も古いトランザクションIDと次のトランザクションID
+    （既定では実行中のトランザクションは無い）。
+    """
+
+    def __init__(self) -> None:
+        self.rows = []
+        self.calls = []
+        self.xmin = 100
+        self.next_xid = 100
+
+    def __call__(self, since, limit):
+        self.calls.append(since)
+        return datetime(2024, 1, 1, 0, len(self.calls)), self.xmin, self.next_xid, self.rows[:limit]
+
+
+@pytest.fixture
+def bloom_path(tmp_path):
+    path = str(tmp_path / "jan_codes.bloom")
+    build_filter((int(code) for code in REGISTERED), path, capacity=2400, fpr=0.01, watermark=BUILT_WATERMARK)
+    return path
+
+
+def test_round_trip_has_no_false_negatives(bloom_path):
+    bloom = BloomFilter.open(bloom_path)
+    try:
+        assert bloom.count == len(REGISTERED)
+        assert bloom.watermark == BUILT_WATERMARK
+        assert all(code in bloom for code in REGISTERED)
+
+        absent = [str(4500000000000 + i * 13) for i in range(20000)]
+        false_positives = sum(code in bloom for code in absent)
+        assert false_positives / len(absent) < 0.02
+        assert "abc" not in bloom
+    finally:
+        bloom.close()
+
+
+def test_adds_are_private_to_the_process(bloom_path):
+    """追加は copy-on-write の mmap に反映され、ファイルは書き換えない"""
+    bloom = BloomFilter.open(bloom_path)
+    bloom.add(int(NEW_JAN_CODE))
+    assert NEW_JAN_CODE in bloom
+    bloom.close()
+
+    bloom = BloomFilter.open(bloom_path)
+    assert NEW_JAN_CODE not in bloom
+    bloom.close()
+
+
+def test_rejects_invalid_files(tmp_path, bloom_path):
+    with open(bloom_path, "rb") as f:
+        data = f.read()
+    truncated = tmp_path / "truncated.bloom"
+    truncated.write_bytes(data[:-8])
+    with pytest.raises(ValueError, match="Truncated"):
+        BloomFilter.open(str(truncated))
+    other = tmp_path / "other.bloom"
+    other.write_bytes(b"BZSNAP\x00\x00" + data[8:])
+    with pytest.raises(ValueError, match="Not a bloom filter"):
+        BloomFilter.open(str(other))
+
+
+def test_filter_is_only_trusted_after_catch_up(bloom_path, clock):
+    """作成後に追加された行をキャッチアップするまで・キャッチアップが古くなった後は参照しない"""
+    catch_up = FakeCatchUp()
+    catch_up.rows.append(int(NEW_JAN_CODE))
+    jan_filter = JanCodeFilter(path=bloom_path, catchup_seconds=30, query=catch_up, clock=clock)
+    jan_filter._catch_up_in_background = lambda: None
+
+    assert not jan_filter.definitely_absent("4900000000993")
+    assert jan_filter.stats()["bypassed"] == 1
+
+    assert jan_filter.catch_up() == 1
+    assert catch_up.calls == [BUILT_WATERMARK]
+    assert not jan_filter.definitely_absent(NEW_JAN_CODE)
+    assert not jan_filter.definitely_absent(REGISTERED[0])
+    assert jan_filter.definitely_absent("4900000000993")
+
+    # 次のキャッチアップは前回のウォーターマークから読む
+    jan_filter.catch_up()
+    assert catch_up.calls[-1] == datetime(2024, 1, 1, 0, 1)
+
+    clock.now += 30
+    assert not jan_filter.definitely_absent("4900000000993")
+    stats = jan_filter.stats()
+    assert stats["rejected"] == 1
+    assert stats["bypassed"] == 2
+    assert not stats["current"]
+
+
+def test_watermark_waits_for_transactions_running_at_the_snapshot(bloom_path):
+    """キャッチアップの時点で実行中だったトランザクションが終わるまでウォーターマークを進めない（それらの行は古い created_at を持ちうる）"""
+    catch_up = FakeCatchUp()
+    jan_filter = JanCodeFilter(path=bloom_path, query=catch_up)
+    jan_filter._catch_up_in_background = lambda: None
+
+    # トランザクション 100 が実行中（次のIDは 101）
+    catch_up.xmin, catch_up.next_xid = 100, 101
+    jan_filter.catch_up()
+    jan_filter.catch_up()
+    assert catch_up.calls[-1] == BUILT_WATERMARK
+    assert jan_filter.stats()["pending_watermarks"] == 2
+
+    # 100 が終わり、その後に始まった 101 が実行中: 100 が実行中だった時点の候補（1回目・2回目）までは進める
+    catch_up.xmin, catch_up.next_xid = 101, 102
+    jan_filter.catch_up()
+    jan_filter.catch_up()
+    assert catch_up.calls[-1] == datetime(2024, 1, 1, 0, 2)
+    assert jan_filter.stats()["pending_watermarks"] == 2
+
+    # 実行中のトランザクションが無ければ最新の候補まで進める
+    catch_up.xmin = catch_up.next_xid = 102
+    jan_filter.catch_up()
+    jan_filter.catch_up()
+    assert catch_up.calls[-1] == datetime(2024, 1, 1, 0, 5)
+    assert jan_filter.stats()["pending_watermarks"] == 0
+
+
+def test_bulk_change_and_oversized_catch_up_disable_filter(bloom_path, clock):
+    catch_up = FakeCatchUp()
+    jan_filter = JanCodeFilter(path=bloom_path, max_catchup_rows=2, query=catch_up, clock=clock)
+    jan_filter._catch_up_in_background = lambda: None
+    jan_filter.catch_up()
+    assert jan_filter.definitely_absent("4900000000993")
+
+    # 一括の変更の通知を受けたらキャッチアップが終わるまで参照しない
+    jan_filter.mark_stale()
+    assert not jan_filter.definitely_absent("4900000000993")
+
+    # 作り直さずに大量の行が追加された場合は参照しない
+    catch_up.rows.extend([4999999999901, 4999999999918, 4999999999925])
+    assert jan_filter.catch_up() == 0
+    assert jan_filter.disabled_reason is not None
+    assert not jan_filter.definitely_absent("4900000000993")
+
+    # ファイルが作り直されたら読み込み直して再開する
+    build_filter(catch_up.rows, bloom_path, capacity=100, watermark=datetime(2024, 2, 1))
+    catch_up.rows.clear()
+    jan_filter._mtime_ns = None
+    jan_filter.catch_up()
+    assert jan_filter.disabled_reason is None
+    assert jan_filter.stats()["reloads"] == 1
+    assert catch_up.calls[-1] == datetime(2024, 2, 1)
+    assert jan_filter.definitely_absent("4900000000993")
+
+
+@pytest.fixture
+def lookup_filter(monkeypatch, bloom_path, fake_read_connection):
+    jan_filter = JanCodeFilter(path=bloom_path, query=FakeCatchUp())
+    jan_filter._catch_up_in_background = lambda: None
+    jan_filter.catch_up()
+    monkeypatch.setattr(lookup, "jan_code_filter", jan_filter)
+    return jan_filter
+
+
+def test_lookup_skips_db_for_unregistered_codes(lookup_filter, fake_read_connection):
+    assert lookup.fetch_mapping("4900000000993") is None
+    assert lookup.fetch_mappings(["4900000000993", "4900000000986"]) == {}
+    assert fake_read_connection.connects == []
+    assert lookup_filter.stats()["rejected"] == 3
+
+
+def test_written_codes_are_added(lookup_filter):
+    """このプロセスで書き込んだJANコードは、キャッチアップを待たずに登録済みとして扱う"""
+    assert lookup_filter.definitely_absent(NEW_JAN_CODE)
+    lookup.invalidate_mappings([NEW_JAN_CODE])
+    assert not lookup_filter.definitely_absent(NEW_JAN_CODE)
+    assert lookup_filter.stats()["added"] == 1
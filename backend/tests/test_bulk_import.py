@@ -0,0 +1,230 @@
+"""
+一括インポート（app/bulk_import.py）のテスト
+
+検証と COPY に渡すテキストは接続の代わり（FakeConnection）で確かめる。
+ステージングテーブルからのマージ（DISTINCT ON）は実際の PostgreSQL が必要なため、
+TEST_DATABASE_URL が設定されている場合だけ、使い捨てのスキーマに作った jan_url_mapping へインポートする。
+"""
+from contextlib import contextmanager
+import csv
+import io
+import os
+import uuid
+
+import pytest
+
+from app import bulk_import
+from app.bulk_import import _copy_chunk, import_records, validate_record
+
+JAN_CODE = "4900000000009"
+OTHER_JAN_CODE = "4900000000016"
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+def _record(jan_code=JAN_CODE, url="https://example.com/p/1", brand=None, product_name=None):
+    return {"jan_code": jan_code, "url": url, "brand": brand, "product_name": product_name}
+
+
+def test_validate_record_normalizes_values():
+    row, error = validate_record(_record(jan_code=" 49000009 ", brand="  Brand ", product_name=" "))
+    assert error is None
+    assert row == ("0000049000009", "https://example.com/p/1", "Brand", None)
+
+
+@pytest.mark.parametrize("record, message", [
+    (_record(jan_code="4900000000001"), "invalid jan_code '4900000000001'"),
+    (_record(jan_code=None), "invalid jan_code None"),
+    (_record(url=" "), f"missing url for jan_code {JAN_CODE}"),
+    (_record(brand="b" * 101), f"brand too long for jan_code {JAN_CODE}"),
+    (_record(product_name="p" * 256), f"product_name too long for jan_code {JAN_CODE}"),
+])
+def test_validate_record_rejects_invalid_rows(record, message):
+    row, error = validate_record(record)
+    assert row is None
+    assert error.startswith(message)
+
+
+def test_maximum_lengths_are_accepted():
+    row, error = validate_record(_record(brand="b" * 100, product_name="商" * 255))
+    assert error is None
+
+
+class FakeCursor:
+    def __init__(self, connection) -> None:
+        self.connection = connection
+
+    def execute(self, sql):
+        self.connection.statements.append(" ".join(sql.split()))
+
+    def copy_expert(self, sql, buffer):
+        if self.connection.fail_on_copy == len(self.connection.copies) + 1:
+            raise RuntimeError("COPY failed")
+        self.connection.copies.append(buffer.read())
+
+    def fetchone(self):
+        rows = sum(len(list(csv.reader(io.StringIO(text)))) for text in self.connection.copies)
+        return rows, 0, rows
+
+
+class FakeConnection:
+    """get_engine().raw_connection() の代わり（COPY に渡したテキストとトランザクションの終わり方を記録する）"""
+
+    def __init__(self, fail_on_copy=None) -> None:
+        self.fail_on_copy = fail_on_copy
+        self.statements = []
+        self.copies = []
+        self.events = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.events.append("commit")
+
+    def rollback(self):
+        self.events.append("rollback")
+
+    def close(self):
+        self.events.append("close")
+
+
+@pytest.fixture
+def flushes(monkeypatch):
+    flushes = []
+    monkeypatch.setattr(bulk_import.shared_cache, "flush", lambda: flushes.append(True))
+    return flushes
+
+
+def _use_connection(monkeypatch, connection):
+    engine = type("FakeEngine", (), {"raw_connection": lambda self: connection})()
+    monkeypatch.setattr(bulk_import, "get_engine", lambda: engine)
+
+
+def test_rejected_rows_are_counted_and_reported(monkeypatch, flushes):
+    connection = FakeConnection()
+    _use_connection(monkeypatch, connection)
+
+    result = import_records([
+        _record(),
+        _record(jan_code="4900000000001"),
+        _record(jan_code=OTHER_JAN_CODE, brand="b" * 101),
+        _record(jan_code="49000009"),
+    ], chunk_size=2)
+
+    assert (result.rows_read, result.rows_rejected, result.rows_staged) == (4, 2, 2)
+    assert result.errors == [
+        "line 2: invalid jan_code '4900000000001': check digit mismatch",
+        f"line 3: brand too long for jan_code {OTHER_JAN_CODE}",
+    ]
+    assert len(connection.copies) == 2
+    assert connection.events == ["commit", "close"]
+    assert flushes == [True]
+
+
+def test_failed_import_is_rolled_back(monkeypatch, flushes):
+    """途中のチャンクで失敗した場合は、それまでに投入したチャンクを含めてすべて取り消す"""
+    connection = FakeConnection(fail_on_copy=2)
+    _use_connection(monkeypatch, connection)
+
+    with pytest.raises(RuntimeError):
+        import_records([_record(), _record(jan_code=OTHER_JAN_CODE)], chunk_size=1)
+
+    assert len(connection.copies) == 1
+    assert connection.events == ["rollback", "close"]
+    assert not any(statement.startswith("WITH merged") for statement in connection.statements)
+    assert flushes == []
+
+
+def _copy_text(chunk):
+    connection = FakeConnection()
+    _copy_chunk(FakeCursor(connection), "staging", chunk)
+    return connection.copies[0]
+
+
+def test_copy_text_keeps_tabs_newlines_and_backslashes():
+    url = "https://example.com/p?q=a\\b\tc"
+    product_name = 'line1\nline2\r\n"quoted", \\N'
+    text = _copy_text([(JAN_CODE, url, "Brand", product_name)])
+    assert list(csv.reader(io.StringIO(text, newline=""))) == [[JAN_CODE, url, "Brand", product_name]]
+
+
+def test_copy_text_writes_null_as_an_unquoted_empty_field():
+    """CSV形式の COPY は引用符なしの空の値だけを NULL とする（\\N は NULL にならない）"""
+    text = _copy_text([(JAN_CODE, "https://example.com", None, None)])
+    assert text == f"{JAN_CODE},https://example.com,,\r\n"
+
+
+@pytest.fixture
+def database(monkeypatch, flushes):
+    """TEST_DATABASE_URL の使い捨てのスキーマに jan_url_mapping を作り、インポート先をそこに向ける"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from sqlalchemy import create_engine, text
+
+    schema = f"bulk_import_test_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(TEST_DATABASE_URL)
+    with admin.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+        conn.execute(text(f"CREATE TABLE {schema}.jan_url_mapping (LIKE public.jan_url_mapping INCLUDING ALL)"))
+    engine = create_engine(TEST_DATABASE_URL, connect_args={"options": f"-c search_path={schema}"})
+    monkeypatch.setattr(bulk_import, "get_engine", lambda: engine)
+
+    @contextmanager
+    def connect():
+        with engine.connect() as conn:
+            yield conn
+
+    try:
+        yield connect
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        admin.dispose()
+
+
+def _rows(database):
+    from sqlalchemy import text
+
+    with database() as conn:
+        return conn.execute(text("SELECT jan_code, url, brand, product_name FROM jan_url_mapping ORDER BY gtin")).all()
+
+
+def test_import_into_postgres(database):
+    product_name = 'tab\tnewline\nbackslash\\ "quote" \\N'
+    result = import_records([
+        _record(url="https://example.com/first", brand="Brand"),
+        _record(jan_code=OTHER_JAN_CODE, url="https://example.com/other", brand="", product_name=product_name),
+        # 同じJANコード（正規化後）は最後の行を採用する
+        _record(jan_code="04900000000009", url="https://example.com/last", brand=None),
+    ], chunk_size=2)
+
+    assert (result.rows_staged, result.inserted, result.updated, result.unchanged) == (3, 2, 0, 0)
+    assert _rows(database) == [
+        (JAN_CODE, "https://example.com/last", None, None),
+        (OTHER_JAN_CODE, "https://example.com/other", None, product_name),
+    ]
+
+    again = import_records([
+        _record(url="https://example.com/last"),
+        _record(jan_code=OTHER_JAN_CODE, url="https://example.com/new", product_name=product_name),
+    ])
+    assert (again.inserted, again.updated, again.unchanged) == (0, 1, 1)
+
+
+def test_failed_import_leaves_postgres_unchanged(database, monkeypatch):
+    import_records([_record()])
+    copy_chunk = bulk_import._copy_chunk
+    calls = []
+
+    def fail_on_second_chunk(cursor, staging_table, chunk):
+        calls.append(chunk)
+        if len(calls) == 2:
+            raise RuntimeError("COPY failed")
+        copy_chunk(cursor, staging_table, chunk)
+
+    monkeypatch.setattr(bulk_import, "_copy_chunk", fail_on_second_chunk)
+    with pytest.raises(RuntimeError):
+        import_records([_record(url="https://example.com/changed"), _record(jan_code=OTHER_JAN_CODE)], chunk_size=1)
+
+    assert _rows(database) == [(JAN_CODE, "https://example.com/p/1", None, None)]
@@ -0,0 +1,121 @@
+"""
+プロセス内のルックアップキャッシュ（LookupCache）のテスト
+
+時刻は conftest.py の clock（FakeClock）で進める。
+"""
+from fastapi.testclient import TestClient
+
+from app import lookup, main
+from app.cache import LookupCache, MISSING
+
+JAN_CODE = "4900000000009"
+MISSING_JAN_CODE = "4900000000023"
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = LookupCache(ttl=10.0, clock=clock)
+    cache.set("a", "value")
+    clock.now += 9.9
+    assert cache.get("a") == "value"
+    clock.now += 0.1
+    assert cache.get("a") is MISSING
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["size"]) == (1, 1, 1, 0)
+
+
+def test_negative_entries_use_the_shorter_ttl(clock):
+    cache = LookupCache(ttl=300.0, negative_ttl=30.0, clock=clock)
+    cache.set("missing", None)
+    cache.set("found", "value")
+    clock.now += 29.0
+    assert cache.get("missing") is None
+    clock.now += 1.0
+    assert cache.get("missing") is MISSING
+    assert cache.get("found") == "value"
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = LookupCache(max_entries=2, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_set_with_a_stale_epoch_is_ignored(clock):
+    cache = LookupCache(clock=clock)
+    epoch = cache.epoch
+    cache.invalidate("a")
+    cache.set("a", "old", epoch=epoch)
+    assert cache.get("a") is MISSING
+
+
+def test_invalidating_another_key_does_not_drop_the_fill(clock):
+    cache = LookupCache(clock=clock)
+    epoch = cache.epoch
+    cache.invalidate("b")
+    cache.set("a", "value", epoch=epoch)
+    cache.set("b", "old", epoch=epoch)
+    assert cache.get("a") == "value"
+    assert cache.get("b") is MISSING
+    assert not cache.invalidated_since("a", epoch)
+    assert cache.invalidated_since("b", epoch)
+
+
+def test_clear_drops_fills_started_before_it(clock):
+    cache = LookupCache(clock=clock)
+    epoch = cache.epoch
+    cache.clear()
+    cache.set("a", "old", epoch=epoch)
+    assert cache.get("a") is MISSING
+    cache.set("a", "new", epoch=cache.epoch)
+    assert cache.get("a") == "new"
+
+
+def test_overflowing_tombstones_drop_only_older_fills(clock):
+    """破棄の記録があふれた場合、あふれた記録より前に読み始めた格納はキーによらず捨てる"""
+    cache = LookupCache(clock=clock, max_tombstones=2)
+    before = cache.epoch
+    cache.invalidate("x")
+    after_x = cache.epoch
+    cache.invalidate("y")
+    cache.invalidate("z")
+    cache.set("a", "old", epoch=before)
+    cache.set("b", "value", epoch=after_x)
+    cache.set("y", "old", epoch=after_x)
+    assert cache.get("a") is MISSING
+    assert cache.get("b") == "value"
+    assert cache.get("y") is MISSING
+
+
+def test_disabled_cache_stores_nothing():
+    cache = LookupCache(max_entries=0)
+    cache.set("a", 1)
+    assert cache.get("a") is MISSING
+    assert not cache.stats()["enabled"]
+
+
+def test_found_and_missing_lookups_are_served_from_the_cache(fake_read_connection):
+    fake_read_connection.add(JAN_CODE)
+
+    with TestClient(main.app) as client:
+        for _ in range(3):
+            assert client.get("/api/convert", params={"jan": JAN_CODE}).status_code == 200
+            assert client.get("/api/convert", params={"jan": MISSING_JAN_CODE}).status_code == 404
+
+    assert fake_read_connection.queries == [{"gtin": int(JAN_CODE)}, {"gtin": int(MISSING_JAN_CODE)}]
+
+
+def test_a_miss_is_counted_once(fake_read_connection):
+    fake_read_connection.add(JAN_CODE)
+
+    with TestClient(main.app) as client:
+        client.get("/api/convert", params={"jan": JAN_CODE})
+        client.get("/api/convert", params={"jan": JAN_CODE})
+
+    stats = lookup.lookup_cache.stats()
+    assert (stats["misses"], stats["hits"]) == (1, 1)
@@ -0,0 +1,121 @@
+"""
+DBのサーキットブレーカーと、失効したキャッシュのエントリを返す stale-while-revalidate のテスト
+"""
+from datetime import datetime
+from types import SimpleNamespace
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import exc as sa_exc
+
+from app import lookup
+from app.cache import LookupCache, MISSING
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.main import app
+from app.schemas import JanUrlMappingRecord
+
+JAN_CODE = "4900000000009"
+
+
+def _unavailable() -> sa_exc.OperationalError:
+    return sa_exc.OperationalError("SELECT 1", {}, Exception("connection refused"))
+
+
+def _fail(breaker: CircuitBreaker) -> None:
+    with pytest.raises(sa_exc.OperationalError):
+        with breaker.guard():
+            raise _unavailable()
+
+
+def test_breaker_opens_after_consecutive_failures_and_recovers(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10.0, clock=clock)
+
+    for _ in range(3):
+        _fail(breaker)
+    assert breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError) as raised:
+        with breaker.guard():
+            pass
+    assert raised.value.retry_after == 10.0
+
+    # 期間が過ぎると1件だけ試行し、失敗すれば再び開く
+    clock.now += 10.0
+    assert breaker.state == "half_open"
+    _fail(breaker)
+    assert breaker.state == "open"
+
+    clock.now += 10.0
+    with breaker.guard():
+        pass
+    assert breaker.state == "closed"
+    assert breaker.stats()["opens"] == 2
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_query_errors_are_not_counted_as_failures():
+    breaker = CircuitBreaker(failure_threshold=1)
+    with pytest.raises(sa_exc.IntegrityError):
+        with breaker.guard():
+            raise sa_exc.IntegrityError("INSERT", {}, Exception("duplicate key"))
+    assert breaker.state == "closed"
+
+
+def test_cache_keeps_expired_entries_for_stale_ttl(clock):
+    cache = LookupCache(ttl=10.0, stale_ttl=60.0, clock=clock)
+    cache.set(JAN_CODE, "value")
+
+    assert cache.get_stale(JAN_CODE) is MISSING
+    clock.now += 30.0
+    assert cache.get(JAN_CODE) is MISSING
+    assert cache.get_stale(JAN_CODE) == "value"
+    clock.now += 40.0
+    assert cache.get_stale(JAN_CODE) is MISSING
+    assert cache.stats()["stale_hits"] == 1
+
+
+@pytest.fixture
+def stale_lookup(monkeypatch, clock, fake_read_connection):
+    """失効後も60秒保持するキャッシュと、接続できないDBに差し替える"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    cache = LookupCache(ttl=10.0, stale_ttl=60.0, clock=clock)
+    fake_read_connection.breaker = breaker
+    fake_read_connection.error = _unavailable()
+
+    monkeypatch.setattr(lookup, "lookup_cache", cache)
+    monkeypatch.setattr(lookup, "db_breaker", breaker)
+    return SimpleNamespace(clock=clock, breaker=breaker, cache=cache, connects=fake_read_connection.connects)
+
+
+def test_stale_entry_is_served_while_database_is_unavailable(stale_lookup):
+    record = JanUrlMappingRecord(
+        jan_code=JAN_CODE, url="https://example.com/products/1", brand=None, product_name=None,
+        updated_at=datetime(2024, 1, 1),
+    )
+    stale_lookup.cache.set(JAN_CODE, record)
+    stale_lookup.clock.now += 20.0
+
+    # 古い値を返し、バックグラウンドの再取得が失敗してブレーカーが開く
+    assert lookup.fetch_mapping(JAN_CODE) is record
+    deadline = time.monotonic() + 5
+    while lookup.stale_refresh_stats()["in_progress"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert stale_lookup.breaker.state == "open"
+
+    # 開いている間は再取得せずに古い値を返し続ける
+    connects = len(stale_lookup.connects)
+    assert lookup.fetch_mapping(JAN_CODE) is record
+    assert len(stale_lookup.connects) == connects
+    assert lookup.stale_refresh_stats()["skipped"] >= 1
+
+
+def test_uncached_lookup_fails_fast_with_503_while_open(stale_lookup):
+    _fail(stale_lookup.breaker)
+
+    with TestClient(app) as client:
+        response = client.get("/api/convert", params={"jan": JAN_CODE})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+    assert stale_lookup.connects == []
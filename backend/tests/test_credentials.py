@@ -0,0 +1,164 @@
+"""
+DB認証情報のプロバイダ（app/credentials.py）と接続時の注入（database._inject_credentials）のテスト
+
+Parameters and Secrets Lambda Extension のエンドポイントはローカルのHTTPスタブサーバーに差し替える。
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import urllib.parse
+
+import pytest
+
+from app import database
+from app.credentials import SecretProvider, is_authentication_error
+
+SECRET_ARN = "arn:aws:secretsmanager:ap-northeast-1:123456789012:secret:bronzedraw-db"
+
+
+class SecretsExtensionStub:
+    """/secretsmanager/get に現在のパスワードを返すスタブ（requests に受け取ったクエリとヘッダーを記録する）"""
+
+    def __init__(self) -> None:
+        self.password = "password-1"
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                stub.requests.append((url.path, urllib.parse.parse_qs(url.query), self.headers.get("X-Aws-Parameters-Secrets-Token")))
+                secret = {"username": "app", "password": stub.password}
+                body = json.dumps({"ARN": SECRET_ARN, "SecretString": json.dumps(secret)}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}/"
+        self._thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+
+
+class FakeDialect:
+    """dialect.connect の代わりに、渡された認証情報を記録して errors の例外を順に送出する"""
+
+    def __init__(self, *errors) -> None:
+        self.errors = list(errors)
+        self.attempts = []
+
+    def connect(self, *cargs, **cparams):
+        self.attempts.append((cparams["user"], cparams["password"]))
+        if self.errors:
+            raise self.errors.pop(0)
+        return "connection"
+
+
+class InvalidPasswordError(Exception):
+    """asyncpg の認証エラーと同じ名前の例外"""
+
+
+@pytest.fixture
+def extension(monkeypatch):
+    monkeypatch.setenv("AWS_SESSION_TOKEN", "session-token")
+    stub = SecretsExtensionStub()
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def provider(extension, clock):
+    return SecretProvider(SECRET_ARN, ttl=300.0, extension_endpoint=extension.endpoint, clock=clock)
+
+
+def test_secret_is_fetched_from_the_extension(provider, extension):
+    assert provider.get() == {"username": "app", "password": "password-1"}
+    assert extension.requests == [("/secretsmanager/get", {"secretId": [SECRET_ARN]}, "session-token")]
+
+
+def test_secret_is_cached_until_the_ttl_expires(provider, extension, clock):
+    provider.get()
+    extension.password = "password-2"
+    clock.now += 299.0
+    assert provider.get()["password"] == "password-1"
+    clock.now += 1.0
+    assert provider.get()["password"] == "password-2"
+    assert provider.fetch_count == len(extension.requests) == 2
+
+
+def test_force_refresh_and_invalidate_fetch_again(provider, extension):
+    provider.get()
+    extension.password = "password-2"
+    assert provider.get(force_refresh=True)["password"] == "password-2"
+    extension.password = "password-3"
+    provider.invalidate()
+    assert provider.get()["password"] == "password-3"
+    assert provider.fetch_count == 3
+
+
+def test_nothing_is_fetched_before_the_first_get(extension):
+    SecretProvider(SECRET_ARN, extension_endpoint=extension.endpoint)
+    assert extension.requests == []
+
+
+@pytest.mark.parametrize("error, expected", [
+    (Exception('FATAL:  password authentication failed for user "app"'), True),
+    (InvalidPasswordError("password authentication failed"), True),
+    (Exception("could not connect to server: Connection refused"), False),
+])
+def test_is_authentication_error(error, expected):
+    assert is_authentication_error(error) is expected
+
+
+def test_inject_credentials_uses_the_cached_secret(provider, extension, monkeypatch):
+    monkeypatch.setattr(database, "secret_provider", provider)
+    dialect = FakeDialect()
+
+    for _ in range(2):
+        assert database._inject_credentials(dialect, None, (), {"host": "db"}) == "connection"
+
+    assert dialect.attempts == [("app", "password-1")] * 2
+    assert len(extension.requests) == 1
+
+
+def test_inject_credentials_retries_once_after_rotation(provider, extension, monkeypatch):
+    """ローテーション後の認証失敗ではシークレットを再取得して1回だけ再試行する"""
+    monkeypatch.setattr(database, "secret_provider", provider)
+    provider.get()
+    extension.password = "password-2"
+    dialect = FakeDialect(Exception('FATAL:  password authentication failed for user "app"'))
+
+    assert database._inject_credentials(dialect, None, (), {"host": "db"}) == "connection"
+    assert dialect.attempts == [("app", "password-1"), ("app", "password-2")]
+    assert provider.fetch_count == 2
+
+
+def test_inject_credentials_does_not_retry_twice(provider, extension, monkeypatch):
+    monkeypatch.setattr(database, "secret_provider", provider)
+    error = InvalidPasswordError("password authentication failed")
+    dialect = FakeDialect(error, error)
+
+    with pytest.raises(InvalidPasswordError):
+        database._inject_credentials(dialect, None, (), {"host": "db"})
+    assert len(dialect.attempts) == 2
+
+
+def test_inject_credentials_reraises_other_errors_without_refreshing(provider, extension, monkeypatch):
+    monkeypatch.setattr(database, "secret_provider", provider)
+    error = ConnectionRefusedError("could not connect to server")
+    dialect = FakeDialect(error)
+
+    with pytest.raises(ConnectionRefusedError):
+        database._inject_credentials(dialect, None, (), {"host": "db"})
+    assert len(dialect.attempts) == 1
+    assert provider.fetch_count == 1
@@ -0,0 +1,48 @@
+"""
+/api/convert のレスポンスボディのエンコード（encode_mapping）のテスト
+
+response_model（JanUrlMapping）と JSONResponse でシリアライズした場合とバイト単位で一致することを確かめる。
+"""
+from datetime import datetime
+
+import pytest
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from app import encoding, main
+from app.schemas import JanUrlMapping, JanUrlMappingRecord
+
+JAN_CODE = "4900000000009"
+
+RECORDS = [
+    JanUrlMappingRecord(jan_code=JAN_CODE, url="https://example.com/p/1", brand="Brand", product_name="Product", updated_at=datetime(2024, 1, 1)),
+    JanUrlMappingRecord(jan_code=JAN_CODE, url="https://example.com/p?q=\"a\"&b=\\", brand=None, product_name=None),
+    JanUrlMappingRecord(jan_code=JAN_CODE, url="https://例え.jp/商品/1", brand="ブランド ", product_name="緑茶 500ml 😀\t\n"),
+]
+
+
+def _pydantic_body(record: JanUrlMappingRecord) -> bytes:
+    return JSONResponse(JanUrlMapping.model_validate(record.model_dump()).model_dump()).body
+
+
+@pytest.mark.parametrize("record", RECORDS)
+def test_encode_mapping_matches_pydantic_serialization(record):
+    assert encoding.encode_mapping(record) == _pydantic_body(record)
+
+
+@pytest.mark.parametrize("record", RECORDS)
+def test_json_fallback_matches_pydantic_serialization(monkeypatch, record):
+    """orjson がない環境の標準 json でも同じバイト列になる"""
+    monkeypatch.setattr(encoding, "_dumps", encoding._dumps_json)
+    assert encoding.encode_mapping(record) == _pydantic_body(record)
+
+
+def test_convert_response_body(fake_read_connection):
+    row = fake_read_connection.add(JAN_CODE, brand=None, product_name="緑茶")
+
+    with TestClient(main.app) as client:
+        response = client.get("/api/convert", params={"jan": JAN_CODE})
+
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == {"jan_code": JAN_CODE, "url": row.url, "brand": None, "product_name": "緑茶"}
+    assert "updated_at" not in response.json()
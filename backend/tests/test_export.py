@@ -0,0 +1,87 @@
+"""
+全件エクスポート（/api/export）の再開（after_jan）のテスト
+
+読み出しのセッションは、クエリの gtin の下限（after_jan）より後ろの行を gtin 順に返すセッションに差し替える。
+"""
+from contextlib import contextmanager
+import gzip
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import export, main
+
+JAN_CODES = ["0000049000009", "4900000000009", "4900000000016"]
+
+
+class FakeSession:
+    def __init__(self, rows) -> None:
+        self.rows = rows
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        lower = list(statement.compile().params.values())
+        return [row for row in sorted(self.rows) if not lower or row[0] > lower[0]]
+
+
+@pytest.fixture
+def session(monkeypatch):
+    rows = [(int(jan), f"https://example.com/products/{jan}", None if i == 0 else "Brand", "商品") for i, jan in enumerate(JAN_CODES)]
+    fake = FakeSession(rows)
+
+    @contextmanager
+    def scope():
+        yield fake
+
+    monkeypatch.setattr(export, "read_session_scope", scope)
+    return fake
+
+
+def _ndjson(content: bytes):
+    return [json.loads(line) for line in content.decode("utf-8").splitlines()]
+
+
+def test_resume_after_jan_continues_from_the_next_code(session):
+    with TestClient(main.app) as client:
+        full = client.get("/api/export")
+        resumed = client.get("/api/export", params={"after_jan": JAN_CODES[0]})
+
+    assert full.headers["content-type"] == "application/x-ndjson"
+    rows = _ndjson(full.content)
+    assert [row["jan_code"] for row in rows] == JAN_CODES
+    assert rows[0] == {"jan_code": JAN_CODES[0], "url": f"https://example.com/products/{JAN_CODES[0]}", "brand": None, "product_name": "商品"}
+    # 最後に受け取った jan_code を after_jan に指定すると、続きの行だけが返る（連結すると全件と一致する）
+    assert rows[:1] + _ndjson(resumed.content) == rows
+
+
+def test_resume_accepts_an_unpadded_jan_code(session):
+    """0埋めしていない jan_code も gtin の値として比較する"""
+    chunks = export.export_chunks(after_jan="49000009")
+    assert [row["jan_code"] for row in _ndjson(b"".join(chunks))] == JAN_CODES[1:]
+
+
+def test_resumed_csv_has_no_header(session):
+    with TestClient(main.app) as client:
+        full = client.get("/api/export", params={"format": "csv"}).text.splitlines()
+        resumed = client.get("/api/export", params={"format": "csv", "after_jan": JAN_CODES[1]}).text.splitlines()
+
+    assert full[0] == "jan_code,url,brand,product_name"
+    assert full[1] == f"{JAN_CODES[0]},https://example.com/products/{JAN_CODES[0]},,商品"
+    assert resumed == full[3:]
+
+
+def test_gzip_export_decompresses_to_the_same_rows(session):
+    with TestClient(main.app) as client:
+        plain = client.get("/api/export", params={"after_jan": JAN_CODES[0]}).content
+        compressed = client.get("/api/export", params={"after_jan": JAN_CODES[0], "gzip": "true"})
+
+    assert compressed.headers["content-type"] == "application/gzip"
+    assert gzip.decompress(compressed.content) == plain
+
+
+def test_invalid_after_jan_is_rejected(session):
+    with TestClient(main.app) as client:
+        assert client.get("/api/export", params={"after_jan": "49000000000x9"}).status_code == 422
+    assert session.statements == []
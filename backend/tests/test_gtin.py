@@ -0,0 +1,61 @@
+"""
+JAN / GTIN コードの検証と正規化のテスト
+
+ベクトル化した normalize_batch がコードごとの normalize_gtin と同じ結果になることを確かめる。
+"""
+import random
+
+import pytest
+
+from app.gtin import InvalidGtinError, check_digit, is_valid_gtin, normalize_batch, normalize_gtin
+
+CASES = [
+    # (入力, 正規化したJANコード（不正な場合は None）)
+    ("4900000000009", "4900000000009"),  # GTIN-13
+    ("049000000009", "0049000000009"),  # UPC-A
+    ("49000009", "0000049000009"),  # EAN-8
+    ("04900000000009", "4900000000009"),  # GTIN-14（インジケータ0）
+    (" 4900000000009\n", "4900000000009"),  # 前後の空白
+    ("4900000000001", None),  # チェックデジット不一致
+    ("049000000001", None),
+    ("49000001", None),
+    ("04900000000001", None),
+    ("14900000000006", None),  # インジケータ付きのGTIN-14
+    ("490000000000", None),  # 桁数
+    ("490000000000x", None),  # 数字以外
+    ("４９００００００００００９", None),  # 全角数字
+    ("", None),
+]
+
+
+@pytest.mark.parametrize("code, expected", CASES)
+def test_normalize_gtin(code, expected):
+    if expected is None:
+        with pytest.raises(InvalidGtinError):
+            normalize_gtin(code)
+    else:
+        assert normalize_gtin(code) == expected
+    assert is_valid_gtin(code) == (expected is not None)
+
+
+def test_batch_matches_single_normalization():
+    assert normalize_batch([code for code, _ in CASES]) == [expected for _, expected in CASES]
+
+
+def test_batch_matches_single_normalization_on_random_codes():
+    rng = random.Random(0)
+    codes = []
+    for _ in range(2000):
+        body = "".join(rng.choice("0123456789") for _ in range(rng.choice((7, 11, 12, 13))))
+        digit = check_digit(body.encode("ascii"))
+        # 半分はチェックデジットを1つずらす
+        codes.append(body + str(digit if rng.random() < 0.5 else (digit + 1) % 10))
+
+    expected = [normalize_gtin(code) if is_valid_gtin(code) else None for code in codes]
+    assert normalize_batch(codes) == expected
+    assert None in expected and any(expected)
+
+
+def test_batch_of_only_invalid_codes():
+    assert normalize_batch(["abc", "1"]) == [None, None]
+    assert normalize_batch([]) == []
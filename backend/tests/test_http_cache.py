@@ -0,0 +1,72 @@
+"""
+/api/convert のHTTPキャッシュ（ETag・Cache-Control・304）のテスト
+
+DBへの接続は conftest.py の fake_read_connection に差し替える。
+"""
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from app import lookup, main
+from app.http_cache import cache_control_for_hit, cache_control_for_invalid, cache_control_for_miss, is_not_modified
+
+JAN_CODE = "4900000000009"
+MISSING_JAN_CODE = "4900000000023"
+
+
+def test_hit_has_etag_and_cache_control(fake_read_connection):
+    fake_read_connection.add(JAN_CODE)
+
+    with TestClient(main.app) as client:
+        response = client.get("/api/convert", params={"jan": JAN_CODE})
+
+    assert response.status_code == 200
+    assert response.headers["etag"].startswith(f'"{JAN_CODE}-')
+    assert response.headers["cache-control"] == cache_control_for_hit()
+    assert response.headers["cache-control"].startswith("public, max-age=")
+
+
+def test_matching_if_none_match_returns_304_without_a_body(fake_read_connection):
+    fake_read_connection.add(JAN_CODE)
+
+    with TestClient(main.app) as client:
+        etag = client.get("/api/convert", params={"jan": JAN_CODE}).headers["etag"]
+        response = client.get("/api/convert", params={"jan": JAN_CODE}, headers={"If-None-Match": f'"other", W/{etag}'})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert response.headers["cache-control"] == cache_control_for_hit()
+
+
+def test_etag_changes_when_the_mapping_is_updated(fake_read_connection):
+    fake_read_connection.add(JAN_CODE)
+
+    with TestClient(main.app) as client:
+        etag = client.get("/api/convert", params={"jan": JAN_CODE}).headers["etag"]
+        fake_read_connection.add(JAN_CODE, url="https://example.com/new", updated_at=datetime(2024, 6, 1))
+        lookup.lookup_cache.clear()
+        response = client.get("/api/convert", params={"jan": JAN_CODE}, headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.json()["url"] == "https://example.com/new"
+    assert response.headers["etag"] != etag
+
+
+def test_miss_and_invalid_codes_have_their_own_cache_control(fake_read_connection):
+    with TestClient(main.app) as client:
+        missing = client.get("/api/convert", params={"jan": MISSING_JAN_CODE})
+        invalid = client.get("/api/convert", params={"jan": "4900000000001"})
+
+    assert missing.status_code == 404
+    assert missing.headers["cache-control"] == cache_control_for_miss()
+    assert "etag" not in missing.headers
+    assert invalid.status_code == 422
+    assert invalid.headers["cache-control"] == cache_control_for_invalid()
+
+
+def test_is_not_modified():
+    assert is_not_modified("*", '"a-1"')
+    assert is_not_modified('W/"a-1"', '"a-1"')
+    assert not is_not_modified('"a-2"', '"a-1"')
+    assert not is_not_modified(None, '"a-1"')
@@ -0,0 +1,167 @@
+"""
+変更の通知（LISTEN / NOTIFY）によるキャッシュの破棄のテスト
+
+DBには接続せず、通知はパイプで読み取り可能にする DBAPI 接続の代わり（FakeListenConnection）から届ける。
+"""
+from datetime import datetime
+from types import SimpleNamespace
+import os
+import threading
+import time
+
+import pytest
+
+from app import lookup
+from app.cache import LookupCache
+from app.invalidation import ChangeBatch, InvalidationListener, parse_payload
+from app.schemas import JanUrlMappingRecord
+
+JAN_CODES = ["4900000000009", "4900000000016", "4900000000023"]
+
+
+def _wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def _record(jan_code: str) -> JanUrlMappingRecord:
+    return JanUrlMappingRecord(
+        jan_code=jan_code, url=f"https://example.com/products/{jan_code}", brand=None, product_name=None,
+        updated_at=datetime(2024, 1, 1),
+    )
+
+
+class FakeListenConnection:
+    """psycopg2 の LISTEN 中の接続の代わり（notify で届けた通知を poll で notifies に積む）"""
+
+    def __init__(self) -> None:
+        self._read, self._write = os.pipe()
+        self._lock = threading.Lock()
+        self._pending = []
+        self.notifies = []
+        self.autocommit = False
+        self.executed = []
+        self.closed = False
+
+    def notify(self, *payloads: str) -> None:
+        with self._lock:
+            self._pending.extend(payloads)
+        os.write(self._write, b"x")
+
+    def fileno(self) -> int:
+        return self._read
+
+    def poll(self) -> None:
+        os.read(self._read, 1024)
+        with self._lock:
+            self.notifies.extend(SimpleNamespace(payload=payload) for payload in self._pending)
+            self._pending.clear()
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql):
+                connection.executed.append(sql)
+
+        return Cursor()
+
+    def close(self) -> None:
+        self.closed = True
+        os.close(self._read)
+        os.close(self._write)
+
+
+def test_parse_payload():
+    assert parse_payload("4900000000009,4900000000016") == {"4900000000009", "4900000000016"}
+    assert parse_payload("*") is None
+    # 不正な値は無視する（チェックディジットは検証しない）
+    assert parse_payload("4900000000000,abc,") == {"4900000000000"}
+
+
+def test_batch_falls_back_to_full_flush():
+    batch = ChangeBatch(max_keys=3)
+    batch.add("4900000000009,4900000000016")
+    assert batch.changes() == {"4900000000009", "4900000000016"}
+    batch.add("4900000000023,4900000000030")
+    assert batch.changes() is None
+
+    batch = ChangeBatch(max_keys=3)
+    batch.add("*")
+    batch.add("4900000000009")
+    assert batch.changes() is None
+    assert not ChangeBatch()
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = LookupCache(ttl=3600.0)
+    monkeypatch.setattr(lookup, "lookup_cache", cache)
+    for jan_code in JAN_CODES:
+        cache.set(jan_code, _record(jan_code))
+    return cache
+
+
+def test_apply_remote_changes_evicts_only_notified_codes(cache):
+    assert lookup.apply_remote_changes([JAN_CODES[0], "4900000000993"]) == 1
+    assert JAN_CODES[0] not in cache
+    assert JAN_CODES[1] in cache and JAN_CODES[2] in cache
+
+    assert lookup.apply_remote_changes(None) == 2
+    assert len(cache) == 0
+
+
+def test_value_read_before_invalidation_is_not_cached(cache):
+    """DBから読んでいる間に変更の通知で破棄された場合、読んだ古い値でキャッシュを上書きしない"""
+    epoch = cache.epoch
+    lookup.apply_remote_changes([JAN_CODES[0]])
+    cache.set(JAN_CODES[0], _record(JAN_CODES[0]), epoch)
+    assert JAN_CODES[0] not in cache
+
+
+def test_listener_coalesces_notification_storm():
+    """一括更新で続けて届いた通知は1回の破棄にまとめ、再接続したときは全件を破棄する"""
+    connections = []
+    applied = []
+
+    def connect():
+        connections.append(FakeListenConnection())
+        return connections[-1]
+
+    def apply(jan_codes, refresh=False):
+        applied.append(None if jan_codes is None else set(jan_codes))
+        return 0
+
+    listener = InvalidationListener(connect=connect, apply=apply, batch_seconds=0.2, max_keys=100, reconnect_seconds=0.01)
+    listener.start()
+    try:
+        _wait_for(lambda: listener.stats()["connected"])
+        assert connections[0].autocommit is True
+        assert connections[0].executed == ["LISTEN jan_url_mapping_changed"]
+
+        for jan_code in JAN_CODES:
+            connections[0].notify(jan_code, jan_code)
+        _wait_for(lambda: applied)
+        assert applied == [set(JAN_CODES)]
+        assert listener.stats()["notifications"] == 6
+
+        # 接続が切れたら再接続し、切断中の通知は届かないため全件を破棄する
+        connections[0].poll = lambda: (_ for _ in ()).throw(OSError("server closed the connection"))
+        connections[0].notify("*")
+        _wait_for(lambda: len(applied) == 2)
+        assert applied[1] is None
+        stats = listener.stats()
+        assert stats["reconnects"] == 1
+        assert stats["errors"] == 1
+        assert stats["full_flushes"] == 1
+        assert connections[0].closed
+    finally:
+        listener.stop()
+    assert not listener.stats()["enabled"]
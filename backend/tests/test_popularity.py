@@ -0,0 +1,190 @@
+"""
+ルックアップのヒット件数の集計とコールドスタート時のキャッシュのウォームアップのテスト
+
+書き込み（upsert_stats）は受け取った (gtin, 件数) のリストを記録する関数に、
+DBへの接続は conftest.py の fake_read_connection（ウォームアップのクエリには追加した順に行を返す）に差し替える。
+"""
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import lookup, main
+from app.cache import LookupCache, MISSING
+from app.popularity import LookupStatsRecorder
+
+JAN_CODE = "4900000000009"
+OTHER_JAN_CODE = "4900000000016"
+MISSING_JAN_CODE = "4900000000993"
+
+
+class RecordingWrite:
+    """書き込まれたリストを記録する（fail が True の間は失敗する）"""
+
+    def __init__(self) -> None:
+        self.batches = []
+        self.attempts = 0
+        self.fail = False
+        self.written = threading.Event()
+
+    def __call__(self, counts):
+        self.attempts += 1
+        if self.fail:
+            raise ConnectionError("database unavailable")
+        self.batches.append(counts)
+        self.written.set()
+
+
+def test_counts_are_aggregated_into_one_sorted_write():
+    write = RecordingWrite()
+    recorder = LookupStatsRecorder(enabled=True, write=write)
+    recorder.record(OTHER_JAN_CODE)
+    recorder.record_many([JAN_CODE, OTHER_JAN_CODE, JAN_CODE])
+    recorder.record(JAN_CODE)
+
+    assert write.batches == []
+    assert recorder.flush() == 2
+    assert write.batches == [[(int(JAN_CODE), 3), (int(OTHER_JAN_CODE), 2)]]
+    assert recorder.flush() == 0
+    assert len(write.batches) == 1
+    stats = recorder.stats()
+    assert stats["recorded"] == 5
+    assert stats["rows_written"] == 2
+    assert stats["pending_keys"] == 0
+
+
+def test_failed_write_is_carried_over():
+    write = RecordingWrite()
+    recorder = LookupStatsRecorder(enabled=True, write=write)
+    recorder.record(JAN_CODE)
+    write.fail = True
+    with pytest.raises(ConnectionError):
+        recorder.flush()
+    assert recorder.stats()["errors"] == 1
+
+    recorder.record(JAN_CODE)
+    write.fail = False
+    recorder.flush()
+    assert write.batches == [[(int(JAN_CODE), 2)]]
+
+
+def test_new_codes_over_max_keys_are_dropped():
+    recorder = LookupStatsRecorder(enabled=True, max_keys=1, write=RecordingWrite())
+    recorder.record(JAN_CODE)
+    recorder.record(OTHER_JAN_CODE)
+    recorder.record(JAN_CODE)
+    stats = recorder.stats()
+    assert stats["pending_keys"] == 1
+    assert stats["recorded"] == 2
+    assert stats["dropped"] == 1
+
+
+def test_disabled_recorder_does_nothing():
+    write = RecordingWrite()
+    recorder = LookupStatsRecorder(enabled=False, write=write)
+    recorder.record(JAN_CODE)
+    recorder.start()
+    assert recorder.flush() == 0
+    assert recorder._thread is None
+    assert write.batches == []
+
+
+def test_background_thread_flushes_and_stop_writes_the_rest():
+    write = RecordingWrite()
+    recorder = LookupStatsRecorder(enabled=True, flush_seconds=0.01, write=write)
+    recorder.start()
+    try:
+        recorder.record(JAN_CODE)
+        assert write.written.wait(5.0)
+    finally:
+        recorder.stop()
+    recorder.record(OTHER_JAN_CODE)
+    recorder.stop()
+    assert write.batches == [[(int(JAN_CODE), 1)], [(int(OTHER_JAN_CODE), 1)]]
+
+
+def test_saturated_recorder_backs_off_while_writes_fail():
+    """上限に達したまま書き込みに失敗し続けても、書き込みのスレッドは空回りせず間隔を延ばす"""
+    write = RecordingWrite()
+    write.fail = True
+    recorder = LookupStatsRecorder(enabled=True, flush_seconds=0.02, max_keys=10, write=write)
+    recorder.record_many(str(4900000000000 + i) for i in range(10))
+    recorder.start()
+    try:
+        # 上限を超えた新しいJANコードを数え続ける（失敗のたびに件数が戻され、上限に達したままになる）
+        deadline = time.monotonic() + 0.5
+        i = 0
+        while time.monotonic() < deadline:
+            recorder.record(str(4910000000000 + i))
+            i += 1
+            time.sleep(0.0005)
+    finally:
+        write.fail = False
+        recorder._stop.set()
+        recorder._thread.join(5.0)
+    # 0.02 + 0.04 + 0.08 + 0.16 + 0.32 秒ごとなので、0.5秒の間の試行は数回
+    assert 1 <= write.attempts <= 6
+    stats = recorder.stats()
+    assert stats["pending_keys"] == 10
+    assert stats["dropped"] == i
+
+
+def test_flush_is_skipped_while_the_database_is_unavailable():
+    write = RecordingWrite()
+    recorder = LookupStatsRecorder(enabled=True, flush_seconds=0.01, write=write, available=lambda: False)
+    recorder.record(JAN_CODE)
+    recorder.start()
+    time.sleep(0.1)
+    recorder._stop.set()
+    recorder._thread.join(5.0)
+    assert write.attempts == 0
+    assert recorder.stats()["skipped"] >= 1
+    assert recorder.stats()["pending_keys"] == 1
+
+
+def test_requests_only_count_found_mappings(monkeypatch, fake_read_connection):
+    """リクエストの処理中は数えるだけで書き込まない（キャッシュヒット・バッチ変換も数え、404は数えない）"""
+    write = RecordingWrite()
+    recorder = LookupStatsRecorder(enabled=True, write=write)
+    monkeypatch.setattr(main, "lookup_stats", recorder)
+    fake_read_connection.add(JAN_CODE)
+    fake_read_connection.add(OTHER_JAN_CODE)
+
+    with TestClient(main.app) as client:
+        assert client.get("/api/convert", params={"jan": JAN_CODE}).status_code == 200
+        assert client.get("/api/convert", params={"jan": JAN_CODE}).status_code == 200
+        assert client.get("/api/convert", params={"jan": MISSING_JAN_CODE}).status_code == 404
+        response = client.post("/api/convert/batch", json={"jan_codes": [OTHER_JAN_CODE, MISSING_JAN_CODE]})
+        assert response.status_code == 200
+
+    assert write.batches == []
+    recorder.flush()
+    assert write.batches == [[(int(JAN_CODE), 2), (int(OTHER_JAN_CODE), 1)]]
+
+
+def test_warm_up_loads_popular_mappings_in_one_query(monkeypatch, fake_read_connection):
+    """件数の多い順に返る行のうちキャッシュに入る件数だけを1回のクエリで読み、最も多いJANコードがLRUで最後まで残る"""
+    cache = LookupCache(ttl=60.0, max_entries=3)
+    monkeypatch.setattr(lookup, "lookup_cache", cache)
+    popular = [fake_read_connection.add(str(4900000000000 + i * 7).zfill(13)) for i in range(5)]
+    codes = [str(row.gtin).zfill(13) for row in popular]
+
+    assert lookup.warm_up_cache(limit=10, window_days=7) == 3
+    assert fake_read_connection.queries == [{"days": 7, "limit": 3}]
+    assert lookup.warm_up_stats()["entries"] == 3
+    assert cache.stats()["size"] == 3
+
+    # 次のエントリで追い出されるのは3番目に多いJANコード
+    cache.set(codes[4], None)
+    assert cache.get(codes[2]) is MISSING
+    assert lookup.fetch_mapping(codes[0]).url == popular[0].url
+    assert lookup.fetch_mapping(codes[1]).url == popular[1].url
+    assert len(fake_read_connection.queries) == 1
+
+
+def test_warm_up_failure_starts_with_an_empty_cache(fake_read_connection):
+    fake_read_connection.error = ConnectionError("database unavailable")
+    assert lookup.warm_up_cache(limit=100) == 0
+    assert lookup.warm_up_stats()["failed"]
+    assert lookup.lookup_cache.stats()["size"] == 0
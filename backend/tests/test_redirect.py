@@ -0,0 +1,66 @@
+"""
+スキャナー・QRコード向けのリダイレクト（GET /r/{jan}）のテスト
+
+DBへの接続は conftest.py の fake_read_connection に差し替える。
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.http_cache import cache_control_for_hit, cache_control_for_invalid, cache_control_for_miss
+
+JAN_CODE = "4900000000009"
+MISSING_JAN_CODE = "4900000000023"
+FALLBACK_URL = "https://app.example.com/?jan={jan}"
+
+
+@pytest.fixture
+def client(fake_read_connection):
+    with TestClient(main.app, follow_redirects=False) as client:
+        yield client
+
+
+def test_registered_code_redirects_to_its_url(client, fake_read_connection):
+    row = fake_read_connection.add(JAN_CODE)
+
+    response = client.get(f"/r/{JAN_CODE}")
+
+    assert response.status_code == 302
+    assert response.headers["location"] == row.url
+    assert response.headers["cache-control"] == cache_control_for_hit()
+
+
+def test_non_13_digit_codes_are_normalized(client, fake_read_connection):
+    row = fake_read_connection.add("0000049000009")
+    assert client.get("/r/49000009").headers["location"] == row.url
+
+
+def test_miss_and_invalid_codes_redirect_to_the_fallback(client, fake_read_connection, monkeypatch):
+    monkeypatch.setattr(main, "REDIRECT_FALLBACK_URL", FALLBACK_URL)
+
+    missing = client.get(f"/r/{MISSING_JAN_CODE}")
+    invalid = client.get("/r/4900000000001")
+    # スキャンしたコードはクエリ文字列としてエスケープする
+    garbage = client.get("/r/12%2034&x")
+
+    assert missing.status_code == 302
+    assert missing.headers["location"] == f"https://app.example.com/?jan={MISSING_JAN_CODE}"
+    assert missing.headers["cache-control"] == cache_control_for_miss()
+    assert invalid.status_code == 302
+    assert invalid.headers["location"] == "https://app.example.com/?jan=4900000000001"
+    assert invalid.headers["cache-control"] == cache_control_for_invalid()
+    assert garbage.headers["location"] == "https://app.example.com/?jan=12%2034%26x"
+    # 不正なコードはDBに問い合わせない
+    assert fake_read_connection.queries == [{"gtin": int(MISSING_JAN_CODE)}]
+
+
+def test_without_a_fallback_miss_and_invalid_codes_are_errors(client, monkeypatch):
+    monkeypatch.setattr(main, "REDIRECT_FALLBACK_URL", None)
+
+    missing = client.get(f"/r/{MISSING_JAN_CODE}")
+    invalid = client.get("/r/4900000000001")
+
+    assert missing.status_code == 404
+    assert missing.headers["cache-control"] == cache_control_for_miss()
+    assert invalid.status_code == 422
+    assert invalid.headers["cache-control"] == cache_control_for_invalid()
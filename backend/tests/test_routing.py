@@ -0,0 +1,136 @@
+"""
+読み取り・書き込みの振り分け（app/routing.py）のテスト
+
+時刻は conftest.py の clock（FakeClock）で進める。エンジンとセッションは接続先を記録するだけのものに差し替える。
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from app import routing
+from app.routing import WriteTracker
+
+JAN_CODE = "4900000000009"
+OTHER_JAN_CODE = "4900000000016"
+
+WRITER = "writer"
+READER = "reader"
+
+
+def test_recently_written_key_is_read_from_the_writer(clock):
+    tracker = WriteTracker(window=5.0, clock=clock)
+    tracker.record([JAN_CODE])
+
+    assert tracker.use_writer([JAN_CODE])
+    assert tracker.use_writer([OTHER_JAN_CODE, JAN_CODE])
+    assert not tracker.use_writer([OTHER_JAN_CODE])
+    # キーを指定しない範囲の読み取りは、いずれかの書き込みがあればライターから読む
+    assert tracker.use_writer()
+    assert (tracker.writer_reads, tracker.reader_reads) == (3, 1)
+
+
+def test_writes_expire_after_the_window(clock):
+    tracker = WriteTracker(window=5.0, clock=clock)
+    tracker.record([JAN_CODE])
+    clock.now += 4.9
+    assert tracker.use_writer([JAN_CODE])
+    clock.now += 0.1
+    assert not tracker.use_writer([JAN_CODE])
+    assert not tracker.use_writer()
+
+
+def test_write_without_keys_routes_every_read_to_the_writer(clock):
+    tracker = WriteTracker(window=5.0, clock=clock)
+    tracker.record()
+    assert tracker.use_writer([OTHER_JAN_CODE])
+    clock.now += 5.0
+    assert not tracker.use_writer([OTHER_JAN_CODE])
+
+
+def test_expired_keys_are_pruned(clock):
+    tracker = WriteTracker(window=5.0, clock=clock)
+    tracker.record([JAN_CODE])
+    clock.now += 5.0
+    tracker.record([OTHER_JAN_CODE])
+    assert tracker.stats()["tracked_keys"] == 1
+
+
+def test_overflowing_keys_route_every_read_to_the_writer(clock):
+    """上限を超えて追い出したキーの期限までは、記録していないキーもライターから読む"""
+    tracker = WriteTracker(window=5.0, max_keys=2, clock=clock)
+    tracker.record(["1"])
+    clock.now += 1.0
+    tracker.record(["2", "3"])
+
+    assert tracker.stats()["tracked_keys"] == 2
+    assert tracker.use_writer(["1"])
+    assert tracker.use_writer([OTHER_JAN_CODE])
+    # 追い出したキー（"1"）の期限を過ぎれば、記録しているキーだけがライターから読む
+    clock.now += 4.0
+    assert not tracker.use_writer([OTHER_JAN_CODE])
+    assert tracker.use_writer(["3"])
+
+
+class FakeSession:
+    def __init__(self, bind) -> None:
+        self.bind = bind
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FakeRawConnection:
+    def __init__(self) -> None:
+        self.events = []
+
+    def commit(self) -> None:
+        self.events.append("commit")
+
+    def rollback(self) -> None:
+        self.events.append("rollback")
+
+    def close(self) -> None:
+        self.events.append("close")
+
+
+@pytest.fixture
+def tracker(monkeypatch, clock):
+    tracker = WriteTracker(window=5.0, clock=clock)
+    raw_connection = FakeRawConnection()
+    monkeypatch.setattr(routing, "write_tracker", tracker)
+    monkeypatch.setattr(routing, "get_engine", lambda: SimpleNamespace(name=WRITER, raw_connection=lambda: raw_connection))
+    monkeypatch.setattr(routing, "get_reader_engine", lambda: SimpleNamespace(name=READER))
+    monkeypatch.setattr(routing, "SessionLocal", FakeSession)
+    tracker.raw_connection = raw_connection
+    return tracker
+
+
+def _read_engine(keys=None):
+    with routing.read_session_scope(keys) as db:
+        session = db
+    assert session.closed
+    return session.bind.name
+
+
+def test_read_session_scope_chooses_the_engine(tracker, clock):
+    assert _read_engine([JAN_CODE]) == READER
+
+    with routing.write_connection_scope([JAN_CODE]):
+        pass
+
+    assert _read_engine([JAN_CODE]) == WRITER
+    assert _read_engine([OTHER_JAN_CODE]) == READER
+    assert _read_engine() == WRITER
+    clock.now += 5.0
+    assert _read_engine([JAN_CODE]) == READER
+    assert tracker.raw_connection.events == ["commit", "close"]
+
+
+def test_failed_writes_are_not_recorded(tracker):
+    with pytest.raises(RuntimeError):
+        with routing.write_connection_scope([JAN_CODE]):
+            raise RuntimeError("write failed")
+
+    assert _read_engine([JAN_CODE]) == READER
+    assert tracker.raw_connection.events == ["rollback", "close"]
@@ -0,0 +1,96 @@
+"""
+検索（GET /api/search）のキーセット方式のページングのテスト
+
+pg_trgm を使わずに確かめるため、読み取りの接続は行ごとに決めたスコアを使い、
+SEARCH_STATEMENT / SEARCH_AFTER_STATEMENT と同じ条件・順序（スコアの降順、同点は gtin の昇順）で
+行を返す接続に差し替える。
+"""
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, search
+from app.search import decode_cursor, encode_cursor
+
+# (gtin, スコア)。0.5 の同点が5件ある（2進数で正確に表せるスコアにして REAL へのキャストの丸めを避ける）
+SCORES = [
+    (4900000000009, 0.75),
+    (4900000000047, 0.5),
+    (4900000000016, 0.5),
+    (4900000000085, 0.5),
+    (4900000000023, 0.5),
+    (4900000000030, 0.5),
+    (4900000000054, 0.25),
+]
+
+
+class FakeSearchConnection:
+    def __init__(self) -> None:
+        self.rows = [
+            SimpleNamespace(gtin=gtin, url=f"https://example.com/products/{gtin}", brand="Brand", product_name="緑茶", score=score)
+            for gtin, score in SCORES
+        ]
+        self.queries = []
+
+    def execute(self, statement, params):
+        self.queries.append(params)
+        rows = sorted(self.rows, key=lambda row: (-row.score, row.gtin))
+        if "after_score" in params:
+            after = (-params["after_score"], params["after_gtin"])
+            rows = [row for row in rows if (-row.score, row.gtin) > after]
+        return SimpleNamespace(all=lambda: rows[: params["limit"]])
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    fake = FakeSearchConnection()
+
+    @contextmanager
+    def scope(keys=None):
+        yield fake
+
+    monkeypatch.setattr(search, "read_connection_scope", scope)
+    return fake
+
+
+def test_pages_cover_tied_scores_without_gaps_or_duplicates(connection):
+    pages = []
+    after = None
+    with TestClient(main.app) as client:
+        while True:
+            params = {"q": "緑茶", "limit": 2}
+            if after:
+                params["after"] = after
+            body = client.get("/api/search", params=params).json()
+            pages.append([result["jan_code"] for result in body["results"]])
+            after = body["next_after"]
+            if after is None:
+                break
+
+    expected = [str(gtin) for gtin, _ in sorted(SCORES, key=lambda item: (-item[1], item[0]))]
+    assert [code for page in pages for code in page] == expected
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+    # 同点の途中で区切ったページの続きは、カーソルの gtin より後ろから始まる
+    assert connection.queries[1] == {"q": "緑茶", "limit": 3, "after_score": 0.5, "after_gtin": 4900000000016}
+
+
+def test_last_full_page_has_no_cursor(connection):
+    with TestClient(main.app) as client:
+        body = client.get("/api/search", params={"q": "緑茶", "limit": len(SCORES)}).json()
+    assert len(body["results"]) == len(SCORES)
+    assert body["next_after"] is None
+
+
+def test_cursor_round_trip():
+    for score in (0.5, 0.1, 0.30000001192092896, 1.0):
+        assert decode_cursor(encode_cursor(score, "0000049000009")) == (score, 49000009)
+
+
+@pytest.mark.parametrize("after", ["0.5", "0.5:", "0.5:49000000000x9", "0.5:12345678901234", "abc:4900000000009"])
+def test_invalid_cursor_is_rejected(connection, after):
+    with TestClient(main.app) as client:
+        response = client.get("/api/search", params={"q": "緑茶", "after": after})
+    assert response.status_code == 422
+    assert connection.queries == []
@@ -0,0 +1,172 @@
+"""
+プロセス間で共有するルックアップキャッシュ（L2）のテスト
+
+バックエンドは InMemoryBackend を使い、別のワーカーは空のプロセス内キャッシュで表す。
+"""
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app import lookup
+from app.cache import LookupCache, MISSING
+from app.circuit_breaker import CircuitBreaker
+from app.schemas import JanUrlMappingRecord
+from app.shared_cache import InMemoryBackend, SharedCache, SharedCacheBackend, decode_value, encode_value
+
+JAN_CODE = "4900000000009"
+MISSING_JAN_CODE = "4900000000993"
+
+
+def _record(jan_code: str, brand=None) -> JanUrlMappingRecord:
+    return JanUrlMappingRecord(
+        jan_code=jan_code, url=f"https://example.com/products/{jan_code}", brand=brand, product_name="商品",
+        updated_at=datetime(2024, 1, 2, 3, 4, 5, 678901),
+    )
+
+
+def test_values_round_trip_compactly():
+    record = _record(JAN_CODE, brand="Brand")
+    data = encode_value(record)
+    assert decode_value(JAN_CODE, data) == record
+    assert decode_value(JAN_CODE, encode_value(_record(JAN_CODE))).brand is None
+    assert decode_value(JAN_CODE, encode_value(None)) is None
+    # JSON（フィールド名つき）より小さい
+    assert len(data) < len(record.model_dump_json())
+
+
+def test_ttls_and_generation_flush(clock):
+    backend = InMemoryBackend(clock=clock)
+    cache = SharedCache(backend, ttl=60, negative_ttl=10, generation_refresh=5.0, clock=clock)
+    other = SharedCache(backend, ttl=60, negative_ttl=10, generation_refresh=5.0, clock=clock)
+
+    cache.set_many({JAN_CODE: _record(JAN_CODE), MISSING_JAN_CODE: None})
+    assert other.get_many([JAN_CODE, MISSING_JAN_CODE]) == {JAN_CODE: _record(JAN_CODE), MISSING_JAN_CODE: None}
+
+    clock.now += 20
+    assert other.get(JAN_CODE) == _record(JAN_CODE)
+    assert other.get(MISSING_JAN_CODE) is MISSING
+
+    # 世代を進めたプロセスはすぐに、他のプロセスは世代を読み直した後にエントリを使わなくなる
+    cache.flush()
+    assert cache.get(JAN_CODE) is MISSING
+    clock.now += 5
+    assert other.get(JAN_CODE) is MISSING
+    assert other.stats()["generation"] == 1
+
+
+def test_fills_do_not_overwrite_entries_or_tombstones(clock):
+    backend = InMemoryBackend(clock=clock)
+    cache = SharedCache(backend, ttl=60, negative_ttl=10, tombstone_ttl=30, clock=clock)
+    new = _record(JAN_CODE, brand="New")
+
+    cache.set_many({JAN_CODE: new})
+    cache.set_many({JAN_CODE: _record(JAN_CODE, brand="Old")})
+    assert cache.get(JAN_CODE) == new
+
+    # 変更の後は TOMBSTONE が失効するまで、DBから読んだ値（古いかもしれない）を書き込まない
+    cache.delete_many([JAN_CODE, MISSING_JAN_CODE])
+    cache.set_many({JAN_CODE: _record(JAN_CODE, brand="Old"), MISSING_JAN_CODE: None})
+    assert cache.get(JAN_CODE) is MISSING
+    assert cache.get(MISSING_JAN_CODE) is MISSING
+    clock.now += 30
+    cache.set_many({JAN_CODE: new})
+    assert cache.get(JAN_CODE) == new
+
+
+def test_backend_must_implement_every_operation():
+    class PartialBackend(SharedCacheBackend):
+        def get_many(self, keys):
+            return [None] * len(keys)
+
+    with pytest.raises(TypeError):
+        PartialBackend()
+
+
+def test_backend_failures_fall_back_to_miss():
+    class BrokenBackend(InMemoryBackend):
+        def get_many(self, keys):
+            raise ConnectionError("connection refused")
+
+    cache = SharedCache(BrokenBackend(), breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30.0))
+    for _ in range(3):
+        assert cache.get(JAN_CODE) is MISSING
+    stats = cache.stats()
+    assert stats["errors"] == 2
+    assert stats["skipped"] == 1
+    assert stats["breaker"] == "open"
+
+
+@pytest.fixture
+def workers(monkeypatch, fake_read_connection):
+    """L2を共有する2つのワーカー（プロセス内キャッシュを切り替える）と、問い合わせを数えるDB"""
+    backend = InMemoryBackend()
+    monkeypatch.setattr(lookup, "shared_cache", SharedCache(backend))
+    caches = [LookupCache(ttl=300.0), LookupCache(ttl=300.0)]
+    for code in (JAN_CODE, "4900000000016"):
+        fake_read_connection.add(code, brand=None, product_name="商品")
+
+    def use(index):
+        monkeypatch.setattr(lookup, "lookup_cache", caches[index])
+
+    return SimpleNamespace(backend=backend, database=fake_read_connection, queries=fake_read_connection.queries, use=use)
+
+
+def test_second_worker_reads_from_shared_cache(workers):
+    workers.use(0)
+    assert lookup.fetch_mapping(JAN_CODE).jan_code == JAN_CODE
+    assert lookup.fetch_mapping(MISSING_JAN_CODE) is None
+    assert len(workers.queries) == 2
+
+    workers.use(1)
+    assert lookup.fetch_mapping(JAN_CODE).jan_code == JAN_CODE
+    assert lookup.fetch_mapping(MISSING_JAN_CODE) is None
+    assert len(workers.queries) == 2
+    assert lookup.shared_cache.stats()["hits"] == 2
+
+
+def test_batch_lookup_uses_one_round_trip(workers):
+    codes = [JAN_CODE, "4900000000016", MISSING_JAN_CODE]
+    workers.use(0)
+    lookup.fetch_mappings(codes)
+    assert len(workers.queries) == 1
+
+    workers.use(1)
+    round_trips = workers.backend.round_trips
+    found = lookup.fetch_mappings(codes)
+    assert set(found) == {JAN_CODE, "4900000000016"}
+    assert workers.backend.round_trips - round_trips == 1
+    assert len(workers.queries) == 1
+
+
+def test_writes_delete_shared_entries(workers):
+    workers.use(0)
+    lookup.fetch_mapping(JAN_CODE)
+    lookup.invalidate_mappings([JAN_CODE])
+
+    workers.use(1)
+    lookup.fetch_mapping(JAN_CODE)
+    assert len(workers.queries) == 2
+
+
+def test_stale_read_racing_a_write_is_not_written_back(workers, monkeypatch):
+    """
+    別のコンテナ（プロセス内キャッシュとLISTENを共有しない）での書き込みの前に古い行を読んだ場合、
+    書き込み側の削除の後でその古い値をL2へ書き戻さない
+    """
+    shared = lookup.shared_cache
+    fill = shared.set
+
+    def write_in_another_container_then_fill(jan_code, value):
+        workers.database.add(JAN_CODE, url="https://example.com/new")
+        shared.delete_many([JAN_CODE])
+        fill(jan_code, value)
+
+    # 古い行を読んだ後、L2へ書き込む前に別のコンテナで書き込みと削除が行われる
+    workers.use(1)
+    monkeypatch.setattr(shared, "set", write_in_another_container_then_fill)
+    assert lookup.fetch_mapping(JAN_CODE).url == f"https://example.com/products/{JAN_CODE}"
+
+    workers.use(0)
+    assert lookup.fetch_mapping(JAN_CODE).url == "https://example.com/new"
+    assert len(workers.queries) == 2
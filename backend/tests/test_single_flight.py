@@ -0,0 +1,175 @@
+"""
+single-flight（同じJANコードの同時のキャッシュミスを1回のDB問い合わせにまとめる）のテスト
+
+DBへの接続は問い合わせ回数を数える接続（conftest.py の fake_read_connection）に差し替え、
+残りのリクエストがすべて実行中の問い合わせに合流するまで結果を返さないようにする。
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import lookup
+from app.single_flight import AsyncSingleFlight, SingleFlight
+from app.main import app
+
+N = 20
+JAN_CODE = "4900000000009"
+MISSING_JAN_CODE = "4900000000993"
+
+
+def _wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def connection(monkeypatch, fake_read_connection):
+    """問い合わせは残りのリクエストがすべて実行中の問い合わせに合流するまで結果を返さない"""
+    monkeypatch.setattr(lookup, "LOOKUP_SINGLE_FLIGHT_ENABLED", True)
+    fake_read_connection.add(JAN_CODE)
+    sync_before = lookup.lookup_flight.coalesced
+    async_before = lookup.async_lookup_flight.coalesced
+
+    def wait():
+        _wait_for(lambda: lookup.lookup_flight.coalesced - sync_before >= N - 1)
+
+    async def wait_async():
+        deadline = time.monotonic() + 5.0
+        while lookup.async_lookup_flight.coalesced - async_before < N - 1 and time.monotonic() < deadline:
+            await asyncio.sleep(0.005)
+
+    fake_read_connection.wait = wait
+    fake_read_connection.wait_async = wait_async
+    return fake_read_connection
+
+
+@pytest.mark.parametrize("jan_code, status", [(JAN_CODE, 200), (MISSING_JAN_CODE, 404)])
+def test_concurrent_requests_share_one_query(connection, jan_code, status):
+    """同じJANコードへのN件の同時リクエスト（スレッドプールで処理される同期ハンドラ）でDBへの問い合わせは1回"""
+    leaders_before = lookup.lookup_flight.leaders
+    coalesced_before = lookup.lookup_flight.coalesced
+
+    with TestClient(app) as client:
+        with ThreadPoolExecutor(max_workers=N) as executor:
+            responses = list(executor.map(lambda _: client.get("/api/convert", params={"jan": jan_code}), range(N)))
+
+    assert len(connection.queries) == 1
+    assert [response.status_code for response in responses] == [status] * N
+    assert len({response.content for response in responses}) == 1
+    assert lookup.lookup_flight.leaders - leaders_before == 1
+    assert lookup.lookup_flight.coalesced - coalesced_before == N - 1
+    assert lookup.lookup_flight.stats()["in_flight"] == 0
+
+
+def test_concurrent_async_lookups_share_one_query(connection):
+    """同じJANコードへのN件の同時ルックアップ（非同期版）でDBへの問い合わせは1回"""
+    coalesced_before = lookup.async_lookup_flight.coalesced
+
+    async def run():
+        return await asyncio.gather(*(lookup.fetch_mapping_async(JAN_CODE) for _ in range(N)))
+
+    results = asyncio.run(run())
+
+    assert len(connection.queries) == 1
+    assert all(result is results[0] for result in results)
+    assert results[0].jan_code == JAN_CODE
+    assert lookup.async_lookup_flight.coalesced - coalesced_before == N - 1
+    assert lookup.async_lookup_flight.stats()["in_flight"] == 0
+
+
+def test_metrics_report_coalesced_requests(connection):
+    """/metrics に single-flight の集約件数が含まれる"""
+    with TestClient(app) as client:
+        single_flight = client.get("/metrics").json()["single_flight"]
+
+    assert single_flight["enabled"] is True
+    assert set(single_flight["sync"]) == {"leaders", "coalesced", "in_flight"}
+    assert set(single_flight["async"]) == {"leaders", "coalesced", "in_flight"}
+
+
+def test_leader_error_is_raised_to_waiting_callers():
+    """leader の問い合わせが失敗した場合、合流した呼び出しにも同じ例外が送出され、次の呼び出しは新たに実行される"""
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("connection lost")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, "key", failing)
+        started.wait(5)
+        follower = executor.submit(flight.do, "key", lambda: "unused")
+        _wait_for(lambda: flight.coalesced == 1)
+        release.set()
+        with pytest.raises(RuntimeError):
+            leader.result(5)
+        with pytest.raises(RuntimeError):
+            follower.result(5)
+
+    assert flight.do("key", lambda: "retried") == "retried"
+    assert flight.stats() == {"leaders": 2, "coalesced": 1, "in_flight": 0}
+
+
+def test_async_forget_from_another_thread():
+    """変更の通知を受けるスレッドから forget しても、イベントループ側の登録・削除と競合しない"""
+    flight = AsyncSingleFlight()
+    stop = threading.Event()
+    errors = []
+
+    def forget_repeatedly():
+        while not stop.is_set():
+            try:
+                for key in range(50):
+                    flight.forget(key)
+            except Exception as e:  # pragma: no cover
+                errors.append(e)
+                return
+
+    async def lookup_once(key):
+        await asyncio.sleep(0)
+        return key
+
+    async def run():
+        for _ in range(50):
+            await asyncio.gather(*(flight.do(key, lambda key=key: lookup_once(key)) for key in range(50)))
+
+    thread = threading.Thread(target=forget_repeatedly)
+    thread.start()
+    try:
+        asyncio.run(run())
+    finally:
+        stop.set()
+        thread.join(5)
+
+    assert errors == []
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_async_forget_starts_a_new_call():
+    """forget した後の呼び出しは実行中のタスクに合流せず、新たに実行する"""
+    flight = AsyncSingleFlight()
+
+    async def run():
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "old"
+
+        first = asyncio.ensure_future(flight.do("key", slow))
+        await asyncio.sleep(0)
+        await asyncio.to_thread(flight.forget, "key")
+        second = await flight.do("key", lambda: asyncio.sleep(0, result="new"))
+        release.set()
+        return await first, second
+
+    assert asyncio.run(run()) == ("old", "new")
+    assert flight.stats() == {"leaders": 2, "coalesced": 0, "in_flight": 0}
@@ -0,0 +1,125 @@
+"""
+スナップショットインデックス（app/snapshot.py）のファイル形式のテスト
+
+build_snapshot で一時ディレクトリに作成したファイルを SnapshotIndex で開く。
+"""
+from datetime import datetime, timezone
+import struct
+
+import pytest
+
+from app.snapshot import (
+    FORMAT_VERSION,
+    HEADER,
+    HEADER_SIZE,
+    MAGIC,
+    SnapshotIndex,
+    build_snapshot,
+    decode_key,
+    encode_key,
+)
+
+UPDATED_AT = datetime(2024, 1, 2, 3, 4, 5, 678901)
+
+ROWS = [
+    # 桁数の少ないキーが先（上位8bitが桁数）
+    ("49000009", "https://example.com/ean8", "EAN-8", "8桁", UPDATED_AT),
+    ("049000000009", "https://example.com/upca", "", "", UPDATED_AT),
+    ("0000049000009", "https://example.com/jan8", None, None, None),
+    ("4900000000009", "https://example.com/jan", "ブランド", "緑茶 500ml", UPDATED_AT),
+    ("04900000000009", "https://example.com/gtin14", "GTIN-14", None, UPDATED_AT),
+]
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    path = str(tmp_path / "jan_url_mapping.snap")
+    result = build_snapshot(ROWS + [("abc", "https://example.com/invalid", None, None, None)], path)
+    assert (result["rows"], result["skipped"]) == (len(ROWS), 1)
+    index = SnapshotIndex(path)
+    yield index
+    index.close()
+
+
+def test_build_and_open_round_trip(snapshot):
+    assert len(snapshot) == len(ROWS)
+    assert snapshot.format_version == FORMAT_VERSION
+    for jan_code, url, brand, product_name, updated_at in ROWS:
+        record = snapshot.get(jan_code)
+        assert (record.jan_code, record.url, record.brand, record.product_name, record.updated_at) == (
+            jan_code, url, brand, product_name, updated_at,
+        )
+    assert snapshot.stats()["hits"] == len(ROWS)
+
+
+def test_null_and_empty_strings_are_distinct(snapshot):
+    empty = snapshot.get("049000000009")
+    null = snapshot.get("0000049000009")
+    assert (empty.brand, empty.product_name) == ("", "")
+    assert (null.brand, null.product_name, null.updated_at) == (None, None, None)
+
+
+def test_keys_keep_the_digit_count():
+    """先頭0の有無だけが異なる EAN-8 / UPC-A / JAN / GTIN-14 は別のキーになり、キーからコードに戻せる"""
+    codes = ["49000009", "049000009", "0049000009", "0000049000009", "00000049000009"]
+    keys = [encode_key(code) for code in codes]
+    assert len(set(keys)) == len(codes)
+    assert keys == sorted(keys)
+    assert [decode_key(key) for key in keys] == codes
+    assert encode_key("") is None
+    assert encode_key("4" * 16) is None
+    assert encode_key("４９") is None
+
+
+def test_lookup_misses(snapshot):
+    assert snapshot.get("4900000000016") is None
+    assert snapshot.get("0") is None
+    assert snapshot.get("99999999999999") is None
+    assert snapshot.get("not a code") is None
+    assert "4900000000016" not in snapshot
+    assert "4900000000009" in snapshot
+    assert snapshot.stats()["misses"] == 4
+
+
+def test_rows_must_be_sorted(tmp_path):
+    with pytest.raises(ValueError):
+        build_snapshot(list(reversed(ROWS)), str(tmp_path / "unsorted.snap"))
+
+
+def test_timezone_aware_updated_at_is_stored_as_local_time(tmp_path):
+    path = str(tmp_path / "aware.snap")
+    aware = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    build_snapshot([("4900000000009", "https://example.com", None, None, aware)], path)
+    index = SnapshotIndex(path)
+    try:
+        assert index.get("4900000000009").updated_at == aware.astimezone().replace(tzinfo=None)
+    finally:
+        index.close()
+
+
+def _write_header(path, magic=MAGIC, version=FORMAT_VERSION, count=0, blob_size=0):
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(magic, version, 0, count, 0, blob_size).ljust(HEADER_SIZE, b"\x00"))
+        f.write(struct.pack("<Q", 0))
+
+
+@pytest.mark.parametrize("header, message", [
+    ({"magic": b"NOTSNAP\x00"}, "Not a snapshot file"),
+    ({"version": FORMAT_VERSION + 1}, "Unsupported snapshot format version"),
+    ({"count": 1}, "Truncated snapshot file"),
+])
+def test_corrupt_headers_are_rejected(tmp_path, header, message):
+    path = str(tmp_path / "corrupt.snap")
+    _write_header(path, **header)
+    with pytest.raises(ValueError, match=message):
+        SnapshotIndex(path)
+
+
+def test_truncated_files_are_rejected(tmp_path, snapshot):
+    with open(snapshot.path, "rb") as f:
+        data = f.read()
+    for size in (0, 10, HEADER_SIZE, len(data) - 1):
+        path = tmp_path / f"truncated-{size}.snap"
+        path.write_bytes(data[:size])
+        with pytest.raises(ValueError):
+            SnapshotIndex(str(path))
@@ -0,0 +1,124 @@
+"""
+段階別レイテンシの計測（app/timing.py）のテスト
+
+conftest.py で TIMING_ENABLED=false にしているため、テストでは有効にした上で
+main.app を TimingMiddleware で包み、EMFの出力先を差し替えた TimingRecorder に記録する。
+"""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, timing
+from app.timing import Histogram, TimingMiddleware, TimingRecorder
+
+JAN_CODE = "4900000000009"
+MISSING_JAN_CODE = "4900000000023"
+
+
+@pytest.fixture
+def recorder(monkeypatch, clock):
+    lines = []
+    recorder = TimingRecorder(flush_seconds=60.0, namespace="BronzedrawTest", write=lines.append, clock=clock)
+    recorder.lines = lines
+    monkeypatch.setattr(timing, "TIMING_ENABLED", True)
+    monkeypatch.setattr(timing, "recorder", recorder)
+    return recorder
+
+
+@pytest.fixture
+def client(recorder, fake_read_connection):
+    with TestClient(TimingMiddleware(main.app)) as client:
+        yield client
+
+
+def _server_timing(response):
+    timings = {}
+    for entry in response.headers["server-timing"].split(", "):
+        name, duration = entry.split(";dur=")
+        timings[name] = float(duration)
+    return timings
+
+
+def test_server_timing_has_each_stage_of_a_lookup(client, fake_read_connection):
+    fake_read_connection.add(JAN_CODE)
+
+    miss = _server_timing(client.get("/api/convert", params={"jan": JAN_CODE}))
+    hit = _server_timing(client.get("/api/convert", params={"jan": JAN_CODE}))
+
+    assert list(miss) == ["normalize", "cache", "bloom", "snapshot", "query", "hydrate", "serialize", "app"]
+    # 2回目はプロセス内キャッシュから返すためDBの段階はない
+    assert list(hit) == ["normalize", "cache", "serialize", "app"]
+    for timings in (miss, hit):
+        assert all(ms >= 0 for ms in timings.values())
+        assert sum(ms for name, ms in timings.items() if name != "app") <= timings["app"]
+
+
+def test_error_responses_have_server_timing(client):
+    response = client.get("/api/convert", params={"jan": MISSING_JAN_CODE})
+    assert response.status_code == 404
+    assert "app" in _server_timing(response)
+
+
+def test_stages_are_recorded_per_route(client, recorder, fake_read_connection):
+    fake_read_connection.add(JAN_CODE)
+    for _ in range(3):
+        client.get("/api/convert", params={"jan": JAN_CODE})
+    client.get("/not-found")
+
+    routes = recorder.stats()["routes"]
+    assert routes["/api/convert"]["app"]["count"] == 3
+    assert routes["/api/convert"]["query"]["count"] == 1
+    assert routes["unmatched"]["app"]["count"] == 1
+    assert (recorder.requests, recorder.sampled) == (4, 4)
+
+
+def test_emf_is_written_per_route_and_stage(client, recorder, clock, fake_read_connection):
+    fake_read_connection.add(JAN_CODE)
+    client.get("/api/convert", params={"jan": JAN_CODE})
+    assert recorder.lines == []
+
+    # flush_seconds が経過した後のリクエストの終わりに書き出す
+    clock.now += 60.0
+    client.get("/api/convert", params={"jan": JAN_CODE})
+
+    documents = [json.loads(line) for line in recorder.lines]
+    stages = {document["Stage"]: document for document in documents}
+    assert set(stages) == {"normalize", "cache", "bloom", "snapshot", "query", "hydrate", "serialize", "app"}
+    app_stage = stages["app"]
+    assert app_stage["_aws"]["CloudWatchMetrics"] == [{
+        "Namespace": "BronzedrawTest",
+        "Dimensions": [["Route", "Stage"]],
+        "Metrics": [{"Name": "StageLatency", "Unit": "Milliseconds"}],
+    }]
+    assert isinstance(app_stage["_aws"]["Timestamp"], int)
+    assert (app_stage["Route"], app_stage["SampleRate"]) == ("/api/convert", 1.0)
+    assert sum(app_stage["StageLatency"]["Counts"]) == 2
+    assert len(app_stage["StageLatency"]["Values"]) == len(app_stage["StageLatency"]["Counts"]) <= 100
+    assert sum(stages["query"]["StageLatency"]["Counts"]) == 1
+
+    # 書き出した分は次の出力に含めない
+    recorder.flush()
+    assert len(recorder.lines) == len(documents)
+
+
+def test_timed_handler_records_time_outside_the_app(recorder, fake_read_connection):
+    fake_read_connection.add(JAN_CODE)
+    client = TestClient(TimingMiddleware(main.app))
+
+    def handler(event, context):
+        return client.get("/api/convert", params={"jan": JAN_CODE}).status_code
+
+    assert timing.timed_handler(handler)({}, None) == 200
+    stages = recorder.stats()["routes"]["/api/convert"]
+    assert stages["mangum"]["count"] == stages["lambda"]["count"] == 1
+    assert stages["lambda"]["max_ms"] >= stages["app"]["max_ms"]
+
+
+def test_histogram_percentiles_use_bucket_upper_bounds():
+    histogram = Histogram()
+    for ms in (1.0, 1.0, 1.0, 100.0):
+        histogram.add(ms)
+    assert histogram.percentile(50) == pytest.approx(Histogram.bucket_value(Histogram.bucket_index(1.0)))
+    assert histogram.percentile(99) == 100.0
+    assert histogram.summary()["count"] == 4
@@ -0,0 +1,153 @@
+"""
+書き込みAPI（PUT /api/mappings/{jan}、POST /api/mappings:bulkUpsert）のテスト
+
+書き込みの接続は、execute_values を ON CONFLICT ... DO UPDATE ... WHERE と同じ規則（値が変化した行だけ更新）で
+メモリ上のテーブルに適用する FakeTable に差し替える。
+"""
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import auth, main, upsert
+
+API_KEY = "test-write-key"
+JAN_CODE = "4900000000009"
+OTHER_JAN_CODE = "4900000000016"
+
+
+class FakeTable:
+    """jan_url_mapping（gtin -> (url, brand, product_name)）と実行した文の数"""
+
+    def __init__(self) -> None:
+        self.rows = {}
+        self.statements = 0
+        self.commits = 0
+
+    def execute_values(self, cursor, sql, values, page_size, fetch):
+        returned = []
+        for start in range(0, len(values), page_size):
+            self.statements += 1
+            for gtin, *fields in values[start:start + page_size]:
+                if gtin not in self.rows:
+                    returned.append((gtin, True))
+                elif self.rows[gtin] != tuple(fields):
+                    returned.append((gtin, False))
+                else:
+                    continue
+                self.rows[gtin] = tuple(fields)
+        return returned
+
+    @contextmanager
+    def scope(self, keys=None):
+        yield self
+        self.commits += 1
+
+    def cursor(self):
+        return None
+
+
+@pytest.fixture
+def table(monkeypatch, fake_read_connection):
+    fake = FakeTable()
+    monkeypatch.setattr(auth, "WRITE_API_KEY", API_KEY)
+    monkeypatch.setattr(upsert, "execute_values", fake.execute_values)
+    monkeypatch.setattr(upsert, "write_connection_scope", fake.scope)
+    return fake
+
+
+@pytest.fixture
+def client(table):
+    with TestClient(main.app, headers={"X-API-Key": API_KEY}) as client:
+        yield client
+
+
+def test_put_creates_updates_and_leaves_unchanged(client, table):
+    mapping = {"url": "https://example.com/p/1", "brand": "Brand", "product_name": "Product"}
+
+    created = client.put(f"/api/mappings/{JAN_CODE}", json=mapping)
+    unchanged = client.put(f"/api/mappings/{JAN_CODE}", json=mapping)
+    updated = client.put(f"/api/mappings/{JAN_CODE}", json={**mapping, "url": "https://example.com/p/2"})
+
+    assert (created.status_code, created.json()["status"]) == (201, "created")
+    assert (unchanged.status_code, unchanged.json()["status"]) == (200, "unchanged")
+    assert (updated.status_code, updated.json()["status"]) == (200, "updated")
+    assert table.rows == {int(JAN_CODE): ("https://example.com/p/2", "Brand", "Product")}
+
+
+def test_put_normalizes_the_jan_code(client, table):
+    response = client.put("/api/mappings/49000009", json={"url": "https://example.com/ean8"})
+
+    assert response.json() == {"jan_code": "49000009", "status": "created", "normalized_jan_code": "0000049000009", "error": None}
+    assert 49000009 in table.rows
+
+
+def test_put_rejects_invalid_input(client, table):
+    assert client.put("/api/mappings/4900000000001", json={"url": "https://example.com"}).status_code == 422
+    assert client.put(f"/api/mappings/{JAN_CODE}", json={"url": " "}).status_code == 422
+    assert table.statements == 0
+
+
+def test_bulk_upsert_reports_each_item_in_input_order(client, table, monkeypatch):
+    monkeypatch.setattr(upsert, "UPSERT_PAGE_SIZE", 2)
+    table.rows[int(JAN_CODE)] = ("https://example.com/p/1", None, None)
+    table.rows[int(OTHER_JAN_CODE)] = ("https://example.com/p/2", None, None)
+
+    response = client.post("/api/mappings:bulkUpsert", json={"items": [
+        {"jan_code": JAN_CODE, "url": "https://example.com/p/1"},
+        {"jan_code": OTHER_JAN_CODE, "url": "https://example.com/old"},
+        {"jan_code": "4900000000023", "url": "https://example.com/p/3"},
+        {"jan_code": "4900000000001", "url": "https://example.com/p/4"},
+        {"jan_code": "04900000000016", "url": "https://example.com/p/2-new"},
+        {"jan_code": "4900000000030", "url": ""},
+    ]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [result["status"] for result in body["results"]] == [
+        "unchanged", "superseded", "created", "invalid", "updated", "invalid",
+    ]
+    assert (body["created"], body["updated"], body["unchanged"], body["invalid"]) == (1, 1, 1, 2)
+    # 同じJANコード（正規化後）は最後のものを書き込む
+    assert table.rows[int(OTHER_JAN_CODE)] == ("https://example.com/p/2-new", None, None)
+    # 有効な3行を UPSERT_PAGE_SIZE 行ごとの文で1回のコミットにまとめる
+    assert (table.statements, table.commits) == (2, 1)
+
+
+def test_bulk_upsert_invalidates_cached_lookups(client, table, fake_read_connection):
+    fake_read_connection.add(JAN_CODE, url="https://example.com/old")
+    assert client.get("/api/convert", params={"jan": JAN_CODE}).json()["url"] == "https://example.com/old"
+
+    client.post("/api/mappings:bulkUpsert", json={"items": [{"jan_code": JAN_CODE, "url": "https://example.com/new"}]})
+    fake_read_connection.add(JAN_CODE, url="https://example.com/new")
+
+    assert client.get("/api/convert", params={"jan": JAN_CODE}).json()["url"] == "https://example.com/new"
+    assert len(fake_read_connection.queries) == 2
+
+
+def test_bulk_upsert_rejects_too_many_items(client, table, monkeypatch):
+    monkeypatch.setattr(main, "MAX_UPSERT_ITEMS", 1)
+    items = [{"jan_code": JAN_CODE, "url": "https://example.com"}] * 2
+    assert client.post("/api/mappings:bulkUpsert", json={"items": items}).status_code == 413
+    assert table.statements == 0
+
+
+@pytest.mark.parametrize("headers", [{}, {"X-API-Key": "wrong"}])
+def test_missing_or_wrong_api_key_is_rejected(table, headers):
+    with TestClient(main.app) as client:
+        response = client.put(f"/api/mappings/{JAN_CODE}", json={"url": "https://example.com"}, headers=headers)
+    assert response.status_code == 401
+    assert table.statements == 0
+
+
+def test_write_api_is_unavailable_without_a_key(table, monkeypatch):
+    monkeypatch.setattr(auth, "WRITE_API_KEY", None)
+    monkeypatch.setattr(auth, "_secret_provider", None)
+    with TestClient(main.app) as client:
+        response = client.post(
+            "/api/mappings:bulkUpsert",
+            json={"items": [{"jan_code": JAN_CODE, "url": "https://example.com"}]},
+            headers={"X-API-Key": API_KEY},
+        )
+    assert response.status_code == 503
+    assert table.statements == 0
@@ -10,6 +10,18 @@ from stacks.frontend_stack import FrontendStack
 # 環境設定
 ENV_NAME = os.getenv("ENV_NAME", "dev")  # dev, stg, prod
 AWS_REGION = "ap-northeast-1"  # 東京リージョン
+ENABLE_RDS_PROXY = os.getenv("ENABLE_RDS_PROXY", "false").lower() == "true"  # RDS Proxy経由で接続
+ENABLE_SHARED_CACHE = os.getenv("ENABLE_SHARED_CACHE", "false").lower() == "true"  # 共有ルックアップキャッシュ（ElastiCache Serverless）
+AURORA_READER_COUNT = int(os.getenv("AURORA_READER_COUNT", "0"))  # Auroraのリーダーインスタンス数
+SNAPSHOT_LAYER_DIR = os.getenv("SNAPSHOT_LAYER_DIR")  # snapshot/jan_url_mapping.snap を含むディレクトリ
+# フロントエンドのドメイン（独自ドメイン、または初回デプロイ後の FrontendStack の出力 CloudFrontUrl のドメイン）
+FRONTEND_DOMAIN = os.getenv("FRONTEND_DOMAIN")
+# /r/{jan} の未登録・不正時のリダイレクト先（{jan} はスキャンしたコード）。API Gatewayを直接呼んだ場合も
+# フロントエンドへ戻れるよう絶対URLにする（FRONTEND_DOMAIN も無ければ未設定で、404/422を返す）。
+# FrontendStack は ApiStack に依存するため、CloudFrontのドメインをここから参照することはできない
+REDIRECT_FALLBACK_URL = os.getenv("REDIRECT_FALLBACK_URL") or (
+    f"https://{FRONTEND_DOMAIN}/?jan={{jan}}" if FRONTEND_DOMAIN else None
+)
 
 app = cdk.App()
 
@@ -35,6 +47,8 @@ database_stack = DatabaseStack(
     env_name=ENV_NAME,
     vpc=network_stack.vpc,
     aurora_sg=network_stack.aurora_sg,
+    enable_proxy=ENABLE_RDS_PROXY,
+    reader_count=AURORA_READER_COUNT,
     env=env,
     description=f"Bronzedraw Database Stack for {ENV_NAME} environment",
 )
@@ -49,6 +63,11 @@ api_stack = ApiStack(
     lambda_sg=network_stack.lambda_sg,
     db_cluster=database_stack.db_cluster,
     db_secret=database_stack.db_secret,
+    db_proxy=database_stack.db_proxy,
+    db_reader_endpoint=database_stack.db_reader_endpoint,
+    snapshot_layer_dir=SNAPSHOT_LAYER_DIR,
+    redirect_fallback_url=REDIRECT_FALLBACK_URL,
+    enable_shared_cache=ENABLE_SHARED_CACHE,
     env=env,
     description=f"Bronzedraw API Stack for {ENV_NAME} environment",
 )
@@ -61,6 +80,7 @@ frontend_stack = FrontendStack(
     f"BronzedrawFrontendStack-{ENV_NAME}",
     env_name=ENV_NAME,
     api_url=api_stack.api.url,
+    api=api_stack.api,  # /api/* をCloudFront経由で配信
     env=env,
     description=f"Bronzedraw Frontend Stack for {ENV_NAME} environment",
 )
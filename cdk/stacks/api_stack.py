@@ -14,6 +14,8 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+from stacks.shared_cache import SharedCache
+
 
 class ApiStack(Stack):
     """
@@ -29,10 +31,21 @@ class ApiStack(Stack):
         lambda_sg: ec2.SecurityGroup = None,
         db_cluster: rds.DatabaseCluster = None,
         db_secret: secretsmanager.Secret = None,
+        use_secrets_extension: bool = True,
+        db_proxy: rds.CfnDBProxy = None,
+        db_reader_endpoint: str = None,
+        db_pool_strategy: str = "single",
+        snapshot_layer_dir: str = None,
+        redirect_fallback_url: str = None,
+        enable_shared_cache: bool = False,
         **kwargs,
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        # 相対URLはリダイレクトを受けたホスト（API Gatewayを直接呼んだ場合はAPI Gateway）で解決されてしまう
+        if redirect_fallback_url and not redirect_fallback_url.startswith(("https://", "http://")):
+            raise ValueError(f"redirect_fallback_url must be an absolute URL: {redirect_fallback_url!r}")
+
         self.env_name = env_name
 
         # API Gateway CloudWatch Logs用のロール
@@ -73,9 +86,57 @@ class ApiStack(Stack):
         if db_secret:
             db_secret.grant_read(lambda_role)
 
+        # 書き込みAPI（PUT /api/mappings/{jan} など）のAPIキー（X-API-Key ヘッダで送る）
+        self.write_api_key_secret = secretsmanager.Secret(
+            self,
+            f"WriteApiKeySecret-{env_name}",
+            secret_name=f"bronzedraw-write-api-key-{env_name}",
+            description=f"API key for the JAN-URL write API ({env_name})",
+            generate_secret_string=secretsmanager.SecretStringGenerator(
+                secret_string_template="{}",
+                generate_string_key="api_key",
+                exclude_punctuation=True,
+                password_length=40,
+            ),
+        )
+        self.write_api_key_secret.grant_read(lambda_role)
+
         # Lambda関数（FastAPI + Mangum）
         from aws_cdk import BundlingOptions
 
+        # Parameters and Secrets Lambda Extension（シークレットをローカルHTTPエンドポイント経由でキャッシュ取得）
+        params_and_secrets = None
+        if use_secrets_extension and db_secret:
+            params_and_secrets = _lambda.ParamsAndSecretsLayerVersion.from_version(
+                _lambda.ParamsAndSecretsVersions.V1_0_103,
+                cache_size=10,
+                secrets_manager_ttl=Duration.minutes(5),
+            )
+
+        # スナップショットインデックス（snapshot/jan_url_mapping.snap・snapshot/jan_codes.bloom を含むディレクトリをレイヤー化し /opt に展開）
+        layers = None
+        if snapshot_layer_dir:
+            self.snapshot_layer = _lambda.LayerVersion(
+                self,
+                f"SnapshotLayer-{env_name}",
+                layer_version_name=f"bronzedraw-jan-snapshot-{env_name}",
+                code=_lambda.Code.from_asset(snapshot_layer_dir),
+                compatible_runtimes=[_lambda.Runtime.PYTHON_3_12],
+                description="JAN-URL mapping snapshot index (mmap)",
+            )
+            layers = [self.snapshot_layer]
+
+        # 共有ルックアップキャッシュ（任意）: コンテナごとのプロセス内キャッシュのミスをDBの前で受ける
+        self.shared_cache = None
+        if enable_shared_cache:
+            self.shared_cache = SharedCache(
+                self,
+                f"SharedCache-{env_name}",
+                env_name=env_name,
+                vpc=vpc,
+                lambda_sg=lambda_sg,
+            )
+
         self.jan_api_lambda = _lambda.Function(
             self,
             f"JanApiLambda-{env_name}",
@@ -99,9 +160,60 @@ class ApiStack(Stack):
             environment={
                 "ENV": env_name,
                 "DB_SECRET_ARN": db_secret.secret_arn if db_secret else "",
-                "DB_CLUSTER_ENDPOINT": db_cluster.cluster_endpoint.hostname if db_cluster else "",
+                # RDS Proxy がある場合はProxy経由で接続する
+                "DB_CLUSTER_ENDPOINT": db_proxy.attr_endpoint if db_proxy else (db_cluster.cluster_endpoint.hostname if db_cluster else ""),
+                # 読み取り（ルックアップ・エクスポート）はリーダーへ振り分ける（未設定ならライターのみ）
+                "DB_READER_ENDPOINT": db_reader_endpoint or "",
+                "DB_READ_YOUR_WRITES_SECONDS": "5",
                 "DB_NAME": "bronzedraw",
+                # シークレットは初回接続時に遅延取得（Extension有効時はローカルエンドポイント経由）
+                "SECRETS_EXTENSION_ENDPOINT": "http://localhost:2773" if params_and_secrets else "",
+                "DB_SECRET_TTL_SECONDS": "300",
+                # コネクション管理（Lambdaは1コンテナ1リクエストのため、pre-pingなしの1接続を保持）
+                "DB_POOL_STRATEGY": db_pool_strategy,
+                # スケーリング・フェイルオーバー中に接続・クエリを待ち続けない（statement_timeout は接続時の options で
+                # 設定するため、接続を多重化する RDS Proxy 経由の場合は0（無制限）にする）
+                "DB_CONNECT_TIMEOUT_SECONDS": "3",
+                "DB_STATEMENT_TIMEOUT_MS": "0" if db_proxy else "5000",
+                # 連続5回DBに接続できなければ10秒間は接続せずに失敗させる（キャッシュにあれば古い値を返す）
+                "DB_CIRCUIT_BREAKER_ENABLED": "true",
+                "DB_CIRCUIT_BREAKER_FAILURE_THRESHOLD": "5",
+                "DB_CIRCUIT_BREAKER_RESET_SECONDS": "10",
+                # /r/{jan} で未登録・不正なJANコードのリダイレクト先（未設定なら404/422を返す）
+                "REDIRECT_FALLBACK_URL": redirect_fallback_url or "",
+                # 書き込みAPIのキー（初回の書き込み時に遅延取得）
+                "WRITE_API_KEY_SECRET_ARN": self.write_api_key_secret.secret_arn,
+                # プロセス内ルックアップキャッシュ（LRU + TTL、404はネガティブキャッシュ）
+                "LOOKUP_CACHE_ENABLED": "true",
+                "LOOKUP_CACHE_MAX_ENTRIES": "10000",
+                "LOOKUP_CACHE_TTL_SECONDS": "300",
+                "LOOKUP_CACHE_NEGATIVE_TTL_SECONDS": "30",
+                # 失効後1時間は古い値を返してバックグラウンドで再取得する（DBに接続できない間も古い値を返す）
+                "LOOKUP_CACHE_STALE_TTL_SECONDS": "3600",
+                # ヒット件数を集計して60秒ごとにまとめて書き込み、コールドスタート時に上位2000件をキャッシュに読み込む
+                "LOOKUP_STATS_ENABLED": "true",
+                "LOOKUP_STATS_FLUSH_SECONDS": "60",
+                "LOOKUP_WARMUP_ENTRIES": "2000",
+                # 共有キャッシュ（L2、enable_shared_cache の場合のみ）。L2が遅い・落ちている場合は待たずにDBから読む
+                # TTLは、書き込み側の削除をすり抜けた古い値が残りうる上限にもなるため短くする。
+                # 書き込み後30秒（DB_READ_YOUR_WRITES_SECONDS とリーダーの遅延より長く）はDBから読んだ値を書き込ませない
+                "L2_CACHE_URL": self.shared_cache.url if self.shared_cache else "",
+                "L2_CACHE_TTL_SECONDS": "300",
+                "L2_CACHE_NEGATIVE_TTL_SECONDS": "60",
+                "L2_CACHE_TOMBSTONE_SECONDS": "30",
+                "L2_CACHE_TIMEOUT_MS": "50",
+                # 段階別レイテンシ（Server-Timing + EMF）。ヒストグラムへの記録は1割のリクエストのみ
+                # コンテナが凍結・破棄される前に書き出せるよう、EMFは短い間隔で出力する
+                "TIMING_ENABLED": "true",
+                "TIMING_SAMPLE_RATE": "0.1",
+                "TIMING_EMF_FLUSH_SECONDS": "10",
+                # スナップショットが無い場合はDBのみで動作する
+                "SNAPSHOT_PATH": "/opt/snapshot/jan_url_mapping.snap" if snapshot_layer_dir else "",
+                # 登録済みJANコードのブルームフィルタ（同じレイヤーの jan_codes.bloom、無い場合は参照しない）
+                "BLOOM_FILTER_PATH": "/opt/snapshot/jan_codes.bloom" if snapshot_layer_dir else "",
             },
+            layers=layers,
+            params_and_secrets=params_and_secrets,
             vpc=vpc,
             vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS),
             security_groups=[lambda_sg] if lambda_sg else None,
@@ -143,6 +255,23 @@ class ApiStack(Stack):
             export_name=f"BronzedrawApiUrl-{env_name}",
         )
 
+        CfnOutput(
+            self,
+            "WriteApiKeySecretArn",
+            value=self.write_api_key_secret.secret_arn,
+            description="Secret ARN of the write API key",
+            export_name=f"BronzedrawWriteApiKeySecretArn-{env_name}",
+        )
+
+        if self.shared_cache:
+            CfnOutput(
+                self,
+                "SharedCacheEndpoint",
+                value=self.shared_cache.endpoint,
+                description="Shared lookup cache (ElastiCache Serverless) endpoint",
+                export_name=f"BronzedrawSharedCacheEndpoint-{env_name}",
+            )
+
         CfnOutput(
             self,
             "LambdaFunctionArn",
@@ -5,6 +5,7 @@ from aws_cdk import (
     SecretValue,
     CfnOutput,
     aws_ec2 as ec2,
+    aws_iam as iam,
     aws_rds as rds,
     aws_secretsmanager as secretsmanager,
     Tags,
@@ -24,6 +25,8 @@ class DatabaseStack(Stack):
         env_name: str = "dev",
         vpc: ec2.Vpc = None,
         aurora_sg: ec2.SecurityGroup = None,
+        enable_proxy: bool = False,
+        reader_count: int = 0,
         **kwargs,
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
@@ -59,6 +62,17 @@ class DatabaseStack(Stack):
                 enable_performance_insights=True,
                 performance_insight_retention=rds.PerformanceInsightRetention.DEFAULT,  # 7日間
             ),
+            # リーダー（任意）: ルックアップ・エクスポートの読み取りを一括書き込みと別のインスタンスで処理する
+            # 1台目はライターと同じ容量にスケールさせ、フェイルオーバー時にそのまま昇格できるようにする
+            readers=[
+                rds.ClusterInstance.serverless_v2(
+                    f"Reader{i + 1}-{env_name}",
+                    scale_with_writer=(i == 0),
+                    enable_performance_insights=True,
+                    performance_insight_retention=rds.PerformanceInsightRetention.DEFAULT,
+                )
+                for i in range(reader_count)
+            ],
             serverless_v2_min_capacity=0.5,  # 最小ACU
             serverless_v2_max_capacity=1.0,  # 最大ACU
             vpc=vpc,
@@ -75,6 +89,67 @@ class DatabaseStack(Stack):
             enable_data_api=True,  # RDS Query Editor用にData APIを有効化
         )
 
+        # RDS Proxy（任意）: Lambdaの同時実行数が増えてもDB側の接続数を抑えるため、接続を多重化する
+        # L2の add_proxy はNetworkStackのセキュリティグループへスタック間で循環参照するルールを追加するため、L1で構築する
+        self.db_proxy = None
+        if enable_proxy:
+            proxy_role = iam.Role(
+                self,
+                f"AuroraProxyRole-{env_name}",
+                assumed_by=iam.ServicePrincipal("rds.amazonaws.com"),
+            )
+            self.db_secret.grant_read(proxy_role)
+
+            self.db_proxy = rds.CfnDBProxy(
+                self,
+                f"AuroraProxy-{env_name}",
+                db_proxy_name=f"bronzedraw-aurora-proxy-{env_name}",
+                engine_family="POSTGRESQL",
+                auth=[
+                    rds.CfnDBProxy.AuthFormatProperty(
+                        auth_scheme="SECRETS",
+                        iam_auth="DISABLED",
+                        secret_arn=self.db_secret.secret_arn,
+                    )
+                ],
+                role_arn=proxy_role.role_arn,
+                vpc_subnet_ids=vpc.select_subnets(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS).subnet_ids,
+                vpc_security_group_ids=[aurora_sg.security_group_id] if aurora_sg else None,
+                require_tls=True,
+                idle_client_timeout=1800,  # 30分
+            )
+
+            proxy_target_group = rds.CfnDBProxyTargetGroup(
+                self,
+                f"AuroraProxyTargetGroup-{env_name}",
+                db_proxy_name=self.db_proxy.ref,
+                target_group_name="default",
+                db_cluster_identifiers=[self.db_cluster.cluster_identifier],
+                connection_pool_configuration_info=rds.CfnDBProxyTargetGroup.ConnectionPoolConfigurationInfoFormatProperty(
+                    max_connections_percent=90,  # max_connections の一部を管理用に残す
+                    connection_borrow_timeout=30,
+                ),
+            )
+            proxy_target_group.node.add_dependency(self.db_cluster)
+
+        # 読み取り用エンドポイント（リーダーがある場合のみ。Proxyがある場合はProxyの読み取り専用エンドポイント）
+        self.db_reader_endpoint = None
+        if reader_count > 0:
+            if self.db_proxy:
+                proxy_reader_endpoint = rds.CfnDBProxyEndpoint(
+                    self,
+                    f"AuroraProxyReaderEndpoint-{env_name}",
+                    db_proxy_name=self.db_proxy.ref,
+                    db_proxy_endpoint_name=f"bronzedraw-aurora-proxy-ro-{env_name}",
+                    target_role="READ_ONLY",
+                    vpc_subnet_ids=vpc.select_subnets(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS).subnet_ids,
+                    vpc_security_group_ids=[aurora_sg.security_group_id] if aurora_sg else None,
+                )
+                proxy_reader_endpoint.node.add_dependency(proxy_target_group)
+                self.db_reader_endpoint = proxy_reader_endpoint.attr_endpoint
+            else:
+                self.db_reader_endpoint = self.db_cluster.cluster_read_endpoint.hostname
+
         # タグ追加
         Tags.of(self).add("Env", env_name)
         Tags.of(self).add("Project", "bronzedraw")
@@ -104,6 +179,24 @@ class DatabaseStack(Stack):
             export_name=f"BronzedrawDBSecretArn-{env_name}",
         )
 
+        if self.db_proxy:
+            CfnOutput(
+                self,
+                "DBProxyEndpoint",
+                value=self.db_proxy.attr_endpoint,
+                description="RDS Proxy Endpoint",
+                export_name=f"BronzedrawDBProxyEndpoint-{env_name}",
+            )
+
+        if self.db_reader_endpoint:
+            CfnOutput(
+                self,
+                "DBReaderEndpoint",
+                value=self.db_reader_endpoint,
+                description="Aurora Reader Endpoint",
+                export_name=f"BronzedrawDBReaderEndpoint-{env_name}",
+            )
+
         CfnOutput(
             self,
             "DBName",
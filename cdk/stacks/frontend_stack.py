@@ -7,6 +7,7 @@ from aws_cdk import (
     aws_cloudfront as cloudfront,
     aws_cloudfront_origins as origins,
     aws_s3_deployment as s3deploy,
+    aws_apigateway as apigw,
     aws_iam as iam,
     Tags,
     CustomResource,
@@ -21,11 +22,20 @@ class FrontendStack(Stack):
     S3バケット + CloudFront でフロントエンドをホスティングするスタック
     """
 
-    def __init__(self, scope: Construct, construct_id: str, env_name: str = "dev", api_url: str = None, **kwargs) -> None:
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        env_name: str = "dev",
+        api_url: str = None,
+        api: apigw.RestApi = None,
+        **kwargs,
+    ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         self.env_name = env_name
-        self.api_url = api_url
+        # APIをCloudFront経由で配信する場合、フロントエンドは同一オリジンの /api/* を呼び出す
+        self.api_url = "" if api else api_url
 
         # S3バケット作成（React アプリケーション用）
         self.frontend_bucket = s3.Bucket(
@@ -45,6 +55,120 @@ class FrontendStack(Stack):
             f"FrontendOAC-{env_name}",
         )
 
+        # APIをCloudFront経由で配信する場合のビヘイビア
+        additional_behaviors = {}
+        spa_function_associations = None
+        error_responses = [
+            # SPA対応: 404エラーを /index.html にリダイレクト
+            cloudfront.ErrorResponse(
+                http_status=404,
+                response_http_status=200,
+                response_page_path="/index.html",
+                ttl=Duration.minutes(5),
+            ),
+            cloudfront.ErrorResponse(
+                http_status=403,
+                response_http_status=200,
+                response_page_path="/index.html",
+                ttl=Duration.minutes(5),
+            ),
+        ]
+        if api:
+            api_origin = origins.RestApiOrigin(api)
+
+            # /api/convert: jan クエリ文字列のみをキャッシュキーにする（TTLはオリジンのCache-Controlに従う）
+            self.convert_cache_policy = cloudfront.CachePolicy(
+                self,
+                f"ApiConvertCachePolicy-{env_name}",
+                cache_policy_name=f"bronzedraw-api-convert-{env_name}",
+                comment="Cache /api/convert responses keyed on the jan query string",
+                query_string_behavior=cloudfront.CacheQueryStringBehavior.allow_list("jan"),
+                header_behavior=cloudfront.CacheHeaderBehavior.none(),
+                cookie_behavior=cloudfront.CacheCookieBehavior.none(),
+                default_ttl=Duration.seconds(0),
+                min_ttl=Duration.seconds(0),
+                max_ttl=Duration.days(1),
+                enable_accept_encoding_gzip=True,
+                enable_accept_encoding_brotli=True,
+            )
+
+            # オリジンへは jan 以外のクエリ文字列・ヘッダ・Cookieを転送しない
+            self.convert_origin_request_policy = cloudfront.OriginRequestPolicy(
+                self,
+                f"ApiConvertOriginRequestPolicy-{env_name}",
+                origin_request_policy_name=f"bronzedraw-api-convert-{env_name}",
+                comment="Forward only the jan query string to API Gateway",
+                query_string_behavior=cloudfront.OriginRequestQueryStringBehavior.allow_list("jan"),
+                header_behavior=cloudfront.OriginRequestHeaderBehavior.none(),
+                cookie_behavior=cloudfront.OriginRequestCookieBehavior.none(),
+            )
+
+            additional_behaviors["/api/convert"] = cloudfront.BehaviorOptions(
+                origin=api_origin,
+                viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+                allowed_methods=cloudfront.AllowedMethods.ALLOW_GET_HEAD_OPTIONS,
+                cached_methods=cloudfront.CachedMethods.CACHE_GET_HEAD_OPTIONS,
+                cache_policy=self.convert_cache_policy,
+                origin_request_policy=self.convert_origin_request_policy,
+                compress=True,
+            )
+
+            # /r/{jan}: 302リダイレクトをパスのみをキーにキャッシュする（クエリ文字列・ヘッダ・Cookieは転送しない）
+            self.redirect_cache_policy = cloudfront.CachePolicy(
+                self,
+                f"RedirectCachePolicy-{env_name}",
+                cache_policy_name=f"bronzedraw-redirect-{env_name}",
+                comment="Cache /r/{jan} redirects keyed on the path only",
+                query_string_behavior=cloudfront.CacheQueryStringBehavior.none(),
+                header_behavior=cloudfront.CacheHeaderBehavior.none(),
+                cookie_behavior=cloudfront.CacheCookieBehavior.none(),
+                default_ttl=Duration.seconds(0),
+                min_ttl=Duration.seconds(0),
+                max_ttl=Duration.days(1),
+            )
+
+            additional_behaviors["/r/*"] = cloudfront.BehaviorOptions(
+                origin=api_origin,
+                viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+                allowed_methods=cloudfront.AllowedMethods.ALLOW_GET_HEAD,
+                cached_methods=cloudfront.CachedMethods.CACHE_GET_HEAD,
+                cache_policy=self.redirect_cache_policy,
+            )
+
+            # その他の /api/*（バッチ・エクスポートなど）はキャッシュせずにそのまま転送
+            additional_behaviors["/api/*"] = cloudfront.BehaviorOptions(
+                origin=api_origin,
+                viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+                allowed_methods=cloudfront.AllowedMethods.ALLOW_ALL,
+                cache_policy=cloudfront.CachePolicy.CACHING_DISABLED,
+                origin_request_policy=cloudfront.OriginRequestPolicy.ALL_VIEWER_EXCEPT_HOST_HEADER,
+                compress=True,
+            )
+
+            # カスタムエラーレスポンスはディストリビューション全体に効き、APIの404まで /index.html に
+            # 置き換えてしまうため、SPAのフォールバックはデフォルトビヘイビアのCloudFront Functionで行う
+            spa_rewrite = cloudfront.Function(
+                self,
+                f"SpaRewriteFunction-{env_name}",
+                comment="Rewrite extensionless paths to /index.html for the SPA",
+                code=cloudfront.FunctionCode.from_inline(
+                    "function handler(event) {\n"
+                    "  var request = event.request;\n"
+                    "  if (request.uri.indexOf('.') === -1) {\n"
+                    "    request.uri = '/index.html';\n"
+                    "  }\n"
+                    "  return request;\n"
+                    "}\n"
+                ),
+            )
+            spa_function_associations = [
+                cloudfront.FunctionAssociation(
+                    function=spa_rewrite,
+                    event_type=cloudfront.FunctionEventType.VIEWER_REQUEST,
+                )
+            ]
+            error_responses = None
+
         # CloudFront Distribution
         self.distribution = cloudfront.Distribution(
             self,
@@ -59,23 +183,11 @@ class FrontendStack(Stack):
                 cached_methods=cloudfront.CachedMethods.CACHE_GET_HEAD_OPTIONS,
                 cache_policy=cloudfront.CachePolicy.CACHING_OPTIMIZED,
                 compress=True,  # Gzip/Brotli圧縮
+                function_associations=spa_function_associations,
             ),
+            additional_behaviors=additional_behaviors,
             default_root_object="index.html",
-            error_responses=[
-                # SPA対応: 404エラーを /index.html にリダイレクト
-                cloudfront.ErrorResponse(
-                    http_status=404,
-                    response_http_status=200,
-                    response_page_path="/index.html",
-                    ttl=Duration.minutes(5),
-                ),
-                cloudfront.ErrorResponse(
-                    http_status=403,
-                    response_http_status=200,
-                    response_page_path="/index.html",
-                    ttl=Duration.minutes(5),
-                ),
-            ],
+            error_responses=error_responses,
             price_class=cloudfront.PriceClass.PRICE_CLASS_200,  # 日本・アジア・北米・欧州
             comment=f"Bronzedraw Frontend Distribution - {env_name}",
         )
@@ -95,7 +207,7 @@ class FrontendStack(Stack):
         )
 
         # config.json を S3 にアップロード
-        if self.api_url:
+        if self.api_url is not None:
             config_content = json.dumps({"apiUrl": self.api_url})
 
             # AwsCustomResourceを使用してconfig.jsonをS3にアップロード
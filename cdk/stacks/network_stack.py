@@ -68,6 +68,13 @@ class NetworkStack(Stack):
             description="Allow Lambda to access Aurora PostgreSQL",
         )
 
+        # RDS Proxy（Aurora SGを共用）からAuroraへの5432ポート許可
+        self.aurora_sg.add_ingress_rule(
+            peer=self.aurora_sg,
+            connection=ec2.Port.tcp(5432),
+            description="Allow RDS Proxy to access Aurora PostgreSQL",
+        )
+
         # 全リソースにEnvタグを追加
         Tags.of(self).add("Env", env_name)
         Tags.of(self).add("Project", "bronzedraw")
@@ -0,0 +1,61 @@
+from aws_cdk import (
+    aws_ec2 as ec2,
+    aws_elasticache as elasticache,
+)
+from constructs import Construct
+
+
+class SharedCache(Construct):
+    """
+    Lambdaのコンテナ間で共有するルックアップキャッシュ（ElastiCache Serverless for Valkey）
+
+    ApiStack の enable_shared_cache=True で作成し、接続先を L2_CACHE_URL としてLambdaへ渡す。
+    Serverless のキャッシュはTLS必須のため rediss:// で接続する。
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        env_name: str = "dev",
+        vpc: ec2.Vpc = None,
+        lambda_sg: ec2.SecurityGroup = None,
+        max_data_storage_gb: int = 1,
+        max_ecpu_per_second: int = 5000,
+    ) -> None:
+        super().__init__(scope, construct_id)
+
+        # キャッシュ用セキュリティグループ（Lambdaからの6379ポートのみ許可）
+        self.security_group = ec2.SecurityGroup(
+            self,
+            f"SharedCacheSg-{env_name}",
+            vpc=vpc,
+            security_group_name=f"bronzedraw-shared-cache-sg-{env_name}",
+            description="Security group for the shared lookup cache",
+            allow_all_outbound=False,
+        )
+        if lambda_sg:
+            self.security_group.add_ingress_rule(
+                peer=lambda_sg,
+                connection=ec2.Port.tcp(6379),
+                description="Allow Lambda to access the shared lookup cache",
+            )
+
+        # 値は1件あたり百数十バイトのため、1000万件でも数GBに収まる（上限を超えると古いエントリから追い出される）
+        self.cache = elasticache.CfnServerlessCache(
+            self,
+            f"SharedCache-{env_name}",
+            serverless_cache_name=f"bronzedraw-lookup-cache-{env_name}",
+            engine="valkey",
+            major_engine_version="8",
+            description="Shared JAN lookup cache (L2)",
+            subnet_ids=vpc.select_subnets(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS).subnet_ids,
+            security_group_ids=[self.security_group.security_group_id],
+            cache_usage_limits=elasticache.CfnServerlessCache.CacheUsageLimitsProperty(
+                data_storage=elasticache.CfnServerlessCache.DataStorageProperty(unit="GB", maximum=max_data_storage_gb),
+                ecpu_per_second=elasticache.CfnServerlessCache.ECPUPerSecondProperty(maximum=max_ecpu_per_second),
+            ),
+        )
+
+        self.endpoint = self.cache.attr_endpoint_address
+        self.url = f"rediss://{self.cache.attr_endpoint_address}:{self.cache.attr_endpoint_port}/0"
@@ -1,3 +1,5 @@
+import os
+import pytest
 import aws_cdk as cdk
 from aws_cdk.assertions import Template, Match
 from stacks.network_stack import NetworkStack
@@ -92,7 +94,48 @@ def test_lambda_environment_variables():
         "Environment": {
             "Variables": {
                 "ENV": "test",
-                "DB_NAME": "bronzedraw"
+                "DB_NAME": "bronzedraw",
+                "DB_POOL_STRATEGY": "single",
+                "LOOKUP_CACHE_ENABLED": "true",
+                "LOOKUP_CACHE_MAX_ENTRIES": "10000",
+                "LOOKUP_STATS_ENABLED": "true",
+                "LOOKUP_WARMUP_ENTRIES": "2000",
+                "TIMING_ENABLED": "true",
+                "TIMING_SAMPLE_RATE": "0.1"
+            }
+        }
+    })
+
+
+def test_secrets_extension_configured():
+    """Parameters and Secrets Extensionが設定されることを確認"""
+    app = cdk.App()
+    network_stack = NetworkStack(app, "TestNetworkStack", env_name="test")
+    db_stack = DatabaseStack(
+        app,
+        "TestDatabaseStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        aurora_sg=network_stack.aurora_sg
+    )
+    api_stack = ApiStack(
+        app,
+        "TestApiStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        lambda_sg=network_stack.lambda_sg,
+        db_cluster=db_stack.db_cluster,
+        db_secret=db_stack.db_secret
+    )
+    template = Template.from_stack(api_stack)
+
+    # Extensionレイヤーとローカルエンドポイントが設定されていることを確認
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Layers": Match.any_value(),
+        "Environment": {
+            "Variables": {
+                "SECRETS_EXTENSION_ENDPOINT": "http://localhost:2773",
+                "PARAMETERS_SECRETS_EXTENSION_HTTP_PORT": "2773"
             }
         }
     })
@@ -178,3 +221,284 @@ def test_outputs_exported():
     template.has_output("ApiUrl", {})
     template.has_output("LambdaFunctionArn", {})
     template.has_output("LambdaFunctionName", {})
+
+
+def test_snapshot_layer_optional(tmp_path):
+    """スナップショットのディレクトリを指定した場合のみレイヤーが追加されることを確認"""
+    snapshot_dir = tmp_path / "layer" / "snapshot"
+    os.makedirs(snapshot_dir)
+    (snapshot_dir / "jan_url_mapping.snap").write_bytes(b"BZSNAP")
+
+    app = cdk.App()
+    network_stack = NetworkStack(app, "TestNetworkStack", env_name="test")
+    db_stack = DatabaseStack(
+        app,
+        "TestDatabaseStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        aurora_sg=network_stack.aurora_sg
+    )
+    api_stack = ApiStack(
+        app,
+        "TestApiStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        lambda_sg=network_stack.lambda_sg,
+        db_cluster=db_stack.db_cluster,
+        db_secret=db_stack.db_secret,
+        snapshot_layer_dir=str(tmp_path / "layer")
+    )
+    template = Template.from_stack(api_stack)
+
+    template.resource_count_is("AWS::Lambda::LayerVersion", 1)
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Layers": Match.array_with([{"Ref": Match.string_like_regexp("SnapshotLayer")}]),
+        "Environment": {
+            "Variables": Match.object_like({
+                "SNAPSHOT_PATH": "/opt/snapshot/jan_url_mapping.snap",
+                "BLOOM_FILTER_PATH": "/opt/snapshot/jan_codes.bloom"
+            })
+        }
+    })
+
+    # 指定しない場合はレイヤーを作成しない
+    app = cdk.App()
+    network_stack = NetworkStack(app, "TestNetworkStack", env_name="test")
+    api_stack = ApiStack(
+        app,
+        "TestApiStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        lambda_sg=network_stack.lambda_sg
+    )
+    template = Template.from_stack(api_stack)
+    template.resource_count_is("AWS::Lambda::LayerVersion", 0)
+
+
+def test_reader_endpoint_passed_to_lambda():
+    """リーダーがある場合に読み取りエンドポイントがLambdaへ渡されることを確認"""
+    app = cdk.App()
+    network_stack = NetworkStack(app, "TestNetworkStack", env_name="test")
+    db_stack = DatabaseStack(
+        app,
+        "TestDatabaseStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        aurora_sg=network_stack.aurora_sg,
+        reader_count=1
+    )
+    api_stack = ApiStack(
+        app,
+        "TestApiStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        lambda_sg=network_stack.lambda_sg,
+        db_cluster=db_stack.db_cluster,
+        db_secret=db_stack.db_secret,
+        db_reader_endpoint=db_stack.db_reader_endpoint
+    )
+    template = Template.from_stack(api_stack)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {
+            "Variables": Match.object_like({
+                "DB_READER_ENDPOINT": {"Fn::ImportValue": Match.string_like_regexp("ReadEndpoint")},
+                "DB_READ_YOUR_WRITES_SECONDS": "5"
+            })
+        }
+    })
+
+
+def test_write_api_key_secret():
+    """書き込みAPIのキーがシークレットとして作成され、Lambdaへ渡されることを確認"""
+    app = cdk.App()
+    network_stack = NetworkStack(app, "TestNetworkStack", env_name="test")
+    api_stack = ApiStack(
+        app,
+        "TestApiStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        lambda_sg=network_stack.lambda_sg
+    )
+    template = Template.from_stack(api_stack)
+
+    template.has_resource_properties("AWS::SecretsManager::Secret", {
+        "Name": "bronzedraw-write-api-key-test",
+        "GenerateSecretString": Match.object_like({"GenerateStringKey": "api_key"})
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {
+            "Variables": Match.object_like({
+                "WRITE_API_KEY_SECRET_ARN": {"Ref": Match.string_like_regexp("WriteApiKeySecret")}
+            })
+        }
+    })
+    template.has_output("WriteApiKeySecretArn", {})
+
+
+def test_db_resilience_settings():
+    """DBの接続・クエリのタイムアウト、サーキットブレーカー、失効後のキャッシュの利用が設定されることを確認"""
+    app = cdk.App()
+    network_stack = NetworkStack(app, "TestNetworkStack", env_name="test")
+    api_stack = ApiStack(
+        app,
+        "TestApiStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        lambda_sg=network_stack.lambda_sg
+    )
+    template = Template.from_stack(api_stack)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {
+            "Variables": Match.object_like({
+                "DB_CONNECT_TIMEOUT_SECONDS": "3",
+                "DB_STATEMENT_TIMEOUT_MS": "5000",
+                "DB_CIRCUIT_BREAKER_ENABLED": "true",
+                "LOOKUP_CACHE_STALE_TTL_SECONDS": "3600"
+            })
+        }
+    })
+
+
+def test_statement_timeout_disabled_with_rds_proxy():
+    """RDS Proxy 経由の場合は DB_STATEMENT_TIMEOUT_MS を0（無制限）にし、接続先をProxyにすることを確認"""
+    app = cdk.App()
+    network_stack = NetworkStack(app, "TestNetworkStack", env_name="test")
+    db_stack = DatabaseStack(
+        app,
+        "TestDatabaseStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        aurora_sg=network_stack.aurora_sg,
+        enable_proxy=True
+    )
+    api_stack = ApiStack(
+        app,
+        "TestApiStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        lambda_sg=network_stack.lambda_sg,
+        db_cluster=db_stack.db_cluster,
+        db_secret=db_stack.db_secret,
+        db_proxy=db_stack.db_proxy
+    )
+    template = Template.from_stack(api_stack)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {
+            "Variables": Match.object_like({
+                "DB_CLUSTER_ENDPOINT": {"Fn::ImportValue": Match.string_like_regexp("Proxy")},
+                "DB_CONNECT_TIMEOUT_SECONDS": "3",
+                "DB_STATEMENT_TIMEOUT_MS": "0"
+            })
+        }
+    })
+
+
+def test_shared_cache_optional():
+    """enable_shared_cache の場合のみ共有キャッシュ（ElastiCache Serverless）を作成し、Lambdaへ接続先を渡すことを確認"""
+    app = cdk.App()
+    network_stack = NetworkStack(app, "TestNetworkStack", env_name="test")
+    api_stack = ApiStack(
+        app,
+        "TestApiStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        lambda_sg=network_stack.lambda_sg,
+        enable_shared_cache=True
+    )
+    template = Template.from_stack(api_stack)
+
+    template.resource_count_is("AWS::ElastiCache::ServerlessCache", 1)
+    template.has_resource_properties("AWS::ElastiCache::ServerlessCache", {
+        "Engine": "valkey",
+        "ServerlessCacheName": "bronzedraw-lookup-cache-test"
+    })
+    # Lambdaからの6379ポートのみ許可
+    template.has_resource_properties("AWS::EC2::SecurityGroupIngress", {
+        "FromPort": 6379,
+        "ToPort": 6379,
+        "SourceSecurityGroupId": {"Fn::ImportValue": Match.string_like_regexp("LambdaSg")}
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {
+            "Variables": Match.object_like({
+                "L2_CACHE_URL": {"Fn::Join": ["", Match.array_with(["rediss://"])]},
+                "L2_CACHE_TTL_SECONDS": "300",
+                "L2_CACHE_TOMBSTONE_SECONDS": "30"
+            })
+        }
+    })
+    template.has_output("SharedCacheEndpoint", {})
+
+    # 指定しない場合は作成せず、L2は無効
+    app = cdk.App()
+    network_stack = NetworkStack(app, "TestNetworkStack", env_name="test")
+    api_stack = ApiStack(
+        app,
+        "TestApiStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        lambda_sg=network_stack.lambda_sg
+    )
+    template = Template.from_stack(api_stack)
+    template.resource_count_is("AWS::ElastiCache::ServerlessCache", 0)
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {"Variables": Match.object_like({"L2_CACHE_URL": ""})}
+    })
+
+
+def test_redirect_fallback_url_must_be_absolute():
+    """/r/{jan} のリダイレクト先は絶対URLのみ（相対URLはAPI Gatewayを直接呼んだ場合にAPI Gatewayのホストで解決される）"""
+    app = cdk.App()
+    network_stack = NetworkStack(app, "TestNetworkStack", env_name="test")
+    api_stack = ApiStack(
+        app,
+        "TestApiStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        lambda_sg=network_stack.lambda_sg,
+        redirect_fallback_url="https://app.example.com/?jan={jan}"
+    )
+    template = Template.from_stack(api_stack)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {
+            "Variables": Match.object_like({
+                "REDIRECT_FALLBACK_URL": "https://app.example.com/?jan={jan}"
+            })
+        }
+    })
+
+    with pytest.raises(ValueError):
+        ApiStack(
+            app,
+            "TestRelativeRedirectApiStack",
+            env_name="test",
+            vpc=network_stack.vpc,
+            lambda_sg=network_stack.lambda_sg,
+            redirect_fallback_url="/?jan={jan}"
+        )
+
+
+def test_redirect_fallback_url_unset_by_default():
+    """リダイレクト先を指定しない場合は空（未登録・不正なJANコードは404/422）"""
+    app = cdk.App()
+    network_stack = NetworkStack(app, "TestNetworkStack", env_name="test")
+    api_stack = ApiStack(
+        app,
+        "TestApiStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        lambda_sg=network_stack.lambda_sg
+    )
+    template = Template.from_stack(api_stack)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {
+            "Variables": Match.object_like({
+                "REDIRECT_FALLBACK_URL": ""
+            })
+        }
+    })
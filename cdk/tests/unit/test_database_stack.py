@@ -151,6 +151,101 @@ def test_deletion_protection():
     })
 
 
+def test_rds_proxy_optional():
+    """RDS Proxyがオプションで作成されることを確認"""
+    # デフォルトではProxyを作成しない
+    app = cdk.App()
+    network_stack = NetworkStack(app, "TestNetworkStack", env_name="test")
+    db_stack = DatabaseStack(
+        app,
+        "TestDatabaseStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        aurora_sg=network_stack.aurora_sg
+    )
+    template = Template.from_stack(db_stack)
+    template.resource_count_is("AWS::RDS::DBProxy", 0)
+
+    # enable_proxy=True でProxyとターゲットグループを作成
+    app_proxy = cdk.App()
+    network_stack_proxy = NetworkStack(app_proxy, "TestNetworkStackProxy", env_name="test")
+    db_stack_proxy = DatabaseStack(
+        app_proxy,
+        "TestDatabaseStackProxy",
+        env_name="test",
+        vpc=network_stack_proxy.vpc,
+        aurora_sg=network_stack_proxy.aurora_sg,
+        enable_proxy=True
+    )
+    template_proxy = Template.from_stack(db_stack_proxy)
+    template_proxy.resource_count_is("AWS::RDS::DBProxy", 1)
+    template_proxy.has_resource_properties("AWS::RDS::DBProxy", {
+        "EngineFamily": "POSTGRESQL",
+        "RequireTLS": True
+    })
+    template_proxy.has_resource_properties("AWS::RDS::DBProxyTargetGroup", {
+        "TargetGroupName": "default",
+        "ConnectionPoolConfigurationInfo": {
+            "MaxConnectionsPercent": 90
+        }
+    })
+    template_proxy.has_output("DBProxyEndpoint", {})
+
+
+def test_reader_instances_optional():
+    """リーダーインスタンスがオプションで作成されることを確認"""
+    # デフォルトではライターのみ
+    app = cdk.App()
+    network_stack = NetworkStack(app, "TestNetworkStack", env_name="test")
+    db_stack = DatabaseStack(
+        app,
+        "TestDatabaseStack",
+        env_name="test",
+        vpc=network_stack.vpc,
+        aurora_sg=network_stack.aurora_sg
+    )
+    template = Template.from_stack(db_stack)
+    template.resource_count_is("AWS::RDS::DBInstance", 1)
+    assert db_stack.db_reader_endpoint is None
+
+    # reader_count=2 でリーダーを2台作成し、読み取りエンドポイントを出力
+    app_readers = cdk.App()
+    network_stack_readers = NetworkStack(app_readers, "TestNetworkStackReaders", env_name="test")
+    db_stack_readers = DatabaseStack(
+        app_readers,
+        "TestDatabaseStackReaders",
+        env_name="test",
+        vpc=network_stack_readers.vpc,
+        aurora_sg=network_stack_readers.aurora_sg,
+        reader_count=2
+    )
+    template_readers = Template.from_stack(db_stack_readers)
+    template_readers.resource_count_is("AWS::RDS::DBInstance", 3)
+    # 1台目のリーダーはライターと同じ昇格優先度（ライターの容量に合わせてスケール）
+    template_readers.has_resource_properties("AWS::RDS::DBInstance", {
+        "DBInstanceClass": "db.serverless",
+        "PromotionTier": 1
+    })
+    template_readers.has_output("DBReaderEndpoint", {})
+
+    # Proxyがある場合はProxyの読み取り専用エンドポイントを使う
+    app_proxy = cdk.App()
+    network_stack_proxy = NetworkStack(app_proxy, "TestNetworkStackProxyReaders", env_name="test")
+    db_stack_proxy = DatabaseStack(
+        app_proxy,
+        "TestDatabaseStackProxyReaders",
+        env_name="test",
+        vpc=network_stack_proxy.vpc,
+        aurora_sg=network_stack_proxy.aurora_sg,
+        enable_proxy=True,
+        reader_count=1
+    )
+    template_proxy = Template.from_stack(db_stack_proxy)
+    template_proxy.has_resource_properties("AWS::RDS::DBProxyEndpoint", {
+        "TargetRole": "READ_ONLY"
+    })
+
+
 def test_outputs_exported():
     """アウトプットが正しくエクスポートされることを確認"""
     app = cdk.App()
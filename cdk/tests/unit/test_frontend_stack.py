@@ -1,8 +1,17 @@
 import aws_cdk as cdk
+from aws_cdk import aws_apigateway as apigw
 from aws_cdk.assertions import Template, Match
 from stacks.frontend_stack import FrontendStack
 
 
+def _create_rest_api(app):
+    """CloudFrontのオリジンとして使うテスト用のREST APIを作成する"""
+    api_stack = cdk.Stack(app, "TestRestApiStack")
+    api = apigw.RestApi(api_stack, "TestRestApi", deploy_options=apigw.StageOptions(stage_name="test"))
+    api.root.add_proxy(default_integration=apigw.MockIntegration())
+    return api
+
+
 def test_s3_bucket_created():
     """S3バケットが作成されることを確認"""
     app = cdk.App()
@@ -158,3 +167,150 @@ def test_outputs_exported():
     template.has_output("CloudFrontUrl", {})
     template.has_output("CloudFrontDistributionId", {})
     template.has_output("FrontendBucketName", {})
+
+
+def test_api_behaviors_routed_through_cloudfront():
+    """/api/* がAPI Gatewayをオリジンとするビヘイビアとして追加されることを確認"""
+    app = cdk.App()
+    api = _create_rest_api(app)
+    frontend_stack = FrontendStack(
+        app,
+        "TestFrontendStack",
+        env_name="test",
+        api_url=api.url,
+        api=api
+    )
+    template = Template.from_stack(frontend_stack)
+
+    # /api/convert（キャッシュあり）と /api/*（キャッシュなし）のビヘイビアを確認
+    template.has_resource_properties("AWS::CloudFront::Distribution", {
+        "DistributionConfig": {
+            "CacheBehaviors": Match.array_with([
+                Match.object_like({
+                    "PathPattern": "/api/convert",
+                    "AllowedMethods": ["GET", "HEAD", "OPTIONS"],
+                    "ViewerProtocolPolicy": "redirect-to-https"
+                }),
+                Match.object_like({
+                    "PathPattern": "/api/*",
+                    # Managed-CachingDisabled
+                    "CachePolicyId": "4135ea2d-6df8-44a3-9df3-4b5a84be39ad"
+                })
+            ]),
+            "Origins": Match.array_with([
+                Match.object_like({
+                    "CustomOriginConfig": Match.object_like({
+                        "OriginProtocolPolicy": "https-only"
+                    })
+                })
+            ])
+        }
+    })
+
+
+def test_api_convert_cache_policy_keyed_on_jan():
+    """/api/convert のキャッシュキーが jan クエリ文字列のみであることを確認"""
+    app = cdk.App()
+    api = _create_rest_api(app)
+    frontend_stack = FrontendStack(
+        app,
+        "TestFrontendStack",
+        env_name="test",
+        api_url=api.url,
+        api=api
+    )
+    template = Template.from_stack(frontend_stack)
+
+    template.has_resource_properties("AWS::CloudFront::CachePolicy", {
+        "CachePolicyConfig": {
+            "DefaultTTL": 0,
+            "ParametersInCacheKeyAndForwardedToOrigin": {
+                "QueryStringsConfig": {
+                    "QueryStringBehavior": "whitelist",
+                    "QueryStrings": ["jan"]
+                },
+                "HeadersConfig": {"HeaderBehavior": "none"},
+                "CookiesConfig": {"CookieBehavior": "none"}
+            }
+        }
+    })
+
+    # オリジンへは jan 以外のクエリ文字列・ヘッダ・Cookieを転送しない
+    template.has_resource_properties("AWS::CloudFront::OriginRequestPolicy", {
+        "OriginRequestPolicyConfig": {
+            "QueryStringsConfig": {
+                "QueryStringBehavior": "whitelist",
+                "QueryStrings": ["jan"]
+            },
+            "HeadersConfig": {"HeaderBehavior": "none"},
+            "CookiesConfig": {"CookieBehavior": "none"}
+        }
+    })
+
+
+def test_spa_fallback_with_api_routed():
+    """API経由時はAPIの404を書き換えないよう、SPAのフォールバックをCloudFront Functionで行うことを確認"""
+    app = cdk.App()
+    api = _create_rest_api(app)
+    frontend_stack = FrontendStack(
+        app,
+        "TestFrontendStack",
+        env_name="test",
+        api_url=api.url,
+        api=api
+    )
+    template = Template.from_stack(frontend_stack)
+
+    template.resource_count_is("AWS::CloudFront::Function", 1)
+    template.has_resource_properties("AWS::CloudFront::Distribution", {
+        "DistributionConfig": {
+            "CustomErrorResponses": Match.absent(),
+            "DefaultCacheBehavior": Match.object_like({
+                "FunctionAssociations": [
+                    Match.object_like({"EventType": "viewer-request"})
+                ]
+            })
+        }
+    })
+
+    # フロントエンドは同一オリジンのAPIを呼び出す（config.json の apiUrl は空文字）
+    config_resources = template.find_resources("Custom::AWS")
+    create_parts = next(iter(config_resources.values()))["Properties"]["Create"]["Fn::Join"][1]
+    create_payload = "".join(part for part in create_parts if isinstance(part, str))
+    assert '\\"apiUrl\\": \\"\\"' in create_payload
+
+
+def test_redirect_cached_at_edge():
+    """/r/* がAPI Gatewayへ転送され、リダイレクトがパスのみをキーにキャッシュされることを確認"""
+    app = cdk.App()
+    api = _create_rest_api(app)
+    frontend_stack = FrontendStack(
+        app,
+        "TestFrontendStack",
+        env_name="test",
+        api_url=api.url,
+        api=api
+    )
+    template = Template.from_stack(frontend_stack)
+
+    template.has_resource_properties("AWS::CloudFront::Distribution", {
+        "DistributionConfig": {
+            "CacheBehaviors": Match.array_with([
+                Match.object_like({
+                    "PathPattern": "/r/*",
+                    "AllowedMethods": ["GET", "HEAD"],
+                    "CachePolicyId": {"Ref": Match.string_like_regexp("RedirectCachePolicy")}
+                })
+            ])
+        }
+    })
+    template.has_resource_properties("AWS::CloudFront::CachePolicy", {
+        "CachePolicyConfig": {
+            "Name": "bronzedraw-redirect-test",
+            "ParametersInCacheKeyAndForwardedToOrigin": Match.object_like({
+                "QueryStringsConfig": {"QueryStringBehavior": "none"},
+                "HeadersConfig": {"HeaderBehavior": "none"},
+                "CookiesConfig": {"CookieBehavior": "none"}
+            })
+        }
+    })
@@ -19,21 +19,8 @@ function App() {
   const [loading, setLoading] = useState(false)
   const [apiUrl, setApiUrl] = useState<string>('http://localhost:8000')
 
-  useEffect(() => {
-    // Load config.json on startup
-    fetch('/config.json')
-      .then(res => res.json())
-      .then((config: Config) => {
-        setApiUrl(config.apiUrl)
-      })
-      .catch(() => {
-        // Fallback to localhost if config.json not found
-        console.warn('config.json not found, using localhost')
-      })
-  }, [])
-
-  const handleSearch = async () => {
-    if (!janCode.trim()) {
+  const search = async (code: string, baseUrl: string) => {
+    if (!code.trim()) {
       setError('JANコードを入力してください')
       return
     }
@@ -43,7 +30,7 @@ function App() {
     setResult(null)
 
     try {
-      const response = await fetch(`${apiUrl}/api/convert?jan=${janCode}`)
+      const response = await fetch(`${baseUrl}/api/convert?jan=${encodeURIComponent(code.trim())}`)
 
       if (!response.ok) {
         const errorData = await response.json()
@@ -59,6 +46,33 @@ function App() {
     }
   }
 
+  useEffect(() => {
+    // Opened as the /r/{jan} fallback page (/?jan=...): look up the scanned code right away
+    const initialJan = new URLSearchParams(window.location.search).get('jan') ?? ''
+    if (initialJan) {
+      setJanCode(initialJan)
+    }
+
+    // Load config.json on startup
+    fetch('/config.json')
+      .then(res => res.json())
+      .then((config: Config) => {
+        setApiUrl(config.apiUrl)
+        if (initialJan) {
+          search(initialJan, config.apiUrl)
+        }
+      })
+      .catch(() => {
+        // Fallback to localhost if config.json not found
+        console.warn('config.json not found, using localhost')
+        if (initialJan) {
+          search(initialJan, 'http://localhost:8000')
+        }
+      })
+  }, [])
+
+  const handleSearch = () => search(janCode, apiUrl)
+
   const handleKeyDown = (e: React.KeyboardEvent) => {
     if (e.key === 'Enter') {
       handleSearch()